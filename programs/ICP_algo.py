@@ -1,4 +1,6 @@
 import numpy as np
+import telemetry
+import jit_kernels
 from utility_functions import *
 
 
@@ -72,6 +74,7 @@ Parameters: takes in the point, vertcies on mesh and triangles on mesh
 Returns: returns the closest point that's on mesh, what the distnce to that point is, and that triangles' index
 Summary: this functions finds what the closest point on the mesh to a given point
 '''
+@telemetry.timed("closest_point_on_mesh")
 def closest_point_on_mesh(point, vertices, triangles):
     
     min_distance = float('inf')
@@ -94,3 +97,367 @@ def closest_point_on_mesh(point, vertices, triangles):
     return close_pt, min_distance, closest_triangle_idx
 
 
+# rough number of bytes of float64 temporaries held per (query, triangle) pair
+# while a block is evaluated; used to turn the memory budget into a block size
+_BYTES_PER_PAIR = 256
+
+# queries per chunk when the brute force search runs on a thread pool, the same as TriangleBVH.thread_chunk_size
+_THREAD_CHUNK_SIZE = 512
+
+'''
+Created on December 19, 2025
+Author: Maya Sharma
+Summary: structure of arrays table of everything the closest point and barycentric kernels need per triangle.
+A is stored relative to origin (the mesh centroid unless another one is given) so the expanded dot products
+do not lose precision, AB and AC are the edges, then the dot products AB.AB, AB.AC, AC.AC, A.AB, A.AC, A.A,
+the inverse of the Gram determinant AB.AB * AC.AC - AB.AC^2 and a flag for triangles whose determinant is
+(close to) zero. The table is built once per mesh, a deformed mesh calls update() with the new vertices.
+Indexing a table with a slice or an index array gives the table of those rows. If pool is set to a thread pool
+the brute force search of closest_points_on_mesh runs its chunks of samples on it, like index.pool of the
+spatial indexes.
+'''
+class TriangleTable:
+
+    def __init__(self, vertices, triangles, origin=None):
+        self.triangles = np.asarray(triangles)
+        self.pool = None
+        if vertices is not None:
+            self.update(vertices, origin)
+
+    '''
+    Parameters: new vertex array (V x 3) for the same triangles, optional origin
+    Summary: recomputes every column of the table, the old values are no longer valid after a deformation
+    '''
+    def update(self, vertices, origin=None):
+        vertices = np.asarray(vertices, dtype=float)
+        self.origin = vertices.mean(axis=0) if origin is None else np.asarray(origin, dtype=float)
+
+        tri = self.triangles
+        self.A = vertices[tri[:, 0]] - self.origin
+        self.AB = vertices[tri[:, 1]] - vertices[tri[:, 0]]
+        self.AC = vertices[tri[:, 2]] - vertices[tri[:, 0]]
+
+        self.AB_AB = np.einsum('ij,ij->i', self.AB, self.AB)
+        self.AB_AC = np.einsum('ij,ij->i', self.AB, self.AC)
+        self.AC_AC = np.einsum('ij,ij->i', self.AC, self.AC)
+        self.A_AB = np.einsum('ij,ij->i', self.A, self.AB)
+        self.A_AC = np.einsum('ij,ij->i', self.A, self.AC)
+        self.A_A = np.einsum('ij,ij->i', self.A, self.A)
+
+        denom = self.AB_AB * self.AC_AC - self.AB_AC * self.AB_AC
+        self.degenerate = np.abs(denom) < 1e-12
+        with np.errstate(divide='ignore'):
+            self.inv_denom = 1.0 / denom
+
+    def __len__(self):
+        return len(self.A)
+
+    def __getitem__(self, rows):
+        sub = TriangleTable(None, self.triangles[rows])
+        sub.origin = self.origin
+        for name in _TABLE_COLUMNS:
+            setattr(sub, name, getattr(self, name)[rows])
+        return sub
+
+    '''
+    Parameters: points (N x 3, not shifted) and the index of a triangle of the table per point
+    Returns: barycentric coordinates (N x 3) of each point projected onto the plane of its triangle,
+             (1/3, 1/3, 1/3) for degenerate triangles like compute_barycentric
+    '''
+    def barycentric(self, points, tri_idx):
+        AP = np.atleast_2d(np.asarray(points, dtype=float)) - self.origin - self.A[tri_idx]
+        d20 = np.einsum('ij,ij->i', AP, self.AB[tri_idx])
+        d21 = np.einsum('ij,ij->i', AP, self.AC[tri_idx])
+        d00, d01, d11 = self.AB_AB[tri_idx], self.AB_AC[tri_idx], self.AC_AC[tri_idx]
+
+        degenerate = self.degenerate[tri_idx]
+        inv_denom = np.where(degenerate, 0.0, self.inv_denom[tri_idx])
+        v = np.where(degenerate, 1 / 3, (d11 * d20 - d01 * d21) * inv_denom)
+        w = np.where(degenerate, 1 / 3, (d00 * d21 - d01 * d20) * inv_denom)
+
+        return np.column_stack([1.0 - v - w, v, w])
+
+    '''
+    Parameters: winning triangle index and barycentric v, w per point
+    Returns: the points A + v AB + w AC in the original (not shifted) coordinates
+    '''
+    def points_at(self, tri_idx, v, w):
+        return (self.A[tri_idx] + v[:, None] * self.AB[tri_idx] + w[:, None] * self.AC[tri_idx]) + self.origin
+
+
+# columns of a TriangleTable that are indexed together
+_TABLE_COLUMNS = ('A', 'AB', 'AC', 'AB_AB', 'AB_AC', 'AC_AC', 'A_AB', 'A_AC', 'A_A', 'inv_denom', 'degenerate')
+
+'''
+Created on December 20, 2025
+Author: Maya Sharma
+Parameters: vertices (V x 3) and triangles (T x 3)
+Returns: unit face normals (T x 3), AB x AC normalised, zero for degenerate triangles
+'''
+def face_normals(vertices, triangles):
+    vertices = np.asarray(vertices, dtype=float)
+    triangles = np.asarray(triangles)
+    A = vertices[triangles[:, 0]]
+    normals = np.cross(vertices[triangles[:, 1]] - A, vertices[triangles[:, 2]] - A)
+    length = np.linalg.norm(normals, axis=1)
+    return normals / np.where(length > 0, length, 1.0)[:, None]
+
+'''
+Created on December 12, 2025
+Updated on December 19, 2025
+Author: Maya Sharma
+Parameters: the six dot products d1..d6 of closest_point_on_triangle, arrays of any (matching) shape, and the
+            inverse Gram determinant of the triangle from the TriangleTable
+Returns: barycentric coordinates v, w of the closest point, so that the point is A + v AB + w AC
+Summary: vectorized version of the region tests in closest_point_on_triangle. The regions are checked
+in the same order as the scalar function and the first region that matches wins. va + vb + vc is the Gram
+determinant, so the interior case uses the precomputed inverse instead of dividing again.
+'''
+def _closest_point_regions(d1, d2, d3, d4, d5, d6, inv_denom):
+    vc = d1 * d4 - d3 * d2
+    vb = d5 * d2 - d1 * d6
+    va = d3 * d6 - d5 * d4
+
+    in_A = (d1 <= 0.0) & (d2 <= 0.0)
+    in_B = (d3 >= 0.0) & (d4 <= d3)
+    in_C = (d6 >= 0.0) & (d5 <= d6)
+    in_AB = (vc <= 0.0) & (d1 >= 0.0) & (d3 <= 0.0)
+    in_AC = (vb <= 0.0) & (d2 >= 0.0) & (d6 <= 0.0)
+    in_BC = (va <= 0.0) & ((d4 - d3) >= 0.0) & ((d5 - d6) >= 0.0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # interior of the triangle
+        v = vb * inv_denom
+        w = vc * inv_denom
+
+        t_BC = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        v = np.where(in_BC, 1.0 - t_BC, v)
+        w = np.where(in_BC, t_BC, w)
+
+        t_AC = d2 / (d2 - d6)
+        v = np.where(in_AC, 0.0, v)
+        w = np.where(in_AC, t_AC, w)
+
+        t_AB = d1 / (d1 - d3)
+        v = np.where(in_AB, t_AB, v)
+        w = np.where(in_AB, 0.0, w)
+
+    v = np.where(in_C, 0.0, v)
+    w = np.where(in_C, 1.0, w)
+    v = np.where(in_B, 1.0, v)
+    w = np.where(in_B, 0.0, w)
+    v = np.where(in_A, 0.0, v)
+    w = np.where(in_A, 0.0, w)
+
+    return v, w
+
+'''
+Created on December 12, 2025
+Updated on December 19, 2025
+Author: Maya Sharma
+Parameters: query points (Q x 3) shifted to the table origin, TriangleTable of T triangles
+Returns: barycentric coordinates v, w (Q x T) and squared distances (Q x T)
+Summary: closest points for every (query, triangle) pair of a block. The dot products d1..d6 are
+expanded as P.AB - A.AB so that only two matrix products are needed instead of (Q x T x 3) vectors,
+everything that only depends on the triangle comes from the table.
+'''
+def _closest_points_block(P, table):
+    # BP = AP - AB and CP = AP - AC, so d3..d6 follow from d1, d2
+    d1 = P @ table.AB.T - table.A_AB
+    d2 = P @ table.AC.T - table.A_AC
+    d3 = d1 - table.AB_AB
+    d4 = d2 - table.AB_AC
+    d5 = d1 - table.AB_AC
+    d6 = d2 - table.AC_AC
+
+    v, w = _closest_point_regions(d1, d2, d3, d4, d5, d6, table.inv_denom)
+
+    # |P - (A + v AB + w AC)|^2 expanded in terms of the dot products above
+    AP_AP = np.einsum('ij,ij->i', P, P)[:, None] - 2.0 * (P @ table.A.T) + table.A_A[None, :]
+    sq_dist = (AP_AP - 2.0 * (v * d1 + w * d2)
+               + v * v * table.AB_AB + 2.0 * v * w * table.AB_AC + w * w * table.AC_AC)
+    sq_dist = np.where(np.isnan(sq_dist), np.inf, sq_dist)
+
+    return v, w, sq_dist
+
+'''
+Created on December 13, 2025
+Updated on December 19, 2025
+Author: Maya Sharma
+Parameters: query points (N x 3) shifted to the table origin and a TriangleTable with one row per query
+Returns: barycentric coordinates v, w (N,) and squared distances (N,)
+Summary: closest point of query i on triangle i, for the spatial indexes that only test a few
+candidate triangles per query. The numba kernel does it when jit_kernels is enabled.
+'''
+def _closest_points_pairs(P, table):
+    if jit_kernels.enabled:
+        return jit_kernels.closest_points_pairs(P, table)
+
+    AP = P - table.A
+    d1 = np.einsum('ij,ij->i', table.AB, AP)
+    d2 = np.einsum('ij,ij->i', table.AC, AP)
+    d3 = d1 - table.AB_AB
+    d4 = d2 - table.AB_AC
+    d5 = d1 - table.AB_AC
+    d6 = d2 - table.AC_AC
+
+    v, w = _closest_point_regions(d1, d2, d3, d4, d5, d6, table.inv_denom)
+
+    diff = AP - v[:, None] * table.AB - w[:, None] * table.AC
+    sq_dist = np.einsum('ij,ij->i', diff, diff)
+    sq_dist = np.where(np.isnan(sq_dist), np.inf, sq_dist)
+
+    return v, w, sq_dist
+
+'''
+Created on December 12, 2025
+Updated on December 26, 2025
+Author: Maya Sharma
+Parameters: query points (Q x 3), vertices and triangles of the mesh, optional memory budget in bytes
+Returns: closest points (Q x 3), distances (Q,), triangle indices (Q,) and barycentric coordinates (Q x 3)
+Summary: batched version of closest_point_on_mesh. The region tests are evaluated as array operations
+over blocks of (query x triangle) pairs, and the blocks are sized so that the temporaries stay within
+max_block_bytes. The barycentric coordinates are with respect to the vertices of the winning triangle,
+in the same order as they are listed in triangles. If a spatial index (mesh_bvh.TriangleBVH) built from
+the same vertices and triangles is passed, the query is forwarded to it, together with init_tri, the
+triangle per query to warm start from (for example the answer of the previous iteration). The brute
+force scan has no use for a warm start and ignores init_tri. If a correspondence_cache.CorrespondenceCache
+is passed the query goes through it, the points must then be the same samples in the same order every call.
+A TriangleTable of the current vertices can be passed to skip rebuilding it on every call. With table.pool set
+the queries are split into chunks of _THREAD_CHUNK_SIZE that run on that pool, each running chunk has its own
+block budget. A query only depends on its own row, so the answers do not depend on the chunks.
+When numba is installed the brute force scan runs in the compiled kernel of jit_kernels.py instead of blocks,
+the kernel already splits the queries over numba's threads, so table.pool is not used there.
+'''
+@telemetry.timed("closest_points_on_mesh")
+def closest_points_on_mesh(points, vertices, triangles, max_block_bytes=32 * 1024 * 1024, index=None,
+                           init_tri=None, cache=None, table=None):
+
+    # a correspondence cache answers from its candidate lists and only falls back to a full query on a miss
+    if cache is not None:
+        return cache.query(points, vertices, triangles, index=index, init_tri=init_tri, table=table)
+
+    # a spatial index built from the same mesh answers the query without the brute force scan
+    if index is not None:
+        return index.query(points, init_tri=init_tri)
+
+    points = np.atleast_2d(np.asarray(points, dtype=float))
+    if table is None:
+        table = TriangleTable(vertices, triangles)
+
+    n_points = len(points)
+    P = points - table.origin
+
+    # with numba the fused kernel loops over every triangle per query without the (query x triangle) temporaries
+    if jit_kernels.enabled:
+        return _closest_point_results(points, table, *jit_kernels.closest_points_all(P, table))
+
+    # without a pool, or with too few queries to share, the whole query is one scan
+    if table.pool is None or n_points <= _THREAD_CHUNK_SIZE:
+        return _closest_point_results(points, table, *_closest_points_blocked(P, table, max_block_bytes))
+
+    chunks = [slice(start, start + _THREAD_CHUNK_SIZE) for start in range(0, n_points, _THREAD_CHUNK_SIZE)]
+    results = list(table.pool.map(lambda chunk: _closest_points_blocked(P[chunk], table, max_block_bytes), chunks))
+    best_idx, best_v, best_w = (np.concatenate(columns) for columns in zip(*results))
+    return _closest_point_results(points, table, best_idx, best_v, best_w)
+
+'''
+Created on December 26, 2025
+Author: Maya Sharma
+Parameters: query points (Q x 3) shifted to the table origin, TriangleTable of the mesh and the memory budget
+Returns: index of the closest triangle and barycentric v, w per query, for _closest_point_results
+Summary: the brute force scan of closest_points_on_mesh over blocks of (query x triangle) pairs
+'''
+def _closest_points_blocked(P, table, max_block_bytes):
+    n_points = len(P)
+    n_triangles = len(table)
+
+    # split the (query x triangle) pairs into blocks that fit the budget
+    max_pairs = max(1, max_block_bytes // _BYTES_PER_PAIR)
+    tri_chunk = min(n_triangles, max_pairs)
+    pt_chunk = max(1, max_pairs // tri_chunk)
+
+    best_sq = np.full(n_points, np.inf)
+    best_idx = np.zeros(n_points, dtype=int)
+    best_v = np.zeros(n_points)
+    best_w = np.zeros(n_points)
+
+    for p_start in range(0, n_points, pt_chunk):
+        p_end = min(p_start + pt_chunk, n_points)
+        rows = np.arange(p_end - p_start)
+
+        for t_start in range(0, n_triangles, tri_chunk):
+            t_end = min(t_start + tri_chunk, n_triangles)
+
+            v, w, sq_dist = _closest_points_block(P[p_start:p_end], table[t_start:t_end])
+            local = np.argmin(sq_dist, axis=1)
+            local_sq = sq_dist[rows, local]
+
+            # strict comparison keeps the first triangle on ties, like the scalar loop
+            better = local_sq < best_sq[p_start:p_end]
+            sel = p_start + rows[better]
+            best_sq[sel] = local_sq[better]
+            best_idx[sel] = t_start + local[better]
+            best_v[sel] = v[rows[better], local[better]]
+            best_w[sel] = w[rows[better], local[better]]
+
+    return best_idx, best_v, best_w
+
+'''
+Created on December 12, 2025
+Updated on December 19, 2025
+Author: Maya Sharma
+Parameters: query points (not shifted), the TriangleTable the indices refer to, winning triangle index and
+            barycentric v, w per query
+Returns: closest points, distances, triangle indices and barycentric coordinates
+Summary: recomputes the winning points directly from the triangle so the reported distances are exact,
+shared by the brute force search and the spatial indexes
+'''
+def _closest_point_results(points, table, best_idx, best_v, best_w):
+    closest = table.points_at(best_idx, best_v, best_w)
+    distances = np.linalg.norm(points - closest, axis=1)
+    bary = np.column_stack([1.0 - best_v - best_w, best_v, best_w])
+
+    return closest, distances, best_idx, bary
+
+'''
+Created on December 16, 2025
+Updated on December 19, 2025
+Author: Maya Sharma
+Parameters: query points (Q x 3), a search radius per query, vertices and triangles of the mesh,
+            optional memory budget, spatial index and TriangleTable
+Returns: query index, triangle index and squared distance of every (query, triangle) pair within the radius
+Summary: brute force radius search with the same blocks as closest_points_on_mesh, forwarded to the
+index's query_radius when one is given
+'''
+def triangles_within(points, radii, vertices, triangles, max_block_bytes=32 * 1024 * 1024, index=None,
+                     table=None):
+
+    if index is not None:
+        return index.query_radius(points, radii)
+
+    points = np.atleast_2d(np.asarray(points, dtype=float))
+    r_sq = np.broadcast_to(np.asarray(radii, dtype=float) ** 2, len(points))
+    if table is None:
+        table = TriangleTable(vertices, triangles)
+    P = points - table.origin
+
+    max_pairs = max(1, max_block_bytes // _BYTES_PER_PAIR)
+    tri_chunk = min(len(table), max_pairs)
+    pt_chunk = max(1, max_pairs // tri_chunk)
+
+    found_q, found_t, found_sq = [], [], []
+    for p_start in range(0, len(P), pt_chunk):
+        p_end = min(p_start + pt_chunk, len(P))
+        for t_start in range(0, len(table), tri_chunk):
+            t_end = min(t_start + tri_chunk, len(table))
+
+            _, _, sq_dist = _closest_points_block(P[p_start:p_end], table[t_start:t_end])
+            rows, cols = np.nonzero(sq_dist <= r_sq[p_start:p_end, None])
+            found_q.append(p_start + rows)
+            found_t.append(t_start + cols)
+            found_sq.append(sq_dist[rows, cols])
+
+    if not found_q:
+        return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0)
+    return np.concatenate(found_q), np.concatenate(found_t), np.concatenate(found_sq)
@@ -1,128 +1,285 @@
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import telemetry
 from utility_functions import *
 from ICP_algo import *
+from mesh_bvh import TriangleBVH
+from mesh_pyramid import MeshPyramid
+from model_cache import load_mesh, load_body, load_grid, sample_chunks
+from voxel_grid import ClosestTriangleGrid
+from convergence import ConvergenceController, transform_parameters, transform_from_parameters
 
 '''
 Created on December 2, 2025
+Updated on December 17, 2025
 Author: Maya Sharma
-Parameters: Body A/B markers and tip, sample readings data
+Parameters: Body A/B markers and tip, sample readings data (list of frames or a Nsamps x Ns x 3 array),
+            optional registration method ('svd' or 'quaternion')
 Returns: Array of d_k points (N_samps x 3)
 Summary: Pre-calculates the pointer tip position d_k in the Body B coordinate system for all sample frames.
-This value is constant throughout the ICP iterations.
+This value is constant throughout the ICP iterations. All frames are registered at once with
+register_points_batch on the contiguous frame tensor.
 '''
-def pre_calculate_dks(A_markers, A_tip, B_markers, B_tip, frames, Nsamps, N_A, N_B):
-    d_k_points = []
-    
-
-    for k in range(Nsamps):
-        frame_data = frames[k]
-        
-        a_markers_tracker = frame_data[:N_A]
-        b_markers_tracker = frame_data[N_A:N_A+N_B]
-        
-        # calculate rigid bodies
-        R_A, t_A = register_points(A_markers, a_markers_tracker)
-        R_B, t_B = register_points(B_markers, b_markers_tracker)
-        
-        R_B_inv, t_B_inv = apply_inverse_transform(R_B, t_B)
-        
-        # Transform A_tip from Body A to Tracker frame
-        A_tip_transformed = apply_transform(R_A, t_A, A_tip.reshape(1, -1))[0]
-        # Transform result from Tracker frame to Body B frame (d_k)
-        d_k = apply_transform(R_B_inv, t_B_inv, A_tip_transformed.reshape(1, -1))[0]
-        
-        d_k_points.append(d_k)
-        
-    return np.array(d_k_points)
+@telemetry.timed("d_k")
+def pre_calculate_dks(A_markers, A_tip, B_markers, B_tip, frames, Nsamps, N_A, N_B, method='svd'):
+    frames = np.asarray(frames, dtype=float)[:Nsamps]
 
-'''
-Created on December 2, 2025
-Author: Maya Sharma
-Parameters: takes in bodyA_file, bodyB_file, the mesh file, sample readings file, and the output file,
-            plus max_iterations and a tolerance for convergence.
-Returns: The final s_k and c_k points
-Summary: main function for the complete ICP algorithm (PA#4)
-'''
+    a_markers_tracker = frames[:, :N_A]
+    b_markers_tracker = frames[:, N_A:N_A+N_B]
 
-def solve_pa4(bodyA_file, bodyB_file, mesh_file, sample_readings_file,
-              output_file, max_iterations=50, tolerance=1e-5):
+    # calculate rigid bodies for every frame
+    R_A, t_A = register_points_batch(A_markers, a_markers_tracker, method)
+    R_B, t_B = register_points_batch(B_markers, b_markers_tracker, method)
 
-    # load mesh and rigid body definitions
-    vertices, triangles, _ = read_mesh(mesh_file)
-    A_markers, A_tip = read_body(bodyA_file)
-    B_markers, B_tip = read_body(bodyB_file)
-    frames, _, Nsamps = read_sample_readings(sample_readings_file)
+    # Transform A_tip from Body A to Tracker frame
+    A_tip_tracker = np.einsum('fij,j->fi', R_A, A_tip) + t_A
+    # Transform result from Tracker frame to Body B frame (d_k = R_B^T (A_tip_tracker - t_B))
+    d_k_points = np.einsum('fji,fj->fi', R_B, A_tip_tracker - t_B)
 
-    N_A = len(A_markers)
-    N_B = len(B_markers)
+    return d_k_points
 
-    # precalculate all d_k 
-    d_k_points = pre_calculate_dks(
-        A_markers, A_tip,
-        B_markers, B_tip,
-        frames, Nsamps, N_A, N_B
-    )
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+Parameters: Body A/B markers and tip, an iterable of frame blocks (chunk x Ns x 3) such as sample_chunks gives,
+            N_A, N_B and the registration method
+Returns: Array of d_k points (N_samps x 3)
+Summary: pre_calculate_dks one block at a time, so only one block of frames is ever in memory. Every frame is
+registered on its own, the d_k are the same as from one call on all frames.
+'''
+def pre_calculate_dks_chunked(A_markers, A_tip, B_markers, B_tip, chunks, N_A, N_B, method='svd'):
+    d_k_blocks = [pre_calculate_dks(A_markers, A_tip, B_markers, B_tip, chunk, len(chunk), N_A, N_B, method)
+                  for chunk in chunks]
+    return np.concatenate(d_k_blocks) if d_k_blocks else np.zeros((0, 3))
 
-    # Initialize F_reg = identity
-    R_reg = np.eye(3)
-    t_reg = np.zeros(3)
+'''
+Created on December 20, 2025
+Author: Maya Sharma
+Parameters: max_iterations and the tolerance on the change of the mean distance
+Returns: the ConvergenceController solve_pa4 uses when none is given
+Summary: the rigid ICP map is smooth, Anderson acceleration of F_reg cuts the iterations to about a third
+'''
+def default_pa4_controller(max_iterations=50, tolerance=1e-5):
+    return ConvergenceController(max_iterations, abs_tol=tolerance,
+                                 param_tol={'rotation': 1e-6, 'translation': 1e-4},
+                                 acceleration='anderson', depth=5)
 
-    prev_mean_dist = float('inf')
+'''
+Created on December 21, 2025
+Updated on December 26, 2025
+Author: Maya Sharma
+Parameters: d_k points, the mesh vertices and triangles, a ConvergenceController, the starting F_reg, optionally the
+            spatial index and correspondence cache of this mesh, max_iterations (the controller's by default),
+            a SampleSchedule (subsampling.py) that has been reset for d_k and the TriangleTable of the mesh for
+            the brute force search without an index
+Returns: R_reg, t_reg and the s_k and c_k points of the last iteration
+Summary: the ICP iterations of solve_pa4 against one mesh, split out so they can run on every level of a MeshPyramid.
+With sampling the early iterations register a subset of the samples, the trimmed rows are left out of every
+registration.
+'''
+@telemetry.timed("pa4.icp")
+def run_icp(d_k_points, vertices, triangles, controller, R_reg, t_reg, index=None, cache=None, max_iterations=None,
+            sampling=None, table=None):
+    if max_iterations is None:
+        max_iterations = controller.max_iterations
 
     print("Starting ICP iterations...")
 
     # These will store the last iteration s_k and c_k
     last_s_k_points = None
     last_c_k_points = None
+    # closest triangles of the previous iteration, used to warm start the search
+    closest_tri = None
 
-    
     for iteration in range(max_iterations):
 
-        s_k_points = []
-        c_k_points = []
-        distances = []
-
-        for d_k in d_k_points:
-            # s_k = F_reg(d_k)
-            s_k = apply_transform(R_reg, t_reg, d_k.reshape(1, -1))[0]
+        # early iterations may only look at a subset of the samples
+        subset = sampling is not None and not sampling.full
+        rows = sampling.draw() if subset else slice(None)
 
-            # Find closest mesh point
-            c_k, dist, _ = closest_point_on_mesh(s_k, vertices, triangles)
+        # s_k = F_reg(d_k)
+        s_k_points = apply_transform(R_reg, t_reg, d_k_points[rows])
 
-            s_k_points.append(s_k)
-            c_k_points.append(c_k)
-            distances.append(dist)
-
-        s_k_points = np.array(s_k_points)
-        c_k_points = np.array(c_k_points)
+        # Find closest mesh points for all samples at once, the cache and warm start only work for all samples
+        c_k_points, distances, tri, _ = closest_points_on_mesh(s_k_points, vertices, triangles, index=index,
+                                                               init_tri=None if subset else closest_tri,
+                                                               cache=None if subset else cache, table=table)
 
         # save these 
-        last_s_k_points = s_k_points.copy()
-        last_c_k_points = c_k_points.copy()
+        previous_tri = closest_tri
+        if not subset:
+            closest_tri = tri
+            last_s_k_points = s_k_points.copy()
+            last_c_k_points = c_k_points.copy()
 
-        R_new, t_new = register_points(d_k_points, c_k_points)
+        # the samples with the largest residuals can be left out of the estimate
+        keep = sampling.trim_mask(distances) if sampling is not None else slice(None)
+        R_new, t_new = register_points(d_k_points[rows][keep], c_k_points[keep])
 
         mean_dist = np.mean(distances)
-        print(f"Iteration {iteration+1}: mean distance = {mean_dist:.6f}")
+        if subset:
+            print(f"Iteration {iteration+1}: mean distance = {mean_dist:.6f} ({len(rows)} samples)")
+        else:
+            print(f"Iteration {iteration+1}: mean distance = {mean_dist:.6f}")
 
         # Check convergence
-        if abs(prev_mean_dist - mean_dist) < tolerance:
-            print(f"Converged at iteration {iteration+1}")
+        rotation_step = rotation_angle(R_new, R_reg)
+        translation_step = np.linalg.norm(t_new - t_reg)
+        telemetry.record_iteration("pa4", iteration + 1, None if subset else previous_tri, tri, error=mean_dist,
+                                   samples=len(distances), rotation=rotation_step, translation=translation_step)
+        stop = controller.check(mean_dist, rotation=rotation_step, translation=translation_step)
+        if sampling is not None:
+            stop = sampling.after_iteration(mean_dist, stop, controller)
+        if stop:
+            print(f"Converged at iteration {iteration+1} ({controller.reason})")
             break
 
-        # Update transform
-        R_reg = R_new
-        t_reg = t_new
-        prev_mean_dist = mean_dist
+        # Update transform, the controller may extrapolate the step
+        if controller.acceleration is None:
+            R_reg, t_reg = R_new, t_new
+        else:
+            R_reg, t_reg = transform_from_parameters(
+                controller.accelerate(transform_parameters(R_reg, t_reg), transform_parameters(R_new, t_new)))
 
     else:
         print(f"Reached max iterations ({max_iterations}) without full convergence.")
 
+    # the loop ran out of iterations before it got to all samples
+    if last_s_k_points is None or len(last_s_k_points) != len(d_k_points):
+        last_s_k_points = apply_transform(R_reg, t_reg, d_k_points)
+        last_c_k_points = closest_points_on_mesh(last_s_k_points, vertices, triangles, index=index, table=table)[0]
+
+    return R_reg, t_reg, last_s_k_points, last_c_k_points
+
+'''
+Created on December 2, 2025
+Author: Maya Sharma
+Parameters: takes in bodyA_file, bodyB_file, the mesh file, sample readings file, and the output file,
+            plus max_iterations and a tolerance for convergence. use_bvh=False falls back to the brute force search.
+            An optional CorrespondenceCache reuses closest points of samples that barely moved. The mesh and bodies
+            are loaded from compiled containers (model_cache.py) unless use_compiled=False. The stopping rule and
+            acceleration come from controller (convergence.py), default_pa4_controller when none is given.
+            schedule is an optional list of (level, iterations) pairs, for example [(2, 10), (1, 10)]: that many
+            iterations run on each level of a MeshPyramid (mesh_pyramid.py) before the full mesh refines the pose.
+            use_grid=True answers the full mesh queries from a ClosestTriangleGrid (voxel_grid.py) instead of the
+            BVH, it is built once per mesh and stored next to the compiled mesh (unless use_compiled=False).
+            sampling is an optional SampleSchedule (subsampling.py): the first iterations then estimate F_reg from a
+            growing subset of the samples, with the worst residuals trimmed.
+            preloaded is an optional dict of the mesh and body arrays (see load_inputs in batch_pa5.py) used
+            instead of loading the files.
+            threads is an optional number of threads, the closest point queries of every iteration are then split
+            into chunks of samples that run on a thread pool of that size, with the spatial index or the brute
+            force search (use_bvh=False). The answers do not depend on it.
+            The sample readings are read and turned into d_k frame_chunk frames at a time, from the text or with
+            binary_samples=True from a compiled copy in cache_dir (model_cache.load_samples), so the frames of a
+            long capture are never in memory all at once.
+Returns: The final s_k and c_k points
+Summary: main function for the complete ICP algorithm (PA#4)
+'''
+
+@telemetry.timed("solve_pa4")
+def solve_pa4(bodyA_file, bodyB_file, mesh_file, sample_readings_file,
+              output_file, max_iterations=50, tolerance=1e-5, use_bvh=True,
+              cache=None, use_compiled=True, cache_dir=None, controller=None, schedule=None,
+              use_grid=False, sampling=None, preloaded=None, threads=None, frame_chunk=4096,
+              binary_samples=False):
+
+    # load mesh and rigid body definitions
+    if preloaded is not None:
+        vertices, triangles, neighbours = preloaded["vertices"], preloaded["triangles"], preloaded["neighbours"]
+        A_markers, A_tip = preloaded["A_markers"], preloaded["A_tip"]
+        B_markers, B_tip = preloaded["B_markers"], preloaded["B_tip"]
+    elif use_compiled:
+        vertices, triangles, neighbours = load_mesh(mesh_file, cache_dir)
+        A_markers, A_tip = load_body(bodyA_file, cache_dir)
+        B_markers, B_tip = load_body(bodyB_file, cache_dir)
+    else:
+        vertices, triangles, neighbours = read_mesh(mesh_file)
+        A_markers, A_tip = read_body(bodyA_file)
+        B_markers, B_tip = read_body(bodyB_file)
+    # the mesh is rigid here so the spatial index is built once
+    if use_grid:
+        index = load_grid(mesh_file, cache_dir=cache_dir) if use_compiled else ClosestTriangleGrid(vertices, triangles)
+    elif use_bvh:
+        index = TriangleBVH(vertices, triangles, neighbours=neighbours)
+    else:
+        index = None
+    frame_chunks, _, Nsamps, _ = sample_chunks(sample_readings_file, frame_chunk, binary_samples, cache_dir)
+
+    N_A = len(A_markers)
+    N_B = len(B_markers)
+
+    # precalculate all d_k, one block of frames at a time
+    d_k_points = pre_calculate_dks_chunked(
+        A_markers, A_tip,
+        B_markers, B_tip,
+        frame_chunks, N_A, N_B
+    )
+
+    # Initialize F_reg = identity
+    R_reg = np.eye(3)
+    t_reg = np.zeros(3)
+
+    if controller is None:
+        controller = default_pa4_controller(max_iterations, tolerance)
+    controller.reset()
+    if sampling is not None:
+        sampling.reset(d_k_points)
+
+    # the pool is shut down however the iterations end
+    pool = ThreadPoolExecutor(threads) if threads else None
+    try:
+        if schedule:
+            # the first iterations run on coarse copies of the mesh, only the pose is carried to the next level
+            pyramid = MeshPyramid(vertices, triangles, n_levels=max(level for level, _ in schedule) + 1)
+            for level, level_iterations in schedule:
+                level_vertices, level_triangles = pyramid.mesh(level)
+                level_index = TriangleBVH(level_vertices, level_triangles) if use_bvh else None
+                # the brute force search gets its own table, so the pool reaches it too
+                level_table = TriangleTable(level_vertices, level_triangles) if level_index is None else None
+                if level_index is not None:
+                    level_index.pool = pool
+                else:
+                    level_table.pool = pool
+                print(f"Level {level} ({len(level_triangles)} triangles)")
+                controller.reset()
+                R_reg, t_reg, _, _ = run_icp(d_k_points, level_vertices, level_triangles, controller, R_reg, t_reg,
+                                             index=level_index, max_iterations=level_iterations, sampling=sampling,
+                                             table=level_table)
+            controller.reset()
+
+        table = TriangleTable(vertices, triangles) if index is None else None
+        if index is not None:
+            index.pool = pool
+        else:
+            table.pool = pool
+        R_reg, t_reg, last_s_k_points, last_c_k_points = run_icp(d_k_points, vertices, triangles, controller,
+                                                                 R_reg, t_reg, index=index, cache=cache,
+                                                                 sampling=sampling, table=table)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    if cache is not None:
+        print(f"Correspondence cache: {cache.hits} hits, {cache.misses} misses")
+
     final_s = last_s_k_points
     final_c = last_c_k_points
 
+    write_pa4_output(output_file, final_s, final_c)
+
+    return final_s, final_c
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+Parameters: output file and the final s_k and c_k points (N x 3)
+Summary: writes the PA4 output format, a header line and one s_k, c_k, |s_k - c_k| line per sample
+'''
+@telemetry.timed("io.write_output")
+def write_pa4_output(output_file, final_s, final_c):
     with open(output_file, "w") as f:
-        f.write(f"{Nsamps} {output_file}\n")
+        f.write(f"{len(final_s)} {output_file}\n")
 
         for s_k, c_k in zip(final_s, final_c):
             diff = np.linalg.norm(s_k - c_k)
@@ -130,5 +287,3 @@ def solve_pa4(bodyA_file, bodyB_file, mesh_file, sample_readings_file,
             f.write(f"{s_k[0]:8.2f} {s_k[1]:8.2f} {s_k[2]:8.2f}    ")
             f.write(f"{c_k[0]:8.2f} {c_k[1]:8.2f} {c_k[2]:8.2f}    ")
             f.write(f"{diff:8.3f}\n")
-
-    return final_s, final_c
@@ -0,0 +1,230 @@
+# batch_pa5.py runs PA4 or PA5 on many sample readings files with one copy of the mesh and modes for all workers
+import os
+import sys
+import glob
+import time
+import argparse
+import contextlib
+import numpy as np
+import jit_kernels
+from concurrent.futures import ProcessPoolExecutor
+from model_cache import load_mesh, load_body, load_modes
+from utility_functions import read_mesh, read_body
+from deform_registration import read_modes_fixed, solve_pa5
+from ICP_iteration import solve_pa4
+from shared_arrays import SharedArrays
+
+# set up the default data folder the same way pa5.py does
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+default_data_folder = os.path.join(parent_dir, "2025_PA345_Student_Data")
+if not os.path.exists(default_data_folder):
+    default_data_folder = os.path.join(parent_dir, "2025 345 Student Data")
+
+# the shared input arrays a worker process runs on, attached once per process by _init_worker
+_worker_shared = None
+
+'''
+Created on December 22, 2025
+Author: Maya Sharma
+params: problem number (4 or 5) and data folder
+Returns: bodyA_file, bodyB_file, mesh_file and modes_file (None for PA4) of that problem
+'''
+def problem_files(problem, data_folder=default_data_folder):
+    files = [os.path.join(data_folder, f"Problem{problem}-BodyA.txt"),
+             os.path.join(data_folder, f"Problem{problem}-BodyB.txt"),
+             os.path.join(data_folder, f"Problem{problem}MeshFile.sur")]
+    files.append(os.path.join(data_folder, "Problem5Modes.txt") if problem == 5 else None)
+    return files
+
+'''
+Created on December 22, 2025
+Author: Maya Sharma
+params: bodyA_file, bodyB_file, mesh_file, modes_file (None to skip the modes), use_compiled and cache_dir
+Returns: dict of the input arrays in the form solve_pa4 and solve_pa5 take as preloaded, with every mode of the
+         modes file so each sample file can take as many as its header asks for
+'''
+def load_inputs(bodyA_file, bodyB_file, mesh_file, modes_file=None, use_compiled=True, cache_dir=None):
+    inputs = {}
+    if use_compiled:
+        inputs["vertices"], inputs["triangles"], inputs["neighbours"] = load_mesh(mesh_file, cache_dir)
+        inputs["A_markers"], inputs["A_tip"] = load_body(bodyA_file, cache_dir)
+        inputs["B_markers"], inputs["B_tip"] = load_body(bodyB_file, cache_dir)
+    else:
+        inputs["vertices"], inputs["triangles"], inputs["neighbours"] = read_mesh(mesh_file)
+        inputs["A_markers"], inputs["A_tip"] = read_body(bodyA_file)
+        inputs["B_markers"], inputs["B_tip"] = read_body(bodyB_file)
+
+    if modes_file is not None:
+        read_modes = load_modes if use_compiled else read_modes_fixed
+        args = (cache_dir,) if use_compiled else ()
+        inputs["mean_vertices"], inputs["mode_vectors"] = read_modes(modes_file, sys.maxsize, *args)
+    return inputs
+
+'''
+Created on December 22, 2025
+Author: Maya Sharma
+params: list of sample file names, glob patterns or data set letters, problem number and data folder
+Returns: the sample readings files they stand for, sorted and without duplicates
+Summary: a letter such as G stands for every PA<problem>-G-*-SampleReadingsTest.txt of the data folder and a
+pattern that matches nothing here is also tried inside the data folder. Without any pattern it is every sample
+readings file of the problem.
+'''
+def find_samples(patterns, problem, data_folder=default_data_folder):
+    if not patterns:
+        patterns = [os.path.join(data_folder, f"PA{problem}-*-SampleReadingsTest.txt")]
+
+    found = set()
+    for pattern in patterns:
+        if len(pattern) == 1 and pattern.upper() in "ABCDEFGHJK":
+            pattern = os.path.join(data_folder, f"PA{problem}-{pattern.upper()}-*-SampleReadingsTest.txt")
+        matches = glob.glob(pattern) or glob.glob(os.path.join(data_folder, pattern))
+        if not matches:
+            raise FileNotFoundError(f"no sample readings file matches '{pattern}'")
+        found.update(os.path.abspath(match) for match in matches)
+    return sorted(found)
+
+'''
+Created on December 22, 2025
+Author: Maya Sharma
+params: sample readings file and output folder
+Returns: output file path, named like the pa5.py outputs (SampleReadingsTest replaced by Output)
+'''
+def output_path(sample_file, output_dir):
+    name = os.path.basename(sample_file)
+    if "SampleReadingsTest" in name:
+        name = name.replace("SampleReadingsTest", "Output")
+    else:
+        name = os.path.splitext(name)[0] + "-Output.txt"
+    return os.path.join(output_dir, name)
+
+'''
+Created on December 22, 2025
+Author: Maya Sharma
+params: spec of the SharedArrays block holding the inputs
+Summary: attaches a worker process to the shared inputs once, every job of the worker then uses the same views
+'''
+def _init_worker(spec):
+    global _worker_shared
+    _worker_shared = SharedArrays.attach(spec)
+
+'''
+Created on December 22, 2025
+Author: Maya Sharma
+params: problem number, the four input files, sample readings file, output file, keyword options of the solver and
+        the input arrays (the worker's shared arrays when None)
+Returns: summary row dict with the sample file, number of samples, modes, wall time, mean and max |s_k - c_k|,
+         lambdas (PA5) and status ('ok' or the error message)
+Summary: one job of the batch. The solver's progress printing is dropped, and an error only fails this sample
+file, the rest of the batch goes on.
+'''
+def run_one(problem, files, sample_file, output_file, options, inputs=None):
+    inputs = _worker_shared.arrays if inputs is None else inputs
+    row = {"sample": os.path.basename(sample_file), "samples": 0, "modes": 0, "seconds": 0.0,
+           "error": float('nan'), "max_error": float('nan'), "lambdas": None, "status": "ok"}
+
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(None):
+            if problem == 5:
+                s_k, c_k, lambdas = solve_pa5(*files, sample_file, output_file, preloaded=inputs, **options)
+                row["modes"] = len(lambdas)
+                row["lambdas"] = [float(l) for l in lambdas]
+            else:
+                s_k, c_k = solve_pa4(*files[:3], sample_file, output_file, preloaded=inputs, **options)
+    except Exception as e:
+        row["status"] = f"{type(e).__name__}: {e}"
+        row["seconds"] = time.perf_counter() - start
+        return row
+
+    row["seconds"] = time.perf_counter() - start
+    distances = np.linalg.norm(np.asarray(s_k) - np.asarray(c_k), axis=1)
+    row["samples"] = len(distances)
+    row["error"] = float(np.mean(distances))
+    row["max_error"] = float(np.max(distances))
+    return row
+
+'''
+Created on December 22, 2025
+Author: Maya Sharma
+params: problem number, sample readings files, output folder, number of worker processes, data folder, keyword
+        options of the solver, use_compiled and cache_dir
+Returns: one summary row per sample file (see run_one), in the order of sample_files
+Summary: the mesh, bodies and (for PA5) every mode are loaded once and copied into one shared memory block. Each
+worker process of the pool maps that block at start up, so there is a single copy of the model however many
+workers run and no worker parses a file except its sample readings. With jobs=1 everything runs in this process.
+'''
+def run_batch(problem, sample_files, output_dir, jobs=None, data_folder=default_data_folder, options=None,
+              use_compiled=True, cache_dir=None):
+    options = options or {}
+    files = problem_files(problem, data_folder)
+    jobs = min(jobs or os.cpu_count() or 1, max(len(sample_files), 1))
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = [output_path(sample_file, output_dir) for sample_file in sample_files]
+
+    shared = SharedArrays(load_inputs(*files, use_compiled=use_compiled, cache_dir=cache_dir))
+    try:
+        if jobs == 1:
+            return [run_one(problem, files, s, o, options, shared.arrays) for s, o in zip(sample_files, outputs)]
+        with ProcessPoolExecutor(jobs, mp_context=jit_kernels.process_context(), initializer=_init_worker,
+                                 initargs=(shared.spec,)) as pool:
+            futures = [pool.submit(run_one, problem, files, s, o, options) for s, o in zip(sample_files, outputs)]
+            return [future.result() for future in futures]
+    finally:
+        shared.unlink()
+
+'''
+Created on December 22, 2025
+Author: Maya Sharma
+params: summary rows from run_batch, total wall time of the batch and optional file to write the table to
+Summary: prints one line per sample file and the totals, and writes the same table to summary_file
+'''
+def write_summary(rows, total_seconds, summary_file=None):
+    lines = [f"{'sample':<42}{'samples':>8}{'modes':>6}{'s':>9}{'mean err':>10}{'max err':>10}  status"]
+    for r in rows:
+        lines.append(f"{r['sample']:<42}{r['samples']:>8}{r['modes']:>6}{r['seconds']:9.2f}{r['error']:10.4f}"
+                     f"{r['max_error']:10.4f}  {r['status']}")
+        if r['lambdas'] is not None:
+            lines.append(" " * 4 + "lambda " + "".join(f"{l:12.4f}" for l in r['lambdas']))
+    failed = sum(r['status'] != "ok" for r in rows)
+    lines.append(f"{len(rows)} files, {failed} failed, {sum(r['seconds'] for r in rows):.2f} s of solving in "
+                 f"{total_seconds:.2f} s wall time")
+
+    print("\n".join(lines))
+    if summary_file is not None:
+        with open(summary_file, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run PA5 (or PA4) on many sample readings files in parallel.")
+    parser.add_argument("samples", nargs="*",
+                        help="sample readings files, glob patterns or data set letters (default: all of the problem)")
+    parser.add_argument("--jobs", "-j", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--pa4", action="store_true", help="run the rigid PA4 registration instead of PA5")
+    parser.add_argument("--data", default=default_data_folder, help="folder with the body, mesh and modes files")
+    parser.add_argument("--output", default=current_dir, help="folder for the output files and the summary")
+    parser.add_argument("--max-iters", type=int, default=50, help="iteration limit of every run")
+    parser.add_argument("--solver", default="alternating", choices=("alternating", "joint"), help="PA5 solver")
+    parser.add_argument("--threads", type=int, default=None, help="closest point query threads of every run")
+    args = parser.parse_args()
+
+    problem = 4 if args.pa4 else 5
+    if not os.path.exists(args.data):
+        print(f"the data folder couldn't be found: {args.data}")
+        sys.exit(1)
+    try:
+        sample_files = find_samples(args.samples, problem, args.data)
+    except FileNotFoundError as e:
+        print(e)
+        sys.exit(1)
+
+    if problem == 5:
+        options = {"max_iters": args.max_iters, "solver": args.solver, "threads": args.threads}
+    else:
+        options = {"max_iterations": args.max_iters, "threads": args.threads}
+
+    start = time.perf_counter()
+    rows = run_batch(problem, sample_files, args.output, args.jobs, args.data, options)
+    write_summary(rows, time.perf_counter() - start, os.path.join(args.output, f"PA{problem}-Batch-Summary.txt"))
+    sys.exit(1 if any(r['status'] != "ok" for r in rows) else 0)
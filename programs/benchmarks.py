@@ -0,0 +1,569 @@
+# benchmarks.py measures how fast the different stages of the programs run
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from utility_functions import *
+from ICP_algo import closest_point_on_mesh, closest_points_on_mesh
+from ICP_iteration import pre_calculate_dks
+from deform_registration import (read_modes_fixed, solve_pa5, deform_mesh, assemble_mode_system,
+                                 register_modes_alternating, default_pa5_controller, write_pa5_output)
+from normal_equations import NormalEquationAccumulator
+from mesh_bvh import TriangleBVH
+from voxel_grid import ClosestTriangleGrid
+
+# set up the default data folder the same way pa5.py does
+current_dir = os.path.dirname(os.path.abspath(__file__))
+default_data_folder = os.path.join(os.path.dirname(current_dir), "2025_PA345_Student_Data")
+
+'''
+Created on December 18, 2025
+Author: Maya Sharma
+params: function to time and how many times to run it
+Returns: best wall time in seconds over the repeats
+'''
+def best_time(func, repeats=5):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+'''
+Created on December 18, 2025
+Author: Maya Sharma
+params: data folder and number of repeats
+Returns: list of dicts with format, file, size in bytes, best time and throughput in MB/s
+Summary: times each of the file loaders on the PA5 input files
+'''
+def measure_parse_throughput(data_folder=default_data_folder, repeats=5):
+    jobs = [
+        ("mesh", "Problem5MeshFile.sur", read_mesh),
+        ("body", "Problem5-BodyA.txt", read_body),
+        ("sample readings", "PA5-A-Debug-SampleReadingsTest.txt", read_sample_readings),
+        ("modes", "Problem5Modes.txt", lambda f: read_modes_fixed(f, 6)),
+    ]
+
+    results = []
+    for fmt, name, loader in jobs:
+        path = os.path.join(data_folder, name)
+        size = os.path.getsize(path)
+        seconds = best_time(lambda: loader(path), repeats)
+        results.append({"format": fmt, "file": name, "bytes": size, "seconds": seconds,
+                        "mb_per_s": size / seconds / 1e6})
+    return results
+
+'''
+Created on December 18, 2025
+Author: Maya Sharma
+params: results from measure_parse_throughput
+Summary: prints one line per file format
+'''
+def print_parse_throughput(results):
+    print(f"{'format':<16}{'file':<38}{'KB':>8}{'ms':>9}{'MB/s':>9}")
+    for r in results:
+        print(f"{r['format']:<16}{r['file']:<38}{r['bytes'] / 1e3:8.1f}{r['seconds'] * 1e3:9.2f}{r['mb_per_s']:9.1f}")
+
+# coarse to fine schedules the multiresolution report compares, None is the full mesh only
+default_schedules = [None, [(1, 5)], [(2, 5), (1, 5)]]
+
+'''
+Created on December 21, 2025
+Author: Maya Sharma
+params: data folder, the schedules to compare, which debug sets, solve_pa5 solver and number of repeats
+Returns: list of dicts with data set, schedule, best time, final mean |s_k - c_k| and the largest lambda error
+         against the debug answer file
+Summary: runs solve_pa5 on the PA5 debug sets once per schedule to show how much time the coarse levels save and
+what they cost in final error. The time includes building the MeshPyramid.
+'''
+def measure_multiresolution(data_folder=default_data_folder, schedules=default_schedules, letters="ABCDEF",
+                            solver='alternating', repeats=3):
+    inputs = [os.path.join(data_folder, name) for name in
+              ("Problem5-BodyA.txt", "Problem5-BodyB.txt", "Problem5MeshFile.sur", "Problem5Modes.txt")]
+
+    results = []
+    for letter in letters:
+        readings = os.path.join(data_folder, f"PA5-{letter}-Debug-SampleReadingsTest.txt")
+        with open(os.path.join(data_folder, f"PA5-{letter}-Debug-Answer.txt"), 'r') as f:
+            f.readline()
+            answer_lambdas = np.array(f.readline().split(), dtype=float)
+
+        for schedule in schedules:
+            run = lambda: solve_pa5(*inputs, readings, os.devnull, solver=solver, schedule=schedule)
+            with contextlib.redirect_stdout(None):
+                seconds = best_time(run, repeats)
+                s_k, c_k, lambdas = run()
+            results.append({"data": letter, "schedule": schedule, "seconds": seconds,
+                            "error": float(np.mean(np.linalg.norm(s_k - c_k, axis=1))),
+                            "lambda_error": float(np.max(np.abs(lambdas - answer_lambdas)))})
+    return results
+
+'''
+Created on December 21, 2025
+Author: Maya Sharma
+params: results from measure_multiresolution
+Summary: prints one line per data set and schedule, with the time saved against the full mesh only run
+'''
+def print_multiresolution(results):
+    baseline = {r['data']: r['seconds'] for r in results if r['schedule'] is None}
+    print(f"{'data':<6}{'schedule':<22}{'ms':>9}{'saved %':>9}{'error':>10}{'|dlambda|':>11}")
+    for r in results:
+        saved = 100.0 * (1.0 - r['seconds'] / baseline[r['data']]) if r['data'] in baseline else float('nan')
+        schedule = str(r['schedule']) if r['schedule'] else "full mesh"
+        print(f"{r['data']:<6}{schedule:<22}{r['seconds'] * 1e3:9.1f}{saved:9.1f}{r['error']:10.4f}"
+              f"{r['lambda_error']:11.3f}")
+
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: data folder, number of query points, thread counts to compare (1 up to os.cpu_count() by default) and
+        number of repeats
+Returns: list of dicts with index, threads, best time, speedup and parallel efficiency against one thread and
+         whether the answers are identical to the single thread ones
+Summary: times one closest point query of n_points samples scattered around the PA5 mesh (within 5 mm of its
+vertices, seeded) on a TriangleBVH and a ClosestTriangleGrid with a thread pool of every size. The speedup is
+bounded by the cores of the machine, so run it on the machine you want to size.
+'''
+def measure_thread_scaling(data_folder=default_data_folder, n_points=20000, thread_counts=None, repeats=3):
+    vertices, triangles, neighbours = read_mesh(os.path.join(data_folder, "Problem5MeshFile.sur"))
+    rng = np.random.default_rng(0)
+    points = vertices[rng.integers(0, len(vertices), n_points)] + rng.uniform(-5.0, 5.0, (n_points, 3))
+
+    if thread_counts is None:
+        thread_counts = [1]
+        while thread_counts[-1] < (os.cpu_count() or 1):
+            thread_counts.append(min(2 * thread_counts[-1], os.cpu_count()))
+
+    indexes = [("bvh", TriangleBVH(vertices, triangles, neighbours=neighbours)),
+               ("grid", ClosestTriangleGrid(vertices, triangles, workers=1))]
+    results = []
+    for name, index in indexes:
+        single = None
+        for threads in thread_counts:
+            with ThreadPoolExecutor(threads) as pool:
+                index.pool = pool
+                seconds = best_time(lambda: index.query(points), repeats)
+                answer = index.query(points)
+            index.pool = None
+            if single is None:
+                single = (seconds, answer)
+            results.append({"index": name, "threads": threads, "seconds": seconds,
+                            "speedup": single[0] / seconds, "efficiency": single[0] / seconds / threads,
+                            "identical": all(np.array_equal(a, b) for a, b in zip(single[1], answer))})
+    return results
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: results from measure_thread_scaling
+Summary: prints one line per index and thread count
+'''
+def print_thread_scaling(results):
+    print(f"{'index':<7}{'threads':>8}{'ms':>9}{'speedup':>9}{'eff %':>8}  identical")
+    for r in results:
+        print(f"{r['index']:<7}{r['threads']:>8}{r['seconds'] * 1e3:9.1f}{r['speedup']:9.2f}"
+              f"{100.0 * r['efficiency']:8.1f}  {r['identical']}")
+
+
+# the timed stages of one PA5 pass, in pipeline order
+stage_names = ["parse", "d_k", "index", "correspondence", "lambda_solve", "rigid_update", "output"]
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: data folder, which debug sets and number of repeats
+Returns: list of dicts with the data set, the best time of every stage in stage_names and of the whole solve_pa5
+Summary: runs every stage of the PA5 pipeline on its own: parsing the text files, the d_k of all frames, building
+the TriangleBVH, one closest point pass of all samples, one lambda least squares solve, one rigid registration and
+writing the output. The correspondence and solve stages use the mesh of the final lambdas, so each is timed on
+the work of a late iteration. solve_pa5 is the whole default run for comparison.
+'''
+def measure_stages(data_folder=default_data_folder, letters="ABCDEF", repeats=3):
+    bodyA_file, bodyB_file, mesh_file, modes_file = [os.path.join(data_folder, name) for name in
+        ("Problem5-BodyA.txt", "Problem5-BodyB.txt", "Problem5MeshFile.sur", "Problem5Modes.txt")]
+    output_file = os.path.join(tempfile.gettempdir(), "pa5-benchmark-output.txt")
+
+    results = []
+    for letter in letters:
+        readings = os.path.join(data_folder, f"PA5-{letter}-Debug-SampleReadingsTest.txt")
+
+        def parse():
+            vertices, triangles, neighbours = read_mesh(mesh_file)
+            A_markers, A_tip = read_body(bodyA_file)
+            B_markers, B_tip = read_body(bodyB_file)
+            frames, _, Nsamps, N_modes = read_sample_readings(readings)
+            mean_vertices, mode_vectors = read_modes_fixed(modes_file, N_modes)
+            return vertices, triangles, neighbours, A_markers, A_tip, B_markers, B_tip, frames, Nsamps, \
+                mean_vertices, mode_vectors
+
+        (vertices, triangles, neighbours, A_markers, A_tip, B_markers, B_tip, frames, Nsamps,
+         mean_vertices, mode_vectors) = parse()
+        dks = lambda: pre_calculate_dks(A_markers, A_tip, B_markers, B_tip, frames, Nsamps,
+                                        len(A_markers), len(B_markers))
+        d_k_points = dks()
+        with contextlib.redirect_stdout(None):
+            s_k, c_k, lambdas = solve_pa5(bodyA_file, bodyB_file, mesh_file, modes_file, readings, output_file)
+        deformed = deform_mesh(mean_vertices, mode_vectors, lambdas)
+        index = TriangleBVH(deformed, triangles, neighbours=neighbours)
+        _, _, tri, bary = closest_points_on_mesh(d_k_points, deformed, triangles, index=index)
+        m_k = closest_points_on_mesh(d_k_points, deformed, triangles, index=index)[0]
+
+        def lambda_solve():
+            normal_eq = NormalEquationAccumulator(len(mode_vectors))
+            normal_eq.add(*assemble_mode_system(d_k_points, triangles, tri, bary, mean_vertices, mode_vectors))
+            return normal_eq.solve()
+
+        def whole_solve():
+            with contextlib.redirect_stdout(None):
+                solve_pa5(bodyA_file, bodyB_file, mesh_file, modes_file, readings, output_file)
+
+        timings = {"parse": parse, "d_k": dks,
+                   "index": lambda: TriangleBVH(deformed, triangles, neighbours=neighbours),
+                   "correspondence": lambda: closest_points_on_mesh(d_k_points, deformed, triangles, index=index,
+                                                                    init_tri=tri),
+                   "lambda_solve": lambda_solve,
+                   "rigid_update": lambda: register_points(d_k_points, m_k),
+                   "output": lambda: write_pa5_output(output_file, "benchmark", s_k, c_k, lambdas),
+                   "solve_pa5": whole_solve}
+        row = {"data": letter, "samples": int(Nsamps)}
+        row.update({name: best_time(func, repeats) for name, func in timings.items()})
+        results.append(row)
+
+    if os.path.exists(output_file):
+        os.remove(output_file)
+    return results
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: results from measure_stages
+Summary: prints one line per data set with the stage times in milliseconds
+'''
+def print_stages(results):
+    names = stage_names + ["solve_pa5"]
+    print(f"{'data':<6}{'N':>6}" + "".join(f"{name:>15}" for name in names))
+    for r in results:
+        print(f"{r['data']:<6}{r['samples']:>6}" + "".join(f"{r[name] * 1e3:15.3f}" for name in names))
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: PA5 answer or output file
+Returns: lambdas, s_k (N x 3), c_k (N x 3) and the distance column
+'''
+def read_pa5_output(filename):
+    with open(filename, 'r') as f:
+        lines = f.read().splitlines()
+    lambdas = np.array(lines[1].split(), dtype=float)
+    rows = np.array([line.split() for line in lines[2:] if line.strip()], dtype=float).reshape(-1, 7)
+    return lambdas, rows[:, :3], rows[:, 3:6], rows[:, 6]
+
+# largest differences to a debug answer file that still pass, lambda and s_k, c_k in mm (one step of the two
+# decimals of the output file)
+answer_tolerances = {"lambda_error": 0.05, "s_error": 0.01, "c_error": 0.01}
+
+# debug sets each solver is known to miss the tolerances on. The alternating solver ends far from the answers of
+# B-F (lambda off by 20-110), the joint one matches A-C and D-F only to about their own noise level. These do not
+# fail a run, a baseline still catches them getting worse.
+known_answer_failures = {"alternating": "BCDEF", "joint": "DEF"}
+
+'''
+Created on December 23, 2025
+Updated on December 26, 2025
+Author: Maya Sharma
+params: data folder, which debug sets, the solve_pa5 solver and the tolerances of answer_failures
+Returns: list of dicts with the data set, the largest differences to the answer file in lambda, s_k and c_k, our
+         mean |s_k - c_k|, the answer's, whether the set passed and whether it is a known failure of the solver
+Summary: the differences are taken between the values as the output file writes them (4 decimals for lambda, 2 for
+s_k and c_k) and the answer file, so the rounding of the output does not count. The debug answers come from another
+implementation with its own stopping rule, within the tolerances a set still matches its answer. Growing
+differences below them are accuracy regressions for compare_results.
+'''
+def check_answers(data_folder=default_data_folder, letters="ABCDEF", solver='alternating',
+                  tolerances=answer_tolerances):
+    inputs = [os.path.join(data_folder, name) for name in
+              ("Problem5-BodyA.txt", "Problem5-BodyB.txt", "Problem5MeshFile.sur", "Problem5Modes.txt")]
+    results = []
+    for letter in letters:
+        readings = os.path.join(data_folder, f"PA5-{letter}-Debug-SampleReadingsTest.txt")
+        answer_lambdas, answer_s, answer_c, answer_err = read_pa5_output(
+            os.path.join(data_folder, f"PA5-{letter}-Debug-Answer.txt"))
+        with contextlib.redirect_stdout(None):
+            s_k, c_k, lambdas = solve_pa5(*inputs, readings, os.devnull, solver=solver)
+        row = {"data": letter,
+               "lambda_error": float(np.max(np.abs(np.round(lambdas, 4) - answer_lambdas))),
+               "s_error": float(np.max(np.abs(np.round(s_k, 2) - answer_s))),
+               "c_error": float(np.max(np.abs(np.round(c_k, 2) - answer_c))),
+               "mean_error": float(np.mean(np.linalg.norm(s_k - c_k, axis=1))),
+               "answer_mean_error": float(np.mean(answer_err))}
+        row["passed"] = not _answer_misses(row, tolerances)
+        row["known_failure"] = letter in known_answer_failures.get(solver, "")
+        results.append(row)
+    return results
+
+'''
+Created on December 26, 2025
+Author: Maya Sharma
+params: one row of check_answers and the largest difference allowed per field
+Returns: list of messages, one per difference to the answer file above its tolerance
+'''
+def _answer_misses(row, tolerances):
+    messages = []
+    for field, tolerance in tolerances.items():
+        # the differences of rounded values are only multiples of the last decimal up to float noise
+        if row[field] > tolerance + 1e-9:
+            messages.append(f"answers {row['data']} {field}: {row[field]:.4f} > {tolerance}")
+    return messages
+
+'''
+Created on December 26, 2025
+Author: Maya Sharma
+params: results from check_answers and the largest difference allowed per field
+Returns: list of messages, one per difference to an answer file above its tolerance, empty when every set passed
+         or only missed as a known failure (known_answer_failures)
+'''
+def answer_failures(results, tolerances=answer_tolerances):
+    messages = []
+    for row in results:
+        if not row.get("known_failure", False):
+            messages += _answer_misses(row, tolerances)
+    return messages
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: results from check_answers
+Summary: prints one line per data set
+'''
+def print_answers(results):
+    print(f"{'data':<6}{'|dlambda|':>11}{'|ds_k|':>9}{'|dc_k|':>9}{'error':>10}{'answer':>10}")
+    for r in results:
+        print(f"{r['data']:<6}{r['lambda_error']:11.3f}{r['s_error']:9.3f}{r['c_error']:9.3f}"
+              f"{r['mean_error']:10.4f}{r['answer_mean_error']:10.4f}  "
+              f"{'ok' if r['passed'] else 'known' if r['known_failure'] else 'FAIL'}")
+
+# generated problems as (triangles, samples, modes), growing one size at a time from the first
+default_synthetic_cases = [(2000, 1000, 6), (8000, 1000, 6), (32000, 1000, 6), (8000, 10000, 6), (8000, 1000, 12)]
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: about how many triangles, number of modes (at most 20) and the seed
+Returns: mean vertices, triangles and mode vectors (M x V x 3) of a generated shape model
+Summary: the mean shape is a closed 40 x 25 x 15 mm ellipsoid. Each mode moves the vertices along their
+direction from the center by a random smooth field, a random combination of the 20 monomials of degree 3 or
+less in that direction, scaled to move no vertex more than 1 mm per unit of lambda.
+'''
+def make_synthetic_model(n_triangles, n_modes, seed=0):
+    if n_modes > 20:
+        raise ValueError("at most 20 independent synthetic modes")
+    n_phi = max(8, int(round(np.sqrt(n_triangles))))
+    n_theta = max(3, int(round(n_triangles / (2 * n_phi))) + 1)
+
+    theta = np.linspace(0, np.pi, n_theta + 1)[1:-1]
+    phi = np.linspace(0, 2 * np.pi, n_phi, endpoint=False)
+    tt, pp = np.meshgrid(theta, phi, indexing='ij')
+    directions = np.column_stack([np.sin(tt).ravel() * np.cos(pp).ravel(),
+                                  np.sin(tt).ravel() * np.sin(pp).ravel(), np.cos(tt).ravel()])
+    directions = np.vstack([directions, [0, 0, 1], [0, 0, -1]])
+
+    ring = np.arange((n_theta - 1) * n_phi).reshape(n_theta - 1, n_phi)
+    a, b = ring[:-1], ring[1:]
+    a_next, b_next = np.roll(a, -1, axis=1), np.roll(b, -1, axis=1)
+    top, bottom = len(directions) - 2, len(directions) - 1
+    triangles = np.vstack([np.stack([a, b, b_next], axis=-1).reshape(-1, 3),
+                           np.stack([a, b_next, a_next], axis=-1).reshape(-1, 3),
+                           np.column_stack([np.full(n_phi, top), ring[0], np.roll(ring[0], -1)]),
+                           np.column_stack([np.full(n_phi, bottom), np.roll(ring[-1], -1), ring[-1]])])
+
+    x, y, z = directions.T
+    monomials = np.column_stack([np.ones_like(x), x, y, z, x * x, y * y, z * z, x * y, y * z, z * x,
+                                 x ** 3, y ** 3, z ** 3, x * x * y, x * x * z, y * y * x, y * y * z, z * z * x,
+                                 z * z * y, x * y * z])
+    fields = monomials @ np.random.default_rng(seed).normal(size=(monomials.shape[1], n_modes))
+    fields /= np.max(np.abs(fields), axis=0)
+    mode_vectors = fields.T[:, :, None] * directions[None]
+    return directions * [40.0, 25.0, 15.0], triangles, mode_vectors
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: mean vertices, triangles, mode vectors, number of samples and the seed
+Returns: d_k points (N x 3) on the mesh of random lambdas (plus 0.02 mm of noise) and those lambdas
+'''
+def make_synthetic_samples(mean_vertices, triangles, mode_vectors, n_samples, seed=0):
+    rng = np.random.default_rng(seed)
+    lambdas = rng.uniform(-3.0, 3.0, len(mode_vectors))
+    deformed = deform_mesh(mean_vertices, mode_vectors, lambdas)
+    tri = rng.integers(0, len(triangles), n_samples)
+    d_k_points = np.einsum('nj,njd->nd', rng.dirichlet(np.ones(3), n_samples), deformed[triangles[tri]])
+    return d_k_points + rng.normal(scale=0.02, size=d_k_points.shape), lambdas
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: list of (triangles, samples, modes) cases, number of repeats and how many samples to check against the
+        brute force closest_point_on_mesh
+Returns: list of dicts with the case sizes, best times of building the TriangleBVH, one closest point pass and the
+         whole alternating registration, its lambda error against the generated lambdas and the number of checked
+         samples whose BVH distance differs from the brute force one
+'''
+def measure_synthetic(cases=default_synthetic_cases, repeats=1, brute_force_samples=32):
+    results = []
+    for n_triangles, n_samples, n_modes in cases:
+        mean_vertices, triangles, mode_vectors = make_synthetic_model(n_triangles, n_modes)
+        d_k_points, true_lambdas = make_synthetic_samples(mean_vertices, triangles, mode_vectors, n_samples)
+        deformed = deform_mesh(mean_vertices, mode_vectors, true_lambdas)
+
+        index = TriangleBVH(deformed, triangles)
+        _, distances, _, _ = index.query(d_k_points)
+        checked = np.linspace(0, n_samples - 1, min(brute_force_samples, n_samples)).astype(int)
+        brute = np.array([closest_point_on_mesh(d_k_points[k], deformed, triangles)[1] for k in checked])
+        mismatches = int(np.sum(np.abs(brute - distances[checked]) > 1e-9))
+
+        def solve():
+            bvh = TriangleBVH(mean_vertices, triangles)
+            return register_modes_alternating(d_k_points, triangles, mean_vertices, mode_vectors,
+                                              default_pa5_controller(50), index=bvh)
+
+        lambdas = solve()[2]
+        results.append({"case": f"T{len(triangles)}-N{n_samples}-M{n_modes}", "triangles": int(len(triangles)),
+                        "samples": n_samples, "modes": n_modes,
+                        "index": best_time(lambda: TriangleBVH(deformed, triangles), repeats),
+                        "correspondence": best_time(lambda: index.query(d_k_points), repeats),
+                        "solve": best_time(solve, repeats),
+                        "lambda_error": float(np.max(np.abs(lambdas - true_lambdas))),
+                        "brute_force_mismatches": mismatches})
+    return results
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: results from measure_synthetic
+Summary: prints one line per generated case
+'''
+def print_synthetic(results):
+    print(f"{'case':<20}{'index ms':>10}{'query ms':>10}{'solve ms':>10}{'|dlambda|':>11}{'brute':>7}")
+    for r in results:
+        print(f"{r['case']:<20}{r['index'] * 1e3:10.1f}{r['correspondence'] * 1e3:10.1f}{r['solve'] * 1e3:10.1f}"
+              f"{r['lambda_error']:11.4f}{r['brute_force_mismatches']:>7}")
+
+'''
+Created on December 23, 2025
+Updated on December 26, 2025
+Author: Maya Sharma
+params: data folder, debug sets, generated cases, repeats and the solve_pa5 solver of the answer check
+Returns: dict with the machine, the time of the run, the solver and the stages, answers and synthetic results,
+         ready for save_results
+'''
+def run_suite(data_folder=default_data_folder, letters="ABCDEF", cases=default_synthetic_cases, repeats=3,
+              solver='alternating'):
+    return {"created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                        "numpy": np.__version__, "cpus": os.cpu_count()},
+            "solver": solver,
+            "stages": measure_stages(data_folder, letters, repeats),
+            "answers": check_answers(data_folder, letters, solver),
+            "synthetic": measure_synthetic(cases, max(1, repeats // 3))}
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: results of run_suite and the JSON file to write
+'''
+def save_results(results, filename):
+    with open(filename, 'w') as f:
+        json.dump(results, f, indent=1)
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: results of run_suite, the results of an earlier run (loaded from its JSON), the time ratio and the
+        smallest time increase in seconds that count as slower, and the absolute lambda error increase allowed
+Returns: list of messages, one per regression, empty when nothing got worse
+Summary: rows are matched by data set or case. A time regresses if it is more than time_tolerance times the
+baseline and at least min_seconds longer, so the noise of very short stages does not count. An error regresses if
+it grew by more than 10% plus accuracy_tolerance, and any brute force mismatch is always reported. The answer
+errors are only compared when both runs used the same solver. Times are only comparable between runs on the same
+machine.
+'''
+def compare_results(results, baseline, time_tolerance=1.5, min_seconds=0.002, accuracy_tolerance=1e-3):
+    messages = []
+    sections = [("stages", "data", stage_names + ["solve_pa5"], []),
+                ("answers", "data", [], ["lambda_error", "s_error", "c_error", "mean_error"]),
+                ("synthetic", "case", ["index", "correspondence", "solve"], ["lambda_error"])]
+    same_solver = results.get("solver", "alternating") == baseline.get("solver", "alternating")
+    for section, key, time_fields, error_fields in sections:
+        if section == "answers" and not same_solver:
+            continue
+        old_rows = {row[key]: row for row in baseline.get(section, [])}
+        for row in results.get(section, []):
+            old = old_rows.get(row[key])
+            if old is None:
+                continue
+            for field in time_fields:
+                if field in old and row[field] > time_tolerance * old[field] and row[field] - old[field] > min_seconds:
+                    messages.append(f"{section} {row[key]} {field}: {old[field] * 1e3:.2f} ms -> "
+                                    f"{row[field] * 1e3:.2f} ms")
+            for field in error_fields:
+                if field in old and row[field] > 1.1 * old[field] + accuracy_tolerance:
+                    messages.append(f"{section} {row[key]} {field}: {old[field]:.4f} -> {row[field]:.4f}")
+    for row in results.get("synthetic", []):
+        if row["brute_force_mismatches"]:
+            messages.append(f"synthetic {row['case']}: {row['brute_force_mismatches']} samples differ from the "
+                            f"brute force closest point")
+    return messages
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the PA5 stages and check the results for regressions.")
+    parser.add_argument("data_folder", nargs="?", default=default_data_folder)
+    parser.add_argument("--json", default=None, help="write the suite results to this file")
+    parser.add_argument("--baseline", default=None, help="results file of an earlier run to compare against")
+    parser.add_argument("--quick", action="store_true", help="two debug sets, small generated cases, no extras")
+    parser.add_argument("--solver", default="alternating", choices=sorted(known_answer_failures),
+                        help="solve_pa5 solver the answer files are checked with")
+    args = parser.parse_args()
+
+    letters, cases, repeats = "ABCDEF", default_synthetic_cases, 3
+    if args.quick:
+        letters, cases, repeats = "AB", default_synthetic_cases[:2], 1
+    else:
+        print_parse_throughput(measure_parse_throughput(args.data_folder))
+        print()
+        print_multiresolution(measure_multiresolution(args.data_folder))
+        print()
+        print_thread_scaling(measure_thread_scaling(args.data_folder))
+        print()
+
+    results = run_suite(args.data_folder, letters, cases, repeats, args.solver)
+    print_stages(results["stages"])
+    print()
+    print_answers(results["answers"])
+    print()
+    print_synthetic(results["synthetic"])
+    if args.json is not None:
+        save_results(results, args.json)
+
+    # a debug set that does not match its answer fails the run with or without a baseline, unless it is known to
+    failures = answer_failures(results["answers"])
+    known = "".join(row["data"] for row in results["answers"] if row["known_failure"] and not row["passed"])
+    print()
+    print("\n".join(failures) if failures else "no debug set misses its answer file unexpectedly")
+    if known:
+        print(f"known misses of the {args.solver} solver: {', '.join(known)}")
+
+    regressions = []
+    if args.baseline is not None:
+        with open(args.baseline, 'r') as f:
+            regressions = compare_results(results, json.load(f))
+        print()
+        print("\n".join(regressions) if regressions else f"no regressions against {args.baseline}")
+    sys.exit(1 if failures or regressions else 0)
@@ -0,0 +1,150 @@
+# convergence.py decides when the ICP loops of PA4 and PA5 can stop and optionally speeds up their updates
+import numpy as np
+from utility_functions import rotation_vector, rotation_from_vector
+
+'''
+Created on December 20, 2025
+Author: Maya Sharma
+Summary: stopping rules and acceleration for fixed point loops x_next = G(x) such as ICP.
+The loop calls accelerate(x, G(x)) to get the next iterate and then check(error, **deltas) once per iteration.
+check returns True as soon as one of the enabled criteria holds, the name of that criterion is kept in reason:
+    'error'       the error itself is at most error_tol
+    'absolute'    the error changed by less than abs_tol since the last iteration
+    'relative'    the error changed by less than rel_tol times the previous error
+    'parameters'  every parameter change passed to check is below its entry in param_tol, for example
+                  param_tol={'lambda': 1e-4, 'rotation': 1e-7, 'translation': 1e-5}
+    'stagnation'  the best error has improved by less than stagnation_tol (relative) in the last
+                  stagnation_window iterations
+Criteria whose tolerance is None are off. No criterion is checked before min_iterations iterations.
+acceleration is None for plain iterations, 'relaxation' for over-relaxation x + omega * (G(x) - x), or
+'anderson' for Anderson acceleration of depth m (the next iterate mixes the last m + 1 values of G so that
+the mixed residual G(x) - x is as small as possible in least squares). Anderson is safeguarded: when the
+error grows, its history is dropped and the next step is a plain one.
+'''
+class ConvergenceController:
+
+    def __init__(self, max_iterations=50, error_tol=None, abs_tol=None, rel_tol=None, param_tol=None,
+                 stagnation_window=None, stagnation_tol=1e-6, acceleration=None, depth=5, relaxation=1.5,
+                 min_iterations=1, restart_tol=0.0):
+        if acceleration not in (None, 'anderson', 'relaxation'):
+            raise ValueError(f"unknown acceleration '{acceleration}'")
+        self.max_iterations = max_iterations
+        self.error_tol = error_tol
+        self.abs_tol = abs_tol
+        self.rel_tol = rel_tol
+        self.param_tol = dict(param_tol or {})
+        self.stagnation_window = stagnation_window
+        self.stagnation_tol = stagnation_tol
+        self.acceleration = acceleration
+        self.depth = depth
+        self.relaxation = relaxation
+        self.min_iterations = min_iterations
+        self.restart_tol = restart_tol
+        self.reset()
+
+    '''
+    Summary: forgets the error history and the acceleration history
+    '''
+    def reset(self):
+        self.errors = []
+        self.iterations = 0
+        self.converged = False
+        self.reason = None
+        self.n_restarts = 0
+        self._xs = []
+        self._gs = []
+
+    '''
+    Parameters: current iterate x and its update G(x), both flat arrays
+    Returns: the next iterate
+    '''
+    def accelerate(self, x, gx):
+        x = np.asarray(x, dtype=float).ravel()
+        gx = np.asarray(gx, dtype=float).ravel()
+
+        if self.acceleration == 'relaxation':
+            return x + self.relaxation * (gx - x)
+        if self.acceleration != 'anderson':
+            return gx
+
+        self._xs.append(x)
+        self._gs.append(gx)
+        del self._xs[:-(self.depth + 1)]
+        del self._gs[:-(self.depth + 1)]
+        if len(self._xs) < 2:
+            return gx
+
+        G = np.array(self._gs)
+        F = G - np.array(self._xs)
+        dF = np.diff(F, axis=0).T
+        dG = np.diff(G, axis=0).T
+
+        # gamma minimises |f_k - dF gamma|, a tiny ridge keeps the solve stable when the residuals line up
+        scale = max(np.sum(dF * dF), 1e-300)
+        gamma = np.linalg.solve(dF.T @ dF + 1e-10 * scale * np.eye(dF.shape[1]), dF.T @ F[-1])
+        return gx - dG @ gamma
+
+    '''
+    Parameters: error of the current iterate and the size of each parameter change as keyword arguments
+    Returns: True if the loop should stop, in which case converged and reason are set
+    '''
+    def check(self, error, **deltas):
+        self.iterations += 1
+        previous = self.errors[-1] if self.errors else None
+        best_before = min(self.errors) if self.errors else np.inf
+        self.errors.append(error)
+
+        # an accelerated step that made things worse throws away the extrapolation history
+        if self.acceleration == 'anderson' and error > best_before * (1.0 + self.restart_tol):
+            self._xs, self._gs = [], []
+            self.n_restarts += 1
+
+        if self.iterations < self.min_iterations:
+            return False
+
+        reason = None
+        if self.error_tol is not None and error <= self.error_tol:
+            reason = 'error'
+        elif previous is not None and self.abs_tol is not None and abs(previous - error) < self.abs_tol:
+            reason = 'absolute'
+        elif previous is not None and self.rel_tol is not None and abs(previous - error) <= self.rel_tol * previous:
+            reason = 'relative'
+        elif self.param_tol and all(name in deltas and deltas[name] < tol for name, tol in self.param_tol.items()):
+            reason = 'parameters'
+        elif self._stagnated():
+            reason = 'stagnation'
+
+        if reason is not None:
+            self.converged = True
+            self.reason = reason
+            return True
+        return False
+
+    '''
+    Returns: True if the best error of the last stagnation_window iterations is not better than before them
+    '''
+    def _stagnated(self):
+        window = self.stagnation_window
+        if window is None or len(self.errors) <= window:
+            return False
+        best_before = min(self.errors[:-window])
+        best_recent = min(self.errors[-window:])
+        return best_recent > best_before * (1.0 - self.stagnation_tol)
+
+'''
+Created on December 20, 2025
+Author: Maya Sharma
+params: rotation R and translation t of a frame
+Returns: the frame as one vector of 6 numbers, rotation vector first, so that frames can be accelerated
+'''
+def transform_parameters(R, t):
+    return np.concatenate([rotation_vector(R), t])
+
+'''
+Created on December 20, 2025
+Author: Maya Sharma
+params: vector of 6 numbers from transform_parameters
+Returns: R, t
+'''
+def transform_from_parameters(x):
+    return rotation_from_vector(x[:3]), np.array(x[3:6])
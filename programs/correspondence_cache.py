@@ -0,0 +1,139 @@
+# correspondence_cache.py reuses closest point answers between ICP iterations when nothing moved enough to change them
+import numpy as np
+from ICP_algo import TriangleTable, closest_points_on_mesh, triangles_within, _closest_points_pairs, _closest_point_results
+
+'''
+Created on December 16, 2025
+Author: Maya Sharma
+Summary: per sample cache of closest point candidates.
+When sample k gets a full query at point p0 on mesh vertices V0 with distance d, the cache also stores
+every triangle within d + 2 * margin of p0. Later the sample is at p and the mesh at V. Every point of a
+triangle moves at most as far as its vertices, so with
+    delta = |p - p0| + max_i |V_i - V0_i| <= margin
+the old closest triangle is at most d + delta away, while every triangle that was not a candidate is
+more than d + 2 * margin - delta >= d + delta away. The answer must therefore be one of the candidates and
+only those are tested (a hit). Samples that moved more than margin get a full query (a miss) and their
+candidates are refreshed. The counters hits and misses show how much work was saved.
+'''
+class CorrespondenceCache:
+
+    def __init__(self, margin=0.5, max_candidates=32):
+        self.margin = margin
+        self.max_candidates = max_candidates
+        self.hits = 0
+        self.misses = 0
+
+        self.anchor = None
+        self.candidates = None
+        self.snapshot_id = None
+        # mesh vertices at the time of each refresh that is still referenced by a sample
+        self.snapshots = {}
+        self._next_snapshot = 0
+
+    '''
+    Summary: forgets every cached answer, the counters are kept
+    '''
+    def clear(self):
+        self.anchor = None
+        self.candidates = None
+        self.snapshot_id = None
+        self.snapshots = {}
+
+    '''
+    Parameters: query points (N x 3), one per sample and always in the same sample order, vertices and
+                triangles of the current mesh, optional spatial index, warm start triangles and TriangleTable
+                of the current mesh
+    Returns: closest points, distances, triangle indices and barycentric coordinates like closest_points_on_mesh
+    '''
+    def query(self, points, vertices, triangles, index=None, init_tri=None, table=None):
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        vertices = np.asarray(vertices, dtype=float)
+        if table is None:
+            table = TriangleTable(vertices, triangles)
+        n = len(points)
+
+        if self.anchor is None or len(self.anchor) != n:
+            self.clear()
+            self.anchor = points.copy()
+            self.candidates = np.full((n, self.max_candidates), -1)
+            self.snapshot_id = np.full(n, -1)
+
+        # how far each sample could have moved relative to its cached mesh
+        mesh_motion = np.full(n, np.inf)
+        for sid, snapshot in self.snapshots.items():
+            users = self.snapshot_id == sid
+            mesh_motion[users] = np.sqrt(np.max(np.sum((vertices - snapshot) ** 2, axis=1)))
+        delta = np.linalg.norm(points - self.anchor, axis=1) + mesh_motion
+        hit = delta <= self.margin
+
+        best_idx = np.zeros(n, dtype=int)
+        best_v = np.zeros(n)
+        best_w = np.zeros(n)
+
+        hit_rows = np.nonzero(hit)[0]
+        if len(hit_rows):
+            best_idx[hit_rows], best_v[hit_rows], best_w[hit_rows] = self._test_candidates(
+                points[hit_rows], table, self.candidates[hit_rows])
+
+        miss_rows = np.nonzero(~hit)[0]
+        if len(miss_rows):
+            miss_init = None if init_tri is None else np.asarray(init_tri)[miss_rows]
+            _, dist, tri, bary = closest_points_on_mesh(points[miss_rows], vertices, triangles,
+                                                        index=index, init_tri=miss_init, table=table)
+            best_idx[miss_rows] = tri
+            best_v[miss_rows] = bary[:, 1]
+            best_w[miss_rows] = bary[:, 2]
+            self._refresh(points, vertices, table, index, miss_rows, dist)
+
+        self.hits += len(hit_rows)
+        self.misses += len(miss_rows)
+
+        return _closest_point_results(points, table, best_idx, best_v, best_w)
+
+    '''
+    Parameters: points of the hit samples, TriangleTable of the current mesh and their candidate lists (-1 padded)
+    Returns: best triangle index and its v, w per sample
+    '''
+    def _test_candidates(self, points, table, candidates):
+        valid = candidates >= 0
+        rows = np.broadcast_to(np.arange(len(points))[:, None], candidates.shape)[valid]
+
+        v = np.zeros(candidates.shape)
+        w = np.zeros(candidates.shape)
+        sq_dist = np.full(candidates.shape, np.inf)
+        v[valid], w[valid], sq_dist[valid] = _closest_points_pairs(points[rows] - table.origin,
+                                                                   table[candidates[valid]])
+
+        # candidates are stored in triangle order, so argmin keeps the lowest index on ties
+        k = np.arange(len(points))
+        slot = np.argmin(sq_dist, axis=1)
+        return candidates[k, slot], v[k, slot], w[k, slot]
+
+    '''
+    Summary: stores new anchors and candidate lists for the samples that just got a full query
+    '''
+    def _refresh(self, points, vertices, table, index, rows, dist):
+        # a little slack so rounding in the radius search can not drop a candidate on the boundary
+        radii = dist + 2.0 * self.margin + 1e-9
+        q, tri, _ = triangles_within(points[rows], radii, vertices, table.triangles, index=index, table=table)
+
+        order = np.lexsort((tri, q))
+        q, tri = q[order], tri[order]
+        counts = np.bincount(q, minlength=len(rows))
+        slot = np.arange(len(q)) - np.repeat(np.cumsum(counts) - counts, counts)
+
+        # samples with too many candidates are not cached and get a full query next time
+        cacheable = counts <= self.max_candidates
+        keep = cacheable[q]
+        self.candidates[rows] = -1
+        self.candidates[rows[q[keep]], slot[keep]] = tri[keep]
+
+        self.anchor[rows] = points[rows]
+        sid = self._next_snapshot
+        self._next_snapshot += 1
+        self.snapshots[sid] = vertices.copy()
+        self.snapshot_id[rows] = np.where(cacheable, sid, -1)
+
+        # drop snapshots no sample refers to anymore
+        in_use = set(np.unique(self.snapshot_id).tolist())
+        self.snapshots = {k: v for k, v in self.snapshots.items() if k in in_use}
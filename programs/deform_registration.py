@@ -1,57 +1,51 @@
 # deform_registration.py has solve pa_5
 import numpy as np
 import os
+import telemetry
+from concurrent.futures import ThreadPoolExecutor
 from utility_functions import *
+from utility_functions import _parse_numeric_block
 from ICP_algo import *
 from ICP_iteration import *
+from mesh_bvh import TriangleBVH, ModeSpaceBVH
+from mesh_pyramid import MeshPyramid
+from model_cache import load_mesh, load_body, load_modes, sample_chunks
+from convergence import ConvergenceController
+from normal_equations import NormalEquationAccumulator
 
 '''
 Created December 5, 2025
+Updated December 19, 2025
 Author: Maya Sharma
 params: point, triangle_vertices
 Returns: u, v, w
 Summary: computes barycentric coordinates of a point with respect to a triangle
 Note: this function also handles triangles that have an area close to zero, by returning barycentric coordinatess 
-        that are equal. Like (1/3, 1/3, 1/3) for example.
+        that are equal. Like (1/3, 1/3, 1/3) for example. The work is done by TriangleTable.barycentric, which
+        solve_pa5 does not need anymore since closest_points_on_mesh returns the barycentric coordinates.
 '''
 def compute_barycentric(point, triangle_vertices):
-    # triangle verticies is a 3 by 3 array
-    A, B, C = triangle_vertices
-    v0 = B - A
-    v1 = C - A
-    v2 = point - A
-    
-    # calculate  dot products of the vectors formed above in this section
-    d00 = np.dot(v0, v0)
-    d01 = np.dot(v0, v1)
-    d11 = np.dot(v1, v1)
-    d20 = np.dot(v2, v0)
-    d21 = np.dot(v2, v1)
-    
-    # get the barcyentric coordinates
-    denom = d00 * d11 - d01 * d01
-    if abs(denom) < 1e-12:
-        return 1/3, 1/3, 1/3
-    
-    #calculate v and w which are the barycentric coordinates
-    v = (d11 * d20 - d01 * d21) / denom
-    w = (d00 * d21 - d01 * d20) / denom
-    u = 1 - v - w
+    # triangle verticies is a 3 by 3 array, the table is relative to A like the dot products were
+    triangle_vertices = np.asarray(triangle_vertices, dtype=float)
+    table = TriangleTable(triangle_vertices, np.array([[0, 1, 2]]), origin=triangle_vertices[0])
+    u, v, w = table.barycentric(np.asarray(point, dtype=float)[None], np.array([0]))[0]
     
     return u, v, w
 
 '''
 Created December 5, 2025
+Updated December 19, 2025
 Author: Maya Sharma
 params: filename and, max_modes
-Returns: mean_vertices, mode_vectors
+Returns: mean_vertices (V x 3), mode_vectors (M x V x 3), mode_vectors[m] is the displacement of mode m + 1
 Summary: reads modes file and returns mean vertices and mode vectors up to max_modes
 Notes: this function makes sure that there's no index error if the max_modes is more than available modes. Also,
             it handles both values separated by a space or by a comma.
 '''
+@telemetry.timed("io.read_modes")
 def read_modes_fixed(filename, max_modes):
     with open(filename, 'r') as f:
-        lines = [line.strip() for line in f.readlines()]
+        lines = f.read().splitlines()
     
     import re
     n_vertices_match = re.search(r'Nvertices=(\d+)', lines[0])
@@ -62,193 +56,465 @@ def read_modes_fixed(filename, max_modes):
     n_modes_total = int(n_modes_match.group(1))
     n_modes = min(max_modes, n_modes_total)
     
-    # read the mean vertices and mode vectors
-    mean_vertices = []
-    modes = [[] for _ in range(n_modes)]
-    
+    # read the mean vertices, each block may start with a "Mode m" line
     line_idx = 1
     if line_idx < len(lines) and "Mode 0" in lines[line_idx]:
         line_idx += 1
     
-    for i in range(n_vertices):
-        line = lines[line_idx]
-        if ',' in line:
-            coords = [float(x.strip()) for x in line.split(',')]
-        else:
-            coords = [float(x) for x in line.split()]
-        mean_vertices.append(coords)
-        line_idx += 1
+    mean_vertices = _parse_numeric_block(lines, line_idx, n_vertices)
+    line_idx += n_vertices
     
-    # read each mode
+    # read each mode into one contiguous tensor
+    modes = np.empty((n_modes, n_vertices, mean_vertices.shape[1]))
     for m in range(n_modes):
         if line_idx < len(lines) and f"Mode {m+1}" in lines[line_idx]:
             line_idx += 1
         
-        for i in range(n_vertices):
-            line = lines[line_idx]
-            if ',' in line:
-                coords = [float(x.strip()) for x in line.split(',')]
-            else:
-                coords = [float(x) for x in line.split()]
-            modes[m].append(coords)
-            line_idx += 1
+        modes[m] = _parse_numeric_block(lines, line_idx, n_vertices)
+        line_idx += n_vertices
     
-    return np.array(mean_vertices), [np.array(mode) for mode in modes]
+    return mean_vertices, modes
+
+'''
+Created December 19, 2025
+Author: Maya Sharma
+params: mean_vertices (V x 3), mode_vectors (M x V x 3), lambdas (M)
+Returns: deformed vertices mean + sum_m lambda_m * mode_m
+'''
+def deform_mesh(mean_vertices, mode_vectors, lambdas):
+    return mean_vertices + np.tensordot(lambdas, mode_vectors, axes=1)
+
+'''
+Created December 19, 2025
+Author: Maya Sharma
+params: points d'_k (N x 3), triangles, closest triangle index and barycentric coordinates per point, mean_vertices
+        and mode_vectors (M x V x 3)
+Returns: A (3N x M) and b (3N) of the least squares system A lambda = b
+Summary: q_m,k = zeta * m_v0 + xi * m_v1 + psi * m_v2 is the point of mode m at the barycentric coordinates of
+sample k. Row block k of A holds q_m,k for every mode and b holds d'_k - q_0,k. All samples and modes are
+gathered at once and combined with one einsum.
+'''
+def assemble_mode_system(points, triangles, triangle_indices, bary_coords, mean_vertices, mode_vectors):
+    corners = triangles[triangle_indices]
+    n_modes = len(mode_vectors)
+
+    q0 = np.einsum('nj,njd->nd', bary_coords, mean_vertices[corners])
+    b = (points - q0).reshape(-1)
+
+    # mode_vectors[:, corners] is (M x N x 3 corners x 3)
+    A = np.einsum('nj,mnjd->ndm', bary_coords, mode_vectors[:, corners]).reshape(-1, n_modes)
+
+    return A, b
+
+'''
+Created December 20, 2025
+Author: Maya Sharma
+params: spatial index (or None), TriangleTable (or None), the new deformed vertices and lambdas
+Summary: brings whichever search structure solve_pa5 uses up to date after the mesh deformed
+'''
+def _update_mesh_index(index, table, deformed_vertices, lambdas):
+    if isinstance(index, ModeSpaceBVH):
+        index.set_lambdas(lambdas)
+    elif index is not None:
+        index.update(deformed_vertices)
+    elif table is not None:
+        table.update(deformed_vertices)
+
+'''
+Created December 20, 2025
+Updated December 21, 2025
+Author: Maya Sharma
+params: points s_k (N x 3), unit normals of their closest triangles (N x 3), residuals s_k - c_k (N x 3), the
+        mode columns of assemble_mode_system reshaped to (N x 3 x M), a small damping factor and the number of
+        samples per block
+Returns: rotation vector, translation and lambda step (6 + M unknowns) and the center the rotation is about
+Summary: one Gauss-Newton step for the point to plane residuals r_k = n_k . (s_k - c_k). Moving the pose by a
+small rotation w about the center and a translation dt and the modes by dlambda changes r_k by
+w . ((s_k - center) x n_k) + n_k . dt - n_k . Q_k dlambda, which gives one row of the Jacobian per sample.
+The Jacobian is built block by block into a NormalEquationAccumulator, damping is its Tikhonov term.
+'''
+def pose_and_mode_step(points, normals, residuals, mode_columns, damping=1e-9, chunk_size=4096):
+    center = points.mean(axis=0)
+    normal_eq = NormalEquationAccumulator(6 + mode_columns.shape[2], regularization=damping)
+
+    for start in range(0, len(points), chunk_size):
+        rows = slice(start, start + chunk_size)
+        n = normals[rows]
+        J = np.hstack([np.cross(points[rows] - center, n), n, -np.einsum('nd,ndm->nm', n, mode_columns[rows])])
+        normal_eq.add(J, -np.einsum('nd,nd->n', n, residuals[rows]))
+
+    step = normal_eq.solve()
+    return step[:3], step[3:6], step[6:], center
+
+'''
+Created December 20, 2025
+Updated December 21, 2025
+Author: Maya Sharma
+params: d_k points, triangles, mean_vertices and mode_vectors (M x V x 3), a ConvergenceController, optionally the
+        spatial index, correspondence cache and TriangleTable of the mesh, the starting R_reg, t_reg and lambdas,
+        max_iterations (the controller's by default) and a SampleSchedule (subsampling.py) reset for d_k
+Returns: R_reg, t_reg, lambdas, the deformed vertices and the closest triangle of every s_k (None if the last
+         iteration only used a subset)
+Summary: joint alternative to the lambda / F_reg alternation of solve_pa5. Every iteration does one closest point
+pass for s_k = F_reg d_k, takes one pose_and_mode_step against the point to plane residuals (the face normals
+of the deformed mesh are computed once per mesh update) and applies it to F_reg and lambda together.
+index and table must describe the mesh of the starting lambdas. With sampling the early steps are taken from a
+growing subset of the samples, the trimmed rows are left out of every step.
+'''
+@telemetry.timed("pa5.joint")
+def register_pose_and_modes(d_k_points, triangles, mean_vertices, mode_vectors, controller, index=None, cache=None,
+                            table=None, R_reg=None, t_reg=None, lambdas=None, max_iterations=None, sampling=None):
+    n_modes = len(mode_vectors)
+    R_reg = np.eye(3) if R_reg is None else R_reg
+    t_reg = np.zeros(3) if t_reg is None else t_reg
+    lambdas = np.zeros(n_modes) if lambdas is None else np.array(lambdas, dtype=float)
+    if max_iterations is None:
+        max_iterations = controller.max_iterations
+    deformed_vertices = deform_mesh(mean_vertices, mode_vectors, lambdas)
+    normals = face_normals(deformed_vertices, triangles)
+    triangle_indices = None
+
+    for iteration in range(max_iterations):
+        # early iterations may only look at a subset of the samples, the cache and warm start need all of them
+        subset = sampling is not None and not sampling.full
+        rows = sampling.draw() if subset else slice(None)
+
+        s_k_points = apply_transform(R_reg, t_reg, d_k_points[rows])
+        c_k_points, distances, tri, bary_coords = closest_points_on_mesh(
+            s_k_points, deformed_vertices, triangles, index=index, init_tri=None if subset else triangle_indices,
+            cache=None if subset else cache, table=table)
+        previous_tri = triangle_indices
+        if not subset:
+            triangle_indices = tri
+
+        # the samples with the largest residuals are left out of the step
+        keep = sampling.trim_mask(distances) if sampling is not None else slice(None)
+        s_k_kept, tri = s_k_points[keep], tri[keep]
+        A, _ = assemble_mode_system(s_k_kept, triangles, tri, bary_coords[keep], mean_vertices, mode_vectors)
+        w, dt, d_lambda, center = pose_and_mode_step(s_k_kept, normals[tri], s_k_kept - c_k_points[keep],
+                                                     A.reshape(len(s_k_kept), 3, n_modes))
+
+        # s -> R_step (s - center) + center + dt, applied on top of F_reg
+        R_step = rotation_from_vector(w)
+        R_reg = R_step @ R_reg
+        t_reg = R_step @ (t_reg - center) + center + dt
+
+        lambdas = lambdas + d_lambda
+        deformed_vertices += np.tensordot(d_lambda, mode_vectors, axes=1)
+        _update_mesh_index(index, table, deformed_vertices, lambdas)
+        normals = face_normals(deformed_vertices, triangles)
+
+        telemetry.record_iteration("pa5.joint", iteration + 1, None if subset else previous_tri, triangle_indices,
+                                   error=np.mean(distances), samples=len(distances), lambdas=lambdas,
+                                   delta_lambda=np.linalg.norm(d_lambda), rotation=np.linalg.norm(w),
+                                   translation=np.linalg.norm(dt))
+        stop = controller.check(np.mean(distances), **{'lambda': np.linalg.norm(d_lambda),
+                                                       'rotation': np.linalg.norm(w), 'translation': np.linalg.norm(dt)})
+        if sampling is not None:
+            stop = sampling.after_iteration(np.mean(distances), stop, controller)
+        if stop:
+            break
+
+    return R_reg, t_reg, lambdas, deformed_vertices, triangle_indices
+
+'''
+Created December 21, 2025
+Author: Maya Sharma
+params: d_k points, triangles, mean_vertices and mode_vectors (M x V x 3), a ConvergenceController, optionally the
+        spatial index, correspondence cache and TriangleTable of the mesh, the starting R_reg, t_reg and lambdas,
+        max_iterations (the controller's by default), chunk_size, regularization and a SampleSchedule
+        (subsampling.py) reset for d_k
+Returns: R_reg, t_reg, lambdas, the deformed vertices and the closest triangle of every d'_k (None if the last
+         iteration only used a subset)
+Summary: the alternating lambda / F_reg iterations of solve_pa5 against one mesh, split out of solve_pa5 so they
+can run on every level of a MeshPyramid. index and table must describe the mesh of the starting lambdas.
+With sampling the early lambda and F_reg estimates use a growing subset of the samples, the trimmed rows are
+left out of every estimate.
+'''
+@telemetry.timed("pa5.alternating")
+def register_modes_alternating(d_k_points, triangles, mean_vertices, mode_vectors, controller, index=None, cache=None,
+                               table=None, R_reg=None, t_reg=None, lambdas=None, max_iterations=None,
+                               chunk_size=4096, regularization=0.0, sampling=None):
+    R_reg = np.eye(3) if R_reg is None else R_reg
+    t_reg = np.zeros(3) if t_reg is None else t_reg
+    lambdas = np.zeros(len(mode_vectors)) if lambdas is None else np.array(lambdas, dtype=float)
+    if max_iterations is None:
+        max_iterations = controller.max_iterations
+    # the deformed mesh is kept up to date from the change in lambda
+    deformed_vertices = deform_mesh(mean_vertices, mode_vectors, lambdas)
+    # closest triangles from the last query, the search is warm started from them
+    triangle_indices = None
+
+    normal_eq = NormalEquationAccumulator(len(mode_vectors), regularization)
+    # optimization done iteratively here
+    for iteration in range(max_iterations):
+
+        # early iterations may only look at a subset of the samples, the cache and warm start need all of them
+        subset = sampling is not None and not sampling.full
+        samples = sampling.draw() if subset else slice(None)
+        # F_reg^-1 (F_reg d_k) is d_k again, so the correspondences are searched with the d_k themselves and
+        # F_reg only enters through the rigid step below
+        d_k_sampled = d_k_points[samples]
+
+        # find the closest points on the deformed mesh together with their barycentric coordinates
+        _, distances, tri, bary_coords = closest_points_on_mesh(d_k_sampled, deformed_vertices, triangles,
+                                                                index=index,
+                                                                init_tri=None if subset else triangle_indices,
+                                                                cache=None if subset else cache, table=table)
+        previous_tri = triangle_indices
+        if not subset:
+            triangle_indices = tri
+
+        # the samples with the largest residuals are left out of the estimates
+        keep = sampling.trim_mask(distances) if sampling is not None else slice(None)
+        d_k_kept, tri_kept, bary_kept = d_k_sampled[keep], tri[keep], bary_coords[keep]
+
+        # set up the linear system A times lamda is b, one block of samples at a time
+        normal_eq.reset()
+        for start in range(0, len(d_k_kept), chunk_size):
+            rows = slice(start, start + chunk_size)
+            A, b = assemble_mode_system(d_k_kept[rows], triangles, tri_kept[rows],
+                                        bary_kept[rows], mean_vertices, mode_vectors)
+            normal_eq.add(A, b)
+
+        # solve for the new lamdaas here      
+        lambda_new = normal_eq.solve()
+        lambda_new = controller.accelerate(lambdas, lambda_new)
+        lambda_step = np.linalg.norm(lambda_new - lambdas)
+
+        # update the registration, only the change in lambda is applied to the mesh
+        deformed_vertices += np.tensordot(lambda_new - lambdas, mode_vectors, axes=1)
+        lambdas = lambda_new
+
+           # find mk for Freg
+        _update_mesh_index(index, table, deformed_vertices, lambdas)
+        m_k_for_Freg, _, _, _ = closest_points_on_mesh(d_k_sampled, deformed_vertices, triangles,
+                                                       index=index, init_tri=tri,
+                                                       cache=None if subset else cache, table=table)
+
+
+        R_new, t_new = register_points(d_k_sampled[keep], m_k_for_Freg[keep])
+
+        # find the mean error after this iteration
+        s_k_new_final = apply_transform(R_new, t_new, d_k_sampled)
+        c_k_new_final = apply_transform(R_new, t_new, m_k_for_Freg)
+
+        mean_error = np.mean(np.linalg.norm(s_k_new_final - c_k_new_final, axis=1))
+
+        rotation_step = rotation_angle(R_new, R_reg)
+        translation_step = np.linalg.norm(t_new - t_reg)
+        R_reg = R_new
+        t_reg = t_new
+
+        telemetry.record_iteration("pa5", iteration + 1, None if subset else previous_tri, triangle_indices,
+                                   error=mean_error, samples=len(distances), lambdas=lambdas,
+                                   delta_lambda=lambda_step, rotation=rotation_step, translation=translation_step)
+        stop = controller.check(mean_error, **{'lambda': lambda_step, 'rotation': rotation_step,
+                                               'translation': translation_step})
+        if sampling is not None:
+            stop = sampling.after_iteration(mean_error, stop, controller)
+        if stop:
+            break
+
+    return R_reg, t_reg, lambdas, deformed_vertices, triangle_indices
+
+'''
+Created December 23, 2025
+Author: Maya Sharma
+params: output file, the name written in its header, s_k and c_k (N x 3) and lambdas
+Summary: writes the PA5 output format, a header line, the lambdas and one s_k, c_k, |s_k - c_k| line per sample
+'''
+@telemetry.timed("io.write_output")
+def write_pa5_output(output_file, output_name, s_k_points, c_k_points, lambdas):
+    with open(output_file, 'w') as f:
+        f.write(f"{len(s_k_points)} {output_name} {len(lambdas)}\n")
+        
+        for m in range(len(lambdas)):
+            f.write(f"{lambdas[m]:12.4f}")
+        f.write("\n")
+        
+        for s_k, c_k in zip(s_k_points, c_k_points):
+            err = np.linalg.norm(s_k - c_k)
+            
+            f.write(f"{s_k[0]:8.2f}{s_k[1]:9.2f}{s_k[2]:9.2f}   ")
+            f.write(f"{c_k[0]:8.2f}{c_k[1]:9.2f}{c_k[2]:9.2f}  ")
+            f.write(f"{err:8.3f}\n")
+
+'''
+Created December 20, 2025
+Author: Maya Sharma
+params: max_iters
+Returns: the ConvergenceController solve_pa5 uses when none is given
+Summary: the lambda updates shrink by a roughly constant factor each iteration, over-relaxing them converges in
+about half the iterations. The closest triangles change from step to step, which makes Anderson acceleration
+jump around on the noisier data sets, so it is not the default here.
+'''
+def default_pa5_controller(max_iters=50):
+    return ConvergenceController(max_iters, error_tol=0.001,
+                                 param_tol={'lambda': 1e-3, 'rotation': 1e-6, 'translation': 1e-4},
+                                 stagnation_window=8, stagnation_tol=1e-5,
+                                 acceleration='relaxation', relaxation=1.8)
 
 '''
 Created December 5, 2025
 Author: Maya Sharma
-params: bodyA_file bodyB_file mesh_file modes_file sample_readings_file output_file max_iters
+params: bodyA_file bodyB_file mesh_file modes_file sample_readings_file output_file max_iters, use_bvh, lambda_box, cache,
+        use_compiled, cache_dir, controller, solver, chunk_size, regularization, schedule, sampling, preloaded,
+        threads, frame_chunk, binary_samples
 Returns: s_k_final, c_k_final and, lambdas
 Summary: this function performs deformable registration as per PA5 requirements 
 Notes: it uses helper functions from utility functions pythin file and the ICP code as well. Also,
-         it limits the number of modes used based on the sample readings file.
+         it limits the number of modes used based on the sample readings file. The closest point queries go
+         through a TriangleBVH of the deformed mesh unless use_bvh=False, the tree is built once from the
+         mean shape and refit every time the mode weights change. If lambda_box is given, a ModeSpaceBVH valid
+         for every |lambda_m| <= lambda_box is built once instead and is only rebuilt if lambda leaves that box.
+         An optional CorrespondenceCache is shared by all closest point passes, they all query the same samples.
+         Without a BVH the brute force passes share one TriangleTable that is updated with every deformation.
+         The mesh, bodies and modes are memory mapped from compiled containers in cache_dir (see model_cache.py),
+         the text files are only parsed when there is no container for their contents yet or use_compiled=False.
+         The lambda updates and the stopping rule come from controller (convergence.py), default_pa5_controller
+         when none is given. Only lambda is accelerated, F_reg is registered to the mesh of the new lambda.
+         solver='joint' replaces the alternating lambda / F_reg steps with register_pose_and_modes, which needs one
+         closest point pass per iteration instead of three.
+         The lambda least squares problem is accumulated chunk_size samples at a time into a
+         NormalEquationAccumulator (Tikhonov term regularization), so A is never held for all samples.
+         schedule is an optional list of (level, iterations) pairs, for example [(2, 10), (1, 10)]: that many
+         iterations run on each level of a MeshPyramid of the mean shape, with the modes averaged onto the same
+         coarse vertices, before the full mesh refines F_reg and lambda with the controller's iterations.
+         sampling is an optional SampleSchedule (subsampling.py): the first iterations then estimate F_reg and
+         lambda from a growing subset of the samples, with the worst residuals trimmed.
+         preloaded is an optional dict of the input arrays (see load_inputs in batch_pa5.py), the mesh, body and
+         modes files are then not opened at all and every mode the dict holds is available. It may also hold an
+         "index", a TriangleBVH of the mean shape that is used instead of building one (pa5_server.py keeps it
+         resident). The solve deforms that index, so each call needs its own copy.
+         threads is an optional number of threads for the closest point queries, each query of the BVH or of the
+         brute force search (use_bvh=False) is split into chunks of samples that run on a thread pool of that
+         size. The answers do not depend on it.
+         The sample readings are parsed and turned into d_k frame_chunk frames at a time (from a compiled binary
+         copy with binary_samples=True), so the raw frames of a long capture are never in memory all at once.
 
 '''
 
+@telemetry.timed("solve_pa5")
 def solve_pa5(bodyA_file, bodyB_file, mesh_file, modes_file, 
-                      sample_readings_file, output_file, max_iters=50):
+                      sample_readings_file, output_file, max_iters=50, use_bvh=True, lambda_box=None,
+                      cache=None, use_compiled=True, cache_dir=None, controller=None, solver='alternating',
+                      chunk_size=4096, regularization=0.0, schedule=None, sampling=None, preloaded=None,
+                      threads=None, frame_chunk=4096, binary_samples=False):
     
     
     # read input files ihere
-    vertices, triangles, _ = read_mesh(mesh_file)
-    A_markers, A_tip = read_body(bodyA_file)
-    B_markers, B_tip = read_body(bodyB_file)
-    
-    frames, Ns, Nsamps, N_modes = read_sample_readings(sample_readings_file)
+    if preloaded is not None:
+        vertices, triangles, neighbours = preloaded["vertices"], preloaded["triangles"], preloaded["neighbours"]
+        A_markers, A_tip = preloaded["A_markers"], preloaded["A_tip"]
+        B_markers, B_tip = preloaded["B_markers"], preloaded["B_tip"]
+    elif use_compiled:
+        vertices, triangles, neighbours = load_mesh(mesh_file, cache_dir)
+        A_markers, A_tip = load_body(bodyA_file, cache_dir)
+        B_markers, B_tip = load_body(bodyB_file, cache_dir)
+    else:
+        vertices, triangles, neighbours = read_mesh(mesh_file)
+        A_markers, A_tip = read_body(bodyA_file)
+        B_markers, B_tip = read_body(bodyB_file)
+    
+    frame_chunks, Ns, Nsamps, N_modes = sample_chunks(sample_readings_file, frame_chunk, binary_samples, cache_dir)
     
     N_A = len(A_markers)
     N_B = len(B_markers)
     
     # read the modes files
-    mean_vertices, mode_vectors = read_modes_fixed(modes_file, N_modes)
-    
+    if preloaded is not None:
+        mean_vertices, mode_vectors = preloaded["mean_vertices"], preloaded["mode_vectors"][:N_modes]
+    elif use_compiled:
+        mean_vertices, mode_vectors = load_modes(modes_file, N_modes, cache_dir)
+    else:
+        mean_vertices, mode_vectors = read_modes_fixed(modes_file, N_modes)
     
-    d_k_points = []
     
-    for k in range(Nsamps):
-        # extract kth frame
-        frame = frames[k]
-        a_markers_tracker = frame[:N_A]
-        b_markers_tracker = frame[N_A:N_A+N_B]
-        
-        R_A, t_A = register_points(A_markers, a_markers_tracker)
-        R_B, t_B = register_points(B_markers, b_markers_tracker)
-        
-        R_B_inv, t_B_inv = apply_inverse_transform(R_B, t_B)
-        
-        A_tip_tracker = apply_transform(R_A, t_A, A_tip.reshape(1, -1))[0]
-        
-        d_k = apply_transform(R_B_inv, t_B_inv, A_tip_tracker.reshape(1, -1))[0]
-        d_k_points.append(d_k)
-    
-    d_k_points = np.array(d_k_points) 
+    d_k_points = pre_calculate_dks_chunked(A_markers, A_tip, B_markers, B_tip, frame_chunks, N_A, N_B)
     
+    if solver not in ('joint', 'alternating'):
+        raise ValueError(f"unknown solver '{solver}'")
+    register = register_pose_and_modes if solver == 'joint' else register_modes_alternating
+    options = {} if solver == 'joint' else {'chunk_size': chunk_size, 'regularization': regularization}
+    options['sampling'] = sampling
+
+    if controller is None:
+        controller = default_pa5_controller(max_iters)
+    if sampling is not None:
+        sampling.reset(d_k_points)
+
     R_reg = np.eye(3)
     t_reg = np.zeros(3)
     lambdas = np.zeros(N_modes)
-    
-    # optimization done iteratively here
-    for iteration in range(max_iters):
-        
-       
-        deformed_vertices = mean_vertices.copy()
-        for m in range(N_modes):
-            deformed_vertices += lambdas[m] * mode_vectors[m]
-        
-        R_reg_inv, t_reg_inv = apply_inverse_transform(R_reg, t_reg) 
 
-        s_k_points = apply_transform(R_reg, t_reg, d_k_points)
-        
-        d_prime_k_points = apply_transform(R_reg_inv, t_reg_inv, s_k_points) 
-        
-        bary_coords = []
-        triangle_indices = []
-        
-        for d_prime_k in d_prime_k_points:
-            # find the closest pint on the mesh that is deformed
-            m_k_on_deformed, _, tri_idx = closest_point_on_mesh(d_prime_k, deformed_vertices, triangles)
-            
-            v0_idx, v1_idx, v2_idx = triangles[tri_idx]
-            tri_verts_deformed = deformed_vertices[[v0_idx, v1_idx, v2_idx]] 
-            
-            zeta, xi, psi = compute_barycentric(m_k_on_deformed, tri_verts_deformed)
-            
-            bary_coords.append((zeta, xi, psi))
-            triangle_indices.append(tri_idx)
+    # the pool is shut down however the registration ends
+    pool = ThreadPoolExecutor(threads) if threads else None
+    try:
+        if schedule:
+            # the first iterations run on coarse copies of the mean shape and modes, F_reg and lambda carry over
+            pyramid = MeshPyramid(mean_vertices, triangles, n_levels=max(level for level, _ in schedule) + 1)
+            for level, level_iters in schedule:
+                level_mean, level_triangles = pyramid.mesh(level)
+                level_modes = pyramid.coarsen(mode_vectors, level)
+                level_vertices = deform_mesh(level_mean, level_modes, lambdas)
+                level_index = TriangleBVH(level_vertices, level_triangles) if use_bvh else None
+                level_table = TriangleTable(level_vertices, level_triangles) if level_index is None else None
+                if level_index is not None:
+                    level_index.pool = pool
+                else:
+                    level_table.pool = pool
+                controller.reset()
+                R_reg, t_reg, lambdas, _, _ = register(d_k_points, level_triangles, level_mean, level_modes, controller,
+                                                       index=level_index, table=level_table, R_reg=R_reg, t_reg=t_reg,
+                                                       lambdas=lambdas, max_iterations=level_iters, **options)
 
-        
-        A = np.zeros((3 * Nsamps, N_modes))
-        b = np.zeros(3 * Nsamps) 
-        
-        # set up the linear system A times lamda is b
-        for k in range(Nsamps):
-            d_prime_k = d_prime_k_points[k]
-            tri_idx = triangle_indices[k]
-            zeta, xi, psi = bary_coords[k]
-            v0_idx, v1_idx, v2_idx = triangles[tri_idx]
-
-            m0_v0, m0_v1, m0_v2 = mean_vertices[[v0_idx, v1_idx, v2_idx]]
-            q0_k = zeta * m0_v0 + xi * m0_v1 + psi * m0_v2
-            
-            b[3*k:3*k+3] = d_prime_k - q0_k
-            
-            for m in range(N_modes):
-                mv0, mv1, mv2 = mode_vectors[m][[v0_idx, v1_idx, v2_idx]]
-                a_mk = zeta * mv0 + xi * mv1 + psi * mv2 # q_m,k
-                A[3*k:3*k+3, m] = a_mk
-        
-        # solve for the new lamdaas here      
-        lambda_new, _, _, _ = np.linalg.lstsq(A, b, rcond=None)
-        lambdas = lambda_new
-        
-        # update the registration 
-        deformed_vertices_new = mean_vertices.copy()
-        for m in range(N_modes):
-            deformed_vertices_new += lambdas[m] * mode_vectors[m]
-        
-           # find mk for Freg
-        m_k_for_Freg = [] 
-        for d_prime_k in d_prime_k_points:
-            closest_pt_final, _, _ = closest_point_on_mesh(d_prime_k, deformed_vertices_new, triangles)
-            m_k_for_Freg.append(closest_pt_final)
-        m_k_for_Freg = np.array(m_k_for_Freg) 
-        
-       
-        R_new, t_new = register_points(d_k_points, m_k_for_Freg)
-        
-        # find the mean error after this iteration
-        s_k_new_final = apply_transform(R_new, t_new, d_k_points)
-        c_k_new_final = apply_transform(R_new, t_new, m_k_for_Freg)
-        
-        mean_error = np.mean(np.linalg.norm(s_k_new_final - c_k_new_final, axis=1))
+        # the full mesh starts from the lambdas the coarse levels found, all zero without a schedule
+        deformed_vertices = deform_mesh(mean_vertices, mode_vectors, lambdas)
+        index = None
+        if use_bvh and lambda_box is not None:
+            # the box is widened if the coarse levels already went past it
+            index = ModeSpaceBVH(mean_vertices, mode_vectors, triangles, np.minimum(-lambda_box, lambdas),
+                                 np.maximum(lambda_box, lambdas), lambdas=lambdas, neighbours=neighbours)
+        elif use_bvh and preloaded is not None and preloaded.get("index") is not None:
+            # a prebuilt index of the mean shape only has to follow the lambdas of the coarse levels
+            index = preloaded["index"]
+            if np.any(lambdas):
+                index.update(deformed_vertices)
+        elif use_bvh:
+            index = TriangleBVH(deformed_vertices, triangles, neighbours=neighbours)
+        # the BVH has its own triangle table, the brute force search gets one that is refreshed after each deformation
+        table = TriangleTable(deformed_vertices, triangles) if index is None else None
+        if index is not None:
+            index.pool = pool
+        else:
+            table.pool = pool
 
-        R_reg = R_new
-        t_reg = t_new
-        
-        
-        if mean_error < 0.001:
-            break
-    
+        controller.reset()
+        R_reg, t_reg, lambdas, deformed_vertices, triangle_indices = register(
+            d_k_points, triangles, mean_vertices, mode_vectors, controller, index=index, cache=cache, table=table,
+            R_reg=R_reg, t_reg=t_reg, lambdas=lambdas, **options)
 
-# get the final calcualtion for output 
-    final_deformed = mean_vertices.copy()
-    for m in range(N_modes):
-        final_deformed += lambdas[m] * mode_vectors[m]
-    
-    s_k_final = apply_transform(R_reg, t_reg, d_k_points)
-    
-    # find mk fro the final output
-    R_reg_inv_final, t_reg_inv_final = apply_inverse_transform(R_reg, t_reg)
-    s_k_final_B = apply_transform(R_reg_inv_final, t_reg_inv_final, s_k_final)
-    
-    m_k_final_B = []
-    for s_k_B in s_k_final_B:
-        closest_pt_B, _, _ = closest_point_on_mesh(s_k_B, final_deformed, triangles)
-        m_k_final_B.append(closest_pt_B)
-    m_k_final_B = np.array(m_k_final_B)
-    
-    c_k_final = apply_transform(R_reg, t_reg, m_k_final_B)
+        # get the final calcualtion for output, recomputed from scratch so no rounding from the updates is left
+        final_deformed = deform_mesh(mean_vertices, mode_vectors, lambdas)
+
+        s_k_final = apply_transform(R_reg, t_reg, d_k_points)
+
+        # find mk fro the final output
+        R_reg_inv_final, t_reg_inv_final = apply_inverse_transform(R_reg, t_reg)
+        s_k_final_B = apply_transform(R_reg_inv_final, t_reg_inv_final, s_k_final)
+
+        if solver == 'joint':
+            # the joint solve matched s_k against the mesh directly, so c_k is the closest mesh point of s_k
+            c_k_final, _, _, _ = closest_points_on_mesh(s_k_final, final_deformed, triangles, index=index,
+                                                        init_tri=triangle_indices, cache=cache)
+        else:
+            m_k_final_B, _, _, _ = closest_points_on_mesh(s_k_final_B, final_deformed, triangles, index=index,
+                                                          init_tri=triangle_indices, cache=cache)
+            c_k_final = apply_transform(R_reg, t_reg, m_k_final_B)
+    finally:
+        if pool is not None:
+            pool.shutdown()
 
     final_error = np.mean(np.linalg.norm(s_k_final - c_k_final, axis=1))
     
@@ -256,21 +522,7 @@ def solve_pa5(bodyA_file, bodyB_file, mesh_file, modes_file,
     
     output_name = "PA5-A-Debug-Answer.txt"
     
-    with open(output_file, 'w') as f:
-        f.write(f"{Nsamps} {output_name} {N_modes}\n")
-        
-        for m in range(N_modes):
-            f.write(f"{lambdas[m]:12.4f}")
-        f.write("\n")
-        
-        for k in range(Nsamps):
-            s_k = s_k_final[k]
-            c_k = c_k_final[k]
-            err = np.linalg.norm(s_k - c_k)
-            
-            f.write(f"{s_k[0]:8.2f}{s_k[1]:9.2f}{s_k[2]:9.2f}   ")
-            f.write(f"{c_k[0]:8.2f}{c_k[1]:9.2f}{c_k[2]:9.2f}  ")
-            f.write(f"{err:8.3f}\n")
+    write_pa5_output(output_file, output_name, s_k_final, c_k_final, lambdas)
     
     
     return s_k_final, c_k_final, lambdas
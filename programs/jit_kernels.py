@@ -0,0 +1,165 @@
+# jit_kernels.py has compiled versions of the closest point inner loops, used when numba is installed
+import os
+import multiprocessing
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# numba is installed, the kernels below are compiled
+available = numba is not None
+# closest_points_on_mesh and the spatial indexes use the kernels, PA5_JIT=0 keeps the numpy code instead
+enabled = available and os.environ.get("PA5_JIT", "1") != "0"
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+params: parallel=True to split the outer loop over the queries between numba's threads
+Returns: decorator that compiles a kernel with numba, or leaves it as a plain python function without numba
+Notes: error_model='numpy' gives inf / nan on a division by zero like the numpy code instead of raising, which
+       the degenerate triangles rely on. nogil lets the chunks of a TriangleBVH thread pool run at the same time.
+'''
+def _kernel(parallel=False):
+    if numba is None:
+        return lambda func: func
+    return numba.njit(cache=True, nogil=True, parallel=parallel, error_model='numpy')
+
+# the outer loop of a parallel kernel, range without numba
+prange = numba.prange if numba is not None else range
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+Returns: multiprocessing context for a ProcessPoolExecutor, None for the default one
+Summary: numba's worker threads do not survive a fork, a process forked after a parallel kernel ran hangs in its
+first one (or at exit). While the kernels are enabled the pools of batch_pa5 and voxel_grid start their workers
+from a forkserver instead.
+'''
+def process_context():
+    return multiprocessing.get_context("forkserver") if enabled else None
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+params: the six dot products d1..d6 of closest_point_on_triangle and the inverse Gram determinant of the triangle
+Returns: barycentric v, w of the closest point A + v AB + w AC
+Summary: the region tests of closest_point_on_triangle in the same order, the first region that matches wins
+'''
+@_kernel()
+def _region(d1, d2, d3, d4, d5, d6, inv_denom):
+    if d1 <= 0.0 and d2 <= 0.0:
+        return 0.0, 0.0
+    if d3 >= 0.0 and d4 <= d3:
+        return 1.0, 0.0
+    if d6 >= 0.0 and d5 <= d6:
+        return 0.0, 1.0
+    vc = d1 * d4 - d3 * d2
+    if vc <= 0.0 and d1 >= 0.0 and d3 <= 0.0:
+        return d1 / (d1 - d3), 0.0
+    vb = d5 * d2 - d1 * d6
+    if vb <= 0.0 and d2 >= 0.0 and d6 <= 0.0:
+        return 0.0, d2 / (d2 - d6)
+    va = d3 * d6 - d5 * d4
+    if va <= 0.0 and (d4 - d3) >= 0.0 and (d5 - d6) >= 0.0:
+        t = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        return 1.0 - t, t
+    return vb * inv_denom, vc * inv_denom
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+params: query point p0, p1, p2 (shifted to the table origin), triangle t and the TriangleTable columns
+Returns: v, w and the squared distance of the closest point on triangle t, nan for a degenerate triangle whose
+         closest point is inside
+'''
+@_kernel()
+def _closest_on_triangle(p0, p1, p2, t, A, AB, AC, AB_AB, AB_AC, AC_AC, inv_denom):
+    ap0 = p0 - A[t, 0]
+    ap1 = p1 - A[t, 1]
+    ap2 = p2 - A[t, 2]
+    d1 = AB[t, 0] * ap0 + AB[t, 1] * ap1 + AB[t, 2] * ap2
+    d2 = AC[t, 0] * ap0 + AC[t, 1] * ap1 + AC[t, 2] * ap2
+    # BP = AP - AB and CP = AP - AC, so d3..d6 follow from d1, d2
+    v, w = _region(d1, d2, d1 - AB_AB[t], d2 - AB_AC[t], d1 - AB_AC[t], d2 - AC_AC[t], inv_denom[t])
+    e0 = ap0 - v * AB[t, 0] - w * AC[t, 0]
+    e1 = ap1 - v * AB[t, 1] - w * AC[t, 1]
+    e2 = ap2 - v * AB[t, 2] - w * AC[t, 2]
+    return v, w, e0 * e0 + e1 * e1 + e2 * e2
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+params: query points (Q x 3) shifted to the table origin, the TriangleTable columns and the (Q,) output arrays
+Summary: fused brute force search, every query loops over every triangle and keeps the nearest one. The strict
+comparison keeps the first triangle on ties like closest_point_on_mesh. The queries are independent, so the outer
+loop runs in parallel.
+'''
+@_kernel(parallel=True)
+def _closest_all(P, A, AB, AC, AB_AB, AB_AC, AC_AC, inv_denom, best_idx, best_v, best_w, best_sq):
+    for i in prange(P.shape[0]):
+        best = np.inf
+        for t in range(A.shape[0]):
+            v, w, sq = _closest_on_triangle(P[i, 0], P[i, 1], P[i, 2], t, A, AB, AC, AB_AB, AB_AC, AC_AC,
+                                            inv_denom)
+            if sq < best:
+                best = sq
+                best_idx[i] = t
+                best_v[i] = v
+                best_w[i] = w
+        best_sq[i] = best
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+params: query points (N x 3) shifted to the table origin, the columns of a table with one row per query and the
+        (N,) output arrays
+Summary: closest point of query i on triangle i. It runs inside the thread pool chunks of the spatial indexes, so
+it is not parallel itself.
+'''
+@_kernel()
+def _closest_pairs(P, A, AB, AC, AB_AB, AB_AC, AC_AC, inv_denom, out_v, out_w, out_sq):
+    for i in range(P.shape[0]):
+        v, w, sq = _closest_on_triangle(P[i, 0], P[i, 1], P[i, 2], i, A, AB, AC, AB_AB, AB_AC, AC_AC, inv_denom)
+        out_v[i] = v
+        out_w[i] = w
+        out_sq[i] = np.inf if np.isnan(sq) else sq
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+params: table
+Returns: the table columns the kernels take, as contiguous float arrays
+'''
+def _columns(table):
+    return [np.ascontiguousarray(getattr(table, name), dtype=float)
+            for name in ('A', 'AB', 'AC', 'AB_AB', 'AB_AC', 'AC_AC', 'inv_denom')]
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+params: query points (Q x 3) shifted to the table origin and the TriangleTable of the mesh
+Returns: index of the closest triangle and barycentric v, w per query, for _closest_point_results
+'''
+def closest_points_all(P, table):
+    P = np.ascontiguousarray(P, dtype=float)
+    best_idx = np.zeros(len(P), dtype=np.int64)
+    best_v, best_w, best_sq = np.zeros(len(P)), np.zeros(len(P)), np.zeros(len(P))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        _closest_all(P, *_columns(table), best_idx, best_v, best_w, best_sq)
+    return best_idx, best_v, best_w
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+params: query points (N x 3) shifted to the table origin and a TriangleTable with one row per query
+Returns: barycentric v, w (N,) and squared distances (N,), inf where a degenerate triangle has no closest
+         point, like _closest_points_pairs
+'''
+def closest_points_pairs(P, table):
+    P = np.ascontiguousarray(P, dtype=float)
+    out_v, out_w, out_sq = np.zeros(len(P)), np.zeros(len(P)), np.zeros(len(P))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        _closest_pairs(P, *_columns(table), out_v, out_w, out_sq)
+    return out_v, out_w, out_sq
@@ -0,0 +1,499 @@
+# mesh_bvh.py has the bounding volume hierarchy used to speed up closest point queries on a mesh
+import numpy as np
+from utility_functions import triangle_adjacency
+from ICP_algo import TriangleTable, _closest_points_pairs, _closest_point_results
+
+'''
+Created on December 13, 2025
+Author: Maya Sharma
+Parameters: points (N x 3) and the lower and upper corners of the boxes (N x 3 or 3,)
+Returns: squared distance from each point to its box, zero when the point is inside
+Summary: lower bound used to prune the tree, no triangle inside a box can be closer than the box itself
+'''
+def box_sq_distance(points, lo, hi):
+    d = np.maximum(lo - points, 0.0) + np.maximum(points - hi, 0.0)
+    return np.einsum('ij,ij->i', d, d)
+
+'''
+Created on December 13, 2025
+Author: Maya Sharma
+Parameters: points (N x 3), optional lower and upper corners of the region to quantize over
+Returns: 30 bit Morton (z-order) code for each point
+Summary: quantizes every coordinate to 10 bits and interleaves the bits, so that points that are close
+in space get close codes
+'''
+def morton_codes(points, lo=None, hi=None):
+    points = np.asarray(points, dtype=float)
+    if lo is None:
+        lo = points.min(axis=0)
+    if hi is None:
+        hi = points.max(axis=0)
+
+    extent = np.maximum(hi - lo, 1e-12)
+    q = np.clip((points - lo) / extent * 1023.0, 0, 1023).astype(np.uint64)
+
+    # spread the 10 bits of each coordinate out so there are two zero bits between them
+    q = (q | (q << np.uint64(16))) & np.uint64(0x030000FF)
+    q = (q | (q << np.uint64(8))) & np.uint64(0x0300F00F)
+    q = (q | (q << np.uint64(4))) & np.uint64(0x030C30C3)
+    q = (q | (q << np.uint64(2))) & np.uint64(0x09249249)
+
+    return (q[:, 0] << np.uint64(2)) | (q[:, 1] << np.uint64(1)) | q[:, 2]
+
+'''
+Created on December 13, 2025
+Author: Maya Sharma
+Parameters: points (N x 3), optional lower and upper corners
+Returns: permutation that sorts the points in Morton order
+'''
+def morton_order(points, lo=None, hi=None):
+    return np.argsort(morton_codes(points, lo, hi), kind='stable')
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+Parameters: thread pool (concurrent.futures executor) or None, function of one chunk and the list of chunks
+Returns: the result of every chunk, in the order of the chunks
+Summary: runs the chunks of a query on the pool, or one after the other without a pool. The chunks never depend
+on the number of threads, so the answers are the same however many threads there are.
+'''
+def map_chunks(pool, func, chunks):
+    if pool is None or len(chunks) < 2:
+        return [func(chunk) for chunk in chunks]
+    return list(pool.map(func, chunks))
+
+'''
+Created on December 13, 2025
+Author: Maya Sharma
+Summary: bounding volume hierarchy of axis aligned boxes over the triangles of a mesh.
+The tree is built once by splitting the triangle centroids at the median of the longest axis and is
+stored as flat arrays, children always have larger node ids than their parent. Queries do a
+branch and bound search that skips every node whose box is further away than the best triangle found
+so far. All queries of a chunk are traversed together one tree level at a time, as arrays of
+(query, node) pairs, so the Python overhead grows with the tree depth and not with the number of queries.
+Chunks are taken in Morton order so that the queries of a chunk are close together and share most nodes.
+When the vertices move but the connectivity stays the same (deformed meshes) the boxes can be refit
+bottom up in O(T) with update(), which keeps the tree topology and only rebuilds once the boxes have
+grown too much compared to the freshly built tree.
+Queries can be warm started from a triangle per query (usually the answer of the previous ICP iteration).
+The query then walks over the triangle adjacency to a local optimum and uses its distance as the upper
+bound of the search, so only nodes within that distance are opened to confirm the answer.
+If pool is set to a thread pool, the chunks of a query (at most thread_chunk_size queries each) run on its
+threads. The work of a chunk is NumPy kernels over whole arrays, which release the GIL while they run.
+'''
+class TriangleBVH:
+
+    # queries per chunk when the chunks run on a thread pool, small enough to give every thread work
+    thread_chunk_size = 512
+
+    def __init__(self, vertices, triangles, leaf_size=8, rebuild_ratio=1.5, neighbours=None):
+        self.vertices = np.asarray(vertices, dtype=float)
+        self.triangles = np.asarray(triangles)
+        self.adjacency = triangle_adjacency(self.triangles, neighbours)
+        self.leaf_size = leaf_size
+        self.rebuild_ratio = rebuild_ratio
+        self.n_refits = 0
+        self.n_rebuilds = 0
+        self.pool = None
+        self._build()
+
+    '''
+    Summary: builds the tree topology and the node boxes from self.vertices. Boxes and triangle data
+    are kept relative to the mesh centroid like in closest_points_on_mesh.
+    '''
+    def _build(self):
+        self.origin = self.vertices.mean(axis=0)
+        vert_lo, vert_hi = self._vertex_bounds()
+        tri_lo = vert_lo[self.triangles].min(axis=1)
+        tri_hi = vert_hi[self.triangles].max(axis=1)
+        centroids = (self.vertices - self.origin)[self.triangles].mean(axis=1)
+
+        order = np.arange(len(self.triangles))
+        lo, hi, left, right, start, count, depth = [], [], [], [], [], [], []
+
+        def new_node(s, e, d):
+            idx = order[s:e]
+            lo.append(tri_lo[idx].min(axis=0))
+            hi.append(tri_hi[idx].max(axis=0))
+            left.append(-1)
+            right.append(-1)
+            start.append(s)
+            count.append(e - s)
+            depth.append(d)
+            return len(lo) - 1
+
+        stack = [new_node(0, len(order), 0)]
+        while stack:
+            node = stack.pop()
+            s, c = start[node], count[node]
+            if c <= self.leaf_size:
+                continue
+
+            # median split on the longest axis of the centroids
+            idx = order[s:s + c]
+            axis = np.argmax(np.ptp(centroids[idx], axis=0))
+            half = c // 2
+            part = np.argpartition(centroids[idx, axis], half)
+            order[s:s + c] = idx[part]
+
+            left[node] = new_node(s, s + half, depth[node] + 1)
+            right[node] = new_node(s + half, s + c, depth[node] + 1)
+            stack.extend([left[node], right[node]])
+
+        self.order = order
+        self._pos = np.argsort(order)
+        adjacency = self.adjacency[order]
+        self._adj_pos = np.where(adjacency >= 0, self._pos[np.maximum(adjacency, 0)], -1)
+        self.node_lo = np.array(lo)
+        self.node_hi = np.array(hi)
+        self.node_left = np.array(left)
+        self.node_right = np.array(right)
+        self.node_start = np.array(start)
+        self.node_count = np.array(count)
+
+        # internal nodes grouped by depth, deepest first, and leaves sorted by their first triangle
+        # so that refit can update one whole level at a time
+        depth = np.array(depth)
+        internal = np.nonzero(self.node_left >= 0)[0]
+        self._levels = [internal[depth[internal] == d] for d in range(depth.max(), -1, -1)]
+        leaves = np.nonzero(self.node_left < 0)[0]
+        self._leaves = leaves[np.argsort(self.node_start[leaves])]
+
+        self._update_triangle_data()
+        self.built_quality = self.quality()
+
+    '''
+    Summary: rebuilds the TriangleTable of the triangles in tree order so that each leaf is a contiguous slice
+    '''
+    def _update_triangle_data(self):
+        self._table = TriangleTable(self.vertices, self.triangles[self.order], origin=self.origin)
+
+    '''
+    Returns: lower and upper corner of the region each vertex can be in, relative to the origin
+    Summary: for a fixed mesh this is just the vertex itself
+    '''
+    def _vertex_bounds(self):
+        shifted = self.vertices - self.origin
+        return shifted, shifted
+
+    '''
+    Returns: sum of the surface areas of all node boxes relative to the root box
+    Summary: surface area heuristic, it is proportional to the expected number of nodes a query has to
+    open, so it grows when refitting makes the boxes overlap more
+    '''
+    def quality(self):
+        ext = self.node_hi - self.node_lo
+        area = ext[:, 0] * ext[:, 1] + ext[:, 1] * ext[:, 2] + ext[:, 2] * ext[:, 0]
+        return area.sum() / max(area[0], 1e-12)
+
+    '''
+    Parameters: new vertex array (V x 3) with the same triangles as the tree was built with
+    Summary: recomputes the leaf boxes from the new vertices and then the internal boxes level by level,
+    children before parents, without changing the topology
+    '''
+    def refit(self, vertices):
+        self.vertices = np.asarray(vertices, dtype=float)
+        tri_verts = (self.vertices - self.origin)[self.triangles[self.order]]
+        tri_lo = tri_verts.min(axis=1)
+        tri_hi = tri_verts.max(axis=1)
+
+        # leaves cover the tree order in contiguous ranges, so one reduceat handles all of them
+        starts = self.node_start[self._leaves]
+        self.node_lo[self._leaves] = np.minimum.reduceat(tri_lo, starts, axis=0)
+        self.node_hi[self._leaves] = np.maximum.reduceat(tri_hi, starts, axis=0)
+
+        for level in self._levels:
+            left = self.node_left[level]
+            right = self.node_right[level]
+            self.node_lo[level] = np.minimum(self.node_lo[left], self.node_lo[right])
+            self.node_hi[level] = np.maximum(self.node_hi[left], self.node_hi[right])
+
+        self._update_triangle_data()
+        self.n_refits += 1
+
+    '''
+    Parameters: new vertex array (V x 3)
+    Returns: True if the tree was rebuilt, False if a refit was enough
+    Summary: refits the tree to the new vertices and falls back to a full rebuild when the quality
+    has degraded by more than rebuild_ratio compared to the last build
+    '''
+    def update(self, vertices):
+        self.refit(vertices)
+        if self.quality() > self.rebuild_ratio * self.built_quality:
+            self._build()
+            self.n_rebuilds += 1
+            return True
+        return False
+
+    '''
+    Parameters: query points (Q x 3), presorted=True if the points are already in Morton order,
+                number of queries that are traversed together, optional starting triangle per query for
+                a warm start and the maximum number of steps of the adjacency walk
+    Returns: closest points (Q x 3), distances (Q,), triangle indices (Q,) and barycentric coordinates (Q x 3),
+             the same as closest_points_on_mesh
+    '''
+    def query(self, points, presorted=False, chunk_size=4096, init_tri=None, max_walk_steps=32):
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        P = points - self.origin
+        n_points = len(P)
+
+        best_sq = np.full(n_points, np.inf)
+        best_pos = np.zeros(n_points, dtype=int)
+        best_v = np.zeros(n_points)
+        best_w = np.zeros(n_points)
+
+        perm = np.arange(n_points) if presorted else morton_order(P)
+        seed_pos = None if init_tri is None else self._pos[np.asarray(init_tri)]
+        if self.pool is not None:
+            chunk_size = min(chunk_size, self.thread_chunk_size)
+
+        def search(chunk):
+            if seed_pos is None:
+                return self._query_chunk(P[chunk])
+            return self._query_chunk(P[chunk], self._walk(P[chunk], seed_pos[chunk], max_walk_steps))
+
+        chunks = [perm[c_start:c_start + chunk_size] for c_start in range(0, n_points, chunk_size)]
+        for chunk, best in zip(chunks, map_chunks(self.pool, search, chunks)):
+            best_sq[chunk], best_pos[chunk], best_v[chunk], best_w[chunk] = best
+
+        closest, distances, _, bary = _closest_point_results(points, self._table, best_pos, best_v, best_w)
+        return closest, distances, self.order[best_pos], bary
+
+    '''
+    Parameters: shifted query points, tree order position of the starting triangle per query, max steps
+    Returns: best squared distance, position and v, w per query after the walk
+    Summary: moves every query to the neighbouring triangle that is closer until none of the neighbours
+    is, all queries that are still moving take one step together
+    '''
+    def _walk(self, P, pos, max_steps):
+        pos = pos.copy()
+        v, w, sq_dist = _closest_points_pairs(P, self._table[pos])
+
+        moving = np.arange(len(P))
+        for _ in range(max_steps):
+            nb = self._adj_pos[pos[moving]]
+            valid = nb >= 0
+            rows = np.broadcast_to(moving[:, None], nb.shape)[valid]
+            cand = nb[valid]
+
+            nv, nw, nsq = _closest_points_pairs(P[rows], self._table[cand])
+            cand_sq = np.full(nb.shape, np.inf)
+            cand_sq[valid] = nsq
+            cand_v = np.zeros(nb.shape)
+            cand_v[valid] = nv
+            cand_w = np.zeros(nb.shape)
+            cand_w[valid] = nw
+
+            step = np.argmin(cand_sq, axis=1)
+            k = np.arange(len(moving))
+            better = cand_sq[k, step] < sq_dist[moving]
+            if not better.any():
+                break
+
+            moved = moving[better]
+            k, step = k[better], step[better]
+            pos[moved] = nb[k, step]
+            sq_dist[moved] = cand_sq[k, step]
+            v[moved] = cand_v[k, step]
+            w[moved] = cand_w[k, step]
+            moving = moved
+
+        return sq_dist, pos, v, w
+
+    '''
+    Parameters: shifted query points of one chunk, optional starting best from a warm start walk
+    Returns: best squared distance, tree order position of the best triangle and its v, w per query
+    Summary: without a warm start every query first walks down to the leaf with the nearest box to get an
+    upper bound. Then the tree is searched level by level keeping only the (query, node) pairs whose box
+    is closer than the current best.
+    '''
+    def _query_chunk(self, P, best=None):
+        n = len(P)
+        queries = np.arange(n)
+
+        if best is None:
+            best = (np.full(n, np.inf), np.zeros(n, dtype=int), np.zeros(n), np.zeros(n))
+
+            # greedy descent for the initial upper bound
+            node = np.zeros(n, dtype=int)
+            internal = self.node_left[node] >= 0
+            while internal.any():
+                q = queries[internal]
+                left = self.node_left[node[q]]
+                right = self.node_right[node[q]]
+                lb_left = box_sq_distance(P[q], self.node_lo[left], self.node_hi[left])
+                lb_right = box_sq_distance(P[q], self.node_lo[right], self.node_hi[right])
+                node[q] = np.where(lb_left <= lb_right, left, right)
+                internal = self.node_left[node] >= 0
+            seed_leaf = node
+            self._test_leaves(P, queries, seed_leaf, best)
+        else:
+            # the walk only checked single triangles, every leaf still has to be tested
+            seed_leaf = np.full(n, -1)
+
+        # branch and bound over the whole tree
+        q = queries
+        node = np.zeros(n, dtype=int)
+        while len(q):
+            lb = box_sq_distance(P[q], self.node_lo[node], self.node_hi[node])
+            keep = lb < best[0][q]
+            q, node = q[keep], node[keep]
+
+            leaf = self.node_left[node] < 0
+            test = leaf & (node != seed_leaf[q])
+            if test.any():
+                self._test_leaves(P, q[test], node[test], best)
+
+            q, node = q[~leaf], node[~leaf]
+            q = np.concatenate([q, q])
+            node = np.concatenate([self.node_left[node], self.node_right[node]])
+
+        return best
+
+    '''
+    Parameters: query points (Q x 3) and a search radius per query (Q,)
+    Returns: query index, triangle index and squared distance of every (query, triangle) pair that is
+             within the radius
+    Summary: same level by level traversal as query but with a fixed bound, nothing is pruned by the
+    triangles found along the way
+    '''
+    def query_radius(self, points, radii):
+        P = np.atleast_2d(np.asarray(points, dtype=float)) - self.origin
+        r_sq = np.broadcast_to(np.asarray(radii, dtype=float) ** 2, len(P))
+
+        found_q, found_pos, found_sq = [], [], []
+        q = np.arange(len(P))
+        node = np.zeros(len(P), dtype=int)
+        while len(q):
+            lb = box_sq_distance(P[q], self.node_lo[node], self.node_hi[node])
+            keep = lb <= r_sq[q]
+            q, node = q[keep], node[keep]
+
+            leaf = self.node_left[node] < 0
+            if leaf.any():
+                slots = np.arange(self.leaf_size)
+                pos = self.node_start[node[leaf]][:, None] + slots
+                valid = slots < self.node_count[node[leaf]][:, None]
+                qq = np.broadcast_to(q[leaf][:, None], pos.shape)[valid]
+                pos = pos[valid]
+
+                _, _, sq_dist = _closest_points_pairs(P[qq], self._table[pos])
+                inside = sq_dist <= r_sq[qq]
+                found_q.append(qq[inside])
+                found_pos.append(pos[inside])
+                found_sq.append(sq_dist[inside])
+
+            q, node = q[~leaf], node[~leaf]
+            q = np.concatenate([q, q])
+            node = np.concatenate([self.node_left[node], self.node_right[node]])
+
+        if not found_q:
+            return np.zeros(0, dtype=int), np.zeros(0, dtype=int), np.zeros(0)
+        return np.concatenate(found_q), self.order[np.concatenate(found_pos)], np.concatenate(found_sq)
+
+    '''
+    Parameters: shifted query points, (query, leaf) pairs and the best arrays of the chunk
+    Summary: tests every triangle of each leaf against its query and keeps the closest per query
+    '''
+    def _test_leaves(self, P, q, leaves, best):
+        best_sq, best_pos, best_v, best_w = best
+
+        slots = np.arange(self.leaf_size)
+        pos = self.node_start[leaves][:, None] + slots
+        valid = slots < self.node_count[leaves][:, None]
+        qq = np.broadcast_to(q[:, None], pos.shape)[valid]
+
+        v = np.zeros(pos.shape)
+        w = np.zeros(pos.shape)
+        sq_dist = np.full(pos.shape, np.inf)
+        p = pos[valid]
+        v[valid], w[valid], sq_dist[valid] = _closest_points_pairs(P[qq], self._table[p])
+
+        # closest triangle in each leaf first, then the closest leaf per query
+        # (ties go to the first triangle in tree order)
+        rows = np.arange(len(q))
+        slot = np.argmin(sq_dist, axis=1)
+        pos, v, w, sq_dist = pos[rows, slot], v[rows, slot], w[rows, slot], sq_dist[rows, slot]
+
+        order = np.lexsort((pos, sq_dist, q))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = q[order[1:]] != q[order[:-1]]
+        win = order[first]
+
+        better = sq_dist[win] < best_sq[q[win]]
+        win = win[better]
+        sel = q[win]
+        best_sq[sel] = sq_dist[win]
+        best_pos[sel] = pos[win]
+        best_v[sel] = v[win]
+        best_w[sel] = w[win]
+
+
+'''
+Created on December 14, 2025
+Author: Maya Sharma
+Summary: BVH for a statistical shape model, vertices = mean + sum_m lambda_m * mode_m.
+The deformed vertices are affine in lambda, so for a box lambda_lo <= lambda <= lambda_hi every vertex
+stays inside mean + sum_m [min, max](lambda_lo_m * mode_m, lambda_hi_m * mode_m). The node boxes are built
+from these ranges, so they are valid for every lambda in the box and set_lambdas only has to update the
+triangle data used for the exact tests. The tree is rebuilt only when lambda leaves the box.
+'''
+class ModeSpaceBVH(TriangleBVH):
+
+    def __init__(self, mean_vertices, modes, triangles, lambda_lo, lambda_hi, lambdas=None, leaf_size=8,
+                 neighbours=None):
+        self.mean_vertices = np.asarray(mean_vertices, dtype=float)
+        self.modes = np.asarray(modes, dtype=float).reshape(-1, len(self.mean_vertices), 3)
+        n_modes = len(self.modes)
+        self.lambda_lo = np.broadcast_to(np.asarray(lambda_lo, dtype=float), n_modes).copy()
+        self.lambda_hi = np.broadcast_to(np.asarray(lambda_hi, dtype=float), n_modes).copy()
+
+        if lambdas is None:
+            lambdas = np.clip(np.zeros(n_modes), self.lambda_lo, self.lambda_hi)
+        self.lambdas = np.asarray(lambdas, dtype=float)
+
+        super().__init__(self._deform(self.lambdas), triangles, leaf_size=leaf_size, neighbours=neighbours)
+
+    '''
+    Returns: deformed vertices (V x 3) for the given mode weights
+    '''
+    def _deform(self, lambdas):
+        return self.mean_vertices + np.tensordot(lambdas, self.modes, axes=1)
+
+    '''
+    Summary: widest region every vertex can reach for lambda anywhere in the box
+    '''
+    def _vertex_bounds(self):
+        at_lo = self.lambda_lo[:, None, None] * self.modes
+        at_hi = self.lambda_hi[:, None, None] * self.modes
+        base = self.mean_vertices - self.origin
+        return base + np.minimum(at_lo, at_hi).sum(axis=0), base + np.maximum(at_lo, at_hi).sum(axis=0)
+
+    '''
+    Parameters: mode weights
+    Returns: True if the weights are inside the box the tree was built for
+    '''
+    def contains(self, lambdas):
+        return bool(np.all(lambdas >= self.lambda_lo) and np.all(lambdas <= self.lambda_hi))
+
+    '''
+    Parameters: new mode weights
+    Returns: True if the tree had to be rebuilt
+    Summary: moves the mesh to the new weights. Inside the box only the triangle data changes, outside
+    the box is re-centered on the new weights with twice the width (at least |lambda| on each side)
+    and the tree is rebuilt.
+    '''
+    def set_lambdas(self, lambdas):
+        self.lambdas = np.asarray(lambdas, dtype=float)
+        self.vertices = self._deform(self.lambdas)
+
+        if self.contains(self.lambdas):
+            self._update_triangle_data()
+            return False
+
+        width = np.maximum(self.lambda_hi - self.lambda_lo, np.abs(self.lambdas))
+        self.lambda_lo = self.lambdas - width
+        self.lambda_hi = self.lambdas + width
+        self._build()
+        self.n_rebuilds += 1
+        return True
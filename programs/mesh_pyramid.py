@@ -0,0 +1,168 @@
+# mesh_pyramid.py builds coarser versions of a mesh for coarse to fine registration
+import heapq
+import numpy as np
+
+'''
+Created on December 21, 2025
+Author: Maya Sharma
+params: vertices (V x 3), triangles (T x 3) and the triangle counts to stop at, largest first
+Returns: one (labels, triangles) pair per target. labels (V,) gives the coarse vertex every original vertex was
+         merged into and triangles index the coarse vertices.
+Summary: greedy edge collapse decimation. The shortest edge is collapsed first and the merged vertex is placed at
+the mean of all original vertices it stands for, so every coarse vertex is a fixed average of original vertices
+and anything defined per vertex (positions, mode vectors) can be resampled the same way. A collapse is skipped
+if it would flip a triangle or make the surface non-manifold (the two end points may only share the vertices
+opposite the edge).
+'''
+def decimate_mesh(vertices, triangles, targets):
+    vertices = np.asarray(vertices, dtype=float)
+    triangles = np.asarray(triangles)
+
+    # the inner loop works on single vertices, plain Python floats are much faster than numpy for that
+    parent = np.arange(len(vertices))
+    sums = vertices.tolist()
+    counts = [1] * len(vertices)
+    pos = vertices.tolist()
+    version = [0] * len(vertices)
+
+    tri = [list(t) for t in triangles.tolist()]
+    alive = np.ones(len(tri), dtype=bool)
+    n_alive = len(tri)
+    incident = [set() for _ in range(len(vertices))]
+    for t, (a, b, c) in enumerate(tri):
+        incident[a].add(t)
+        incident[b].add(t)
+        incident[c].add(t)
+
+    def neighbours(v):
+        return {u for t in incident[v] for u in tri[t]} - {v}
+
+    def normal(t, moved=None, to=None):
+        (x0, y0, z0), (x1, y1, z1), (x2, y2, z2) = [to if u == moved else pos[u] for u in tri[t]]
+        ux, uy, uz = x1 - x0, y1 - y0, z1 - z0
+        vx, vy, vz = x2 - x0, y2 - y0, z2 - z0
+        return (uy * vz - uz * vy, uz * vx - ux * vz, ux * vy - uy * vx)
+
+    def sq_length(u, v):
+        (x0, y0, z0), (x1, y1, z1) = pos[u], pos[v]
+        return (x1 - x0) ** 2 + (y1 - y0) ** 2 + (z1 - z0) ** 2
+
+    heap = []
+
+    def push_edges(v):
+        for u in neighbours(v):
+            heapq.heappush(heap, (sq_length(u, v), v, u, version[v], version[u]))
+
+    # every edge once to start with
+    for a, b, c in tri:
+        for u, v in ((a, b), (b, c), (c, a)):
+            heap.append((sq_length(u, v), u, v, 0, 0))
+    heapq.heapify(heap)
+
+    results = []
+    for target in sorted(targets, reverse=True):
+        while n_alive > target and heap:
+            _, a, b, va, vb = heapq.heappop(heap)
+            if version[a] != va or version[b] != vb or parent[a] != a or parent[b] != b:
+                continue
+
+            shared = incident[a] & incident[b]
+            opposite = {u for t in shared for u in tri[t]} - {a, b}
+            if neighbours(a) & neighbours(b) != opposite:
+                continue
+
+            n = counts[a] + counts[b]
+            merged = [sa + sb for sa, sb in zip(sums[a], sums[b])]
+            new_pos = [x / n for x in merged]
+            flips = False
+            for v, others in ((a, incident[a] - shared), (b, incident[b] - shared)):
+                for t in others:
+                    n0, n1 = normal(t), normal(t, v, new_pos)
+                    if n0[0] * n1[0] + n0[1] * n1[1] + n0[2] * n1[2] <= 0.0:
+                        flips = True
+                        break
+                if flips:
+                    break
+            if flips:
+                continue
+
+            # merge b into a
+            for t in shared:
+                alive[t] = False
+                n_alive -= 1
+                for u in tri[t]:
+                    incident[u].discard(t)
+            for t in incident[b]:
+                tri[t] = [a if u == b else u for u in tri[t]]
+                incident[a].add(t)
+            incident[b] = set()
+            parent[b] = a
+            sums[a] = merged
+            counts[a] = n
+            pos[a] = new_pos
+            version[a] += 1
+            push_edges(a)
+
+        # every original vertex follows its parents to the vertex it is merged into now
+        roots = parent.copy()
+        while True:
+            next_roots = parent[roots]
+            if np.array_equal(next_roots, roots):
+                break
+            roots = next_roots
+        kept, labels = np.unique(roots, return_inverse=True)
+        level_triangles = np.searchsorted(kept, np.array([tri[t] for t in np.nonzero(alive)[0]]).reshape(-1, 3))
+        results.append((labels, level_triangles))
+
+    return results
+
+'''
+Created on December 21, 2025
+Author: Maya Sharma
+Summary: levels of a mesh from the original (level 0) to the coarsest. Level l has about ratio^l times the
+triangles of the original. Coarse vertices are averages of original vertices, coarsen() applies the same
+averaging to any per vertex array so the mean shape and the mode vectors of a statistical shape model stay
+consistent: coarsen(mean + sum lambda_m mode_m) = coarsen(mean) + sum lambda_m coarsen(mode_m).
+'''
+class MeshPyramid:
+
+    def __init__(self, vertices, triangles, n_levels=3, ratio=0.25):
+        self.vertices = np.asarray(vertices, dtype=float)
+        self.triangles = np.asarray(triangles)
+        targets = [max(4, int(len(self.triangles) * ratio ** l)) for l in range(1, n_levels)]
+
+        self.labels = [np.arange(len(self.vertices))]
+        self.level_triangles = [self.triangles]
+        for labels, level_triangles in decimate_mesh(self.vertices, self.triangles, targets):
+            self.labels.append(labels)
+            self.level_triangles.append(level_triangles)
+        self._counts = [np.bincount(labels).astype(float) for labels in self.labels]
+
+    def __len__(self):
+        return len(self.labels)
+
+    '''
+    Parameters: per vertex values of the original mesh (V x ...) or a stack of them (M x V x ...), level
+    Returns: the values averaged onto the vertices of that level
+    '''
+    def coarsen(self, values, level):
+        values = np.asarray(values, dtype=float)
+        if level == 0:
+            return values
+
+        labels, counts = self.labels[level], self._counts[level]
+        stacked = values.ndim == 3
+        if not stacked:
+            values = values[None]
+        out = np.zeros((len(values), len(counts)) + values.shape[2:])
+        for m in range(len(values)):
+            np.add.at(out[m], labels, values[m])
+        out /= counts.reshape((1, -1) + (1,) * (values.ndim - 2))
+        return out if stacked else out[0]
+
+    '''
+    Parameters: level
+    Returns: vertices and triangles of that level
+    '''
+    def mesh(self, level):
+        return self.coarsen(self.vertices, level), self.level_triangles[level]
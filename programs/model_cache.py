@@ -0,0 +1,329 @@
+# model_cache.py keeps compiled binary copies of the mesh, body and modes files so they are not re-parsed every run
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import tempfile
+import numpy as np
+import telemetry
+from utility_functions import read_mesh, read_body, read_sample_header, iter_sample_readings
+
+CACHE_VERSION = 2
+
+# compiled containers go next to the programs unless another folder is given
+default_cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".pa5_cache")
+
+'''
+Created on December 19, 2025
+Author: Maya Sharma
+params: filename
+Returns: sha256 hex digest of the file contents
+'''
+def content_hash(filename):
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+'''
+Created on December 19, 2025
+Author: Maya Sharma
+params: source filename, kind of file and cache folder
+Returns: path of the container folder for this exact file contents
+Summary: containers are keyed by the content hash so an edited source file never hits an old container
+'''
+def container_path(filename, kind, cache_dir=None):
+    digest = content_hash(filename)
+    name = f"{os.path.basename(filename)}-{kind}-{digest[:16]}.pa5c"
+    return os.path.join(_usable_cache_dir(cache_dir), name), digest
+
+'''
+Created on December 19, 2025
+Author: Maya Sharma
+params: cache folder or None for the default
+Returns: a folder that can be written to, the temp folder is used if the requested one is read-only
+'''
+def _usable_cache_dir(cache_dir):
+    cache_dir = cache_dir or default_cache_dir
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        if os.access(cache_dir, os.W_OK):
+            return cache_dir
+    except OSError:
+        pass
+    fallback = os.path.join(tempfile.gettempdir(), "pa5_cache")
+    os.makedirs(fallback, exist_ok=True)
+    return fallback
+
+'''
+Created on December 19, 2025
+Author: Maya Sharma
+params: container folder, header dict, the named arrays to store and optional streamed blocks, name -> (shape,
+        dtype, iterable of pieces that fill the block along its first axis in order)
+Summary: every array is written as its own .npy block (the .npy header pads the data to a 64 byte boundary,
+so the blocks can be memory mapped) plus header.json. A streamed block is written piece by piece through a
+memory map of the new file, so it never has to be in memory as a whole. The container is written to a
+temporary folder and renamed into place so other processes never see half of it.
+'''
+def _write_container(path, header, arrays, streamed=None):
+    streamed = streamed or {}
+    parent = os.path.dirname(path)
+    tmp = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp, name + ".npy"), np.ascontiguousarray(array))
+        for name, (shape, dtype, pieces) in streamed.items():
+            block = np.lib.format.open_memmap(os.path.join(tmp, name + ".npy"), mode='w+', dtype=dtype, shape=shape)
+            start = 0
+            for piece in pieces:
+                block[start:start + len(piece)] = piece
+                start += len(piece)
+            block.flush()
+            del block
+        header = dict(header, version=CACHE_VERSION, blocks=sorted(list(arrays) + list(streamed)))
+        with open(os.path.join(tmp, "header.json"), 'w') as f:
+            json.dump(header, f, indent=1)
+        os.replace(tmp, path)
+    except OSError:
+        # another process finished the same container first
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.isdir(path):
+            raise
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+'''
+Created on December 19, 2025
+Author: Maya Sharma
+params: container folder and the content hash it should have
+Returns: the header dict, or None if the container is missing, from another version or for other contents
+'''
+def _read_header(path, digest):
+    try:
+        with open(os.path.join(path, "header.json"), 'r') as f:
+            header = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if header.get("version") != CACHE_VERSION or header.get("sha256") != digest:
+        return None
+    return header
+
+'''
+Created on December 19, 2025
+Author: Maya Sharma
+params: container folder and block name
+Returns: the block memory mapped read-only
+'''
+def _load_block(path, name):
+    return np.load(os.path.join(path, name + ".npy"), mmap_mode='r')
+
+'''
+Created on December 19, 2025
+Author: Maya Sharma
+params: mesh filename and cache folder
+Returns: path of the compiled container
+Summary: parses the text file once and stores vertices, triangles and neighbours
+'''
+def compile_mesh(filename, cache_dir=None):
+    path, digest = container_path(filename, "mesh", cache_dir)
+    vertices, triangles, neighbours = read_mesh(filename)
+    _write_container(path, {"kind": "mesh", "source": os.path.basename(filename), "sha256": digest},
+                     {"vertices": vertices, "triangles": triangles, "neighbours": neighbours})
+    return path
+
+'''
+Created on December 19, 2025
+Author: Maya Sharma
+params: body filename and cache folder
+Returns: path of the compiled container
+'''
+def compile_body(filename, cache_dir=None):
+    path, digest = container_path(filename, "body", cache_dir)
+    markers, tip = read_body(filename)
+    _write_container(path, {"kind": "body", "source": os.path.basename(filename), "sha256": digest},
+                     {"markers": markers, "tip": tip})
+    return path
+
+'''
+Created on December 19, 2025
+Author: Maya Sharma
+params: modes filename and cache folder
+Returns: path of the compiled container
+Summary: stores the mean shape and all modes of the file as one (Nmodes x V x 3) block, modes are contiguous in
+mode order so a later load only touches the pages of the modes it needs
+'''
+def compile_modes(filename, cache_dir=None):
+    # imported here because deform_registration loads its inputs through this module
+    from deform_registration import read_modes_fixed
+
+    path, digest = container_path(filename, "modes", cache_dir)
+    with open(filename, 'r') as f:
+        n_modes_total = int(re.search(r'Nmodes=(\d+)', f.readline()).group(1))
+    mean_vertices, modes = read_modes_fixed(filename, n_modes_total)
+
+    arrays = {"mean": mean_vertices, "modes": modes}
+    _write_container(path, {"kind": "modes", "source": os.path.basename(filename), "sha256": digest,
+                            "n_modes": len(modes)}, arrays)
+    return path
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: sample readings filename, cache folder and the number of frames parsed at a time
+Returns: path of the compiled container
+Summary: converts the frames to one (Nsamps x Ns x 3) block chunk_frames frames at a time, so a capture of any
+length is converted with the memory of one chunk
+'''
+def compile_samples(filename, cache_dir=None, chunk_frames=4096):
+    path, digest = container_path(filename, "samples", cache_dir)
+    Ns, Nsamps, N_modes = read_sample_header(filename)
+    _write_container(path, {"kind": "samples", "source": os.path.basename(filename), "sha256": digest,
+                            "Ns": Ns, "Nsamps": Nsamps, "N_modes": N_modes}, {},
+                     streamed={"frames": ((Nsamps, Ns, 3), np.float64,
+                                          iter_sample_readings(filename, chunk_frames))})
+    return path
+
+'''
+Created on December 22, 2025
+Author: Maya Sharma
+params: mesh filename, cache folder, cell size and margin of the grid (None for the defaults) and build workers
+Returns: path of the compiled container
+Summary: builds the ClosestTriangleGrid (voxel_grid.py) of the mesh once and stores its arrays
+'''
+def compile_grid(filename, cache_dir=None, cell_size=None, margin=None, workers=None):
+    # imported here so that loading the plain files does not pull in the closest point search code
+    from voxel_grid import ClosestTriangleGrid
+
+    path, digest = container_path(filename, _grid_kind(cell_size, margin), cache_dir)
+    vertices, triangles, _ = load_mesh(filename, cache_dir)
+    grid = ClosestTriangleGrid(vertices, triangles, cell_size=cell_size, margin=margin, workers=workers)
+    _write_container(path, {"kind": "grid", "source": os.path.basename(filename), "sha256": digest,
+                            "cell_size": grid.cell_size, "margin": grid.margin}, grid.arrays())
+    return path
+
+'''
+Created on December 22, 2025
+Author: Maya Sharma
+params: cell size and margin of a grid
+Returns: the kind name of its container, grids with other settings get their own container
+'''
+def _grid_kind(cell_size, margin):
+    name = lambda x: "auto" if x is None else f"{float(x):g}"
+    return f"grid-{name(cell_size)}-{name(margin)}"
+
+'''
+Created on December 19, 2025
+Author: Maya Sharma
+params: filename, kind and the compile function for that kind, cache folder
+Returns: container folder and its header, compiling it from the text file on a cache miss
+'''
+def _open_container(filename, kind, compile_func, cache_dir):
+    path, digest = container_path(filename, kind, cache_dir)
+    header = _read_header(path, digest)
+    if header is None:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        compile_func(filename, cache_dir)
+        header = _read_header(path, digest)
+    return path, header
+
+'''
+Created on December 19, 2025
+Author: Maya Sharma
+params: mesh filename and cache folder
+Returns: vertices, triangles, neighbours like read_mesh, memory mapped from the compiled container
+'''
+@telemetry.timed("io.load_mesh")
+def load_mesh(filename, cache_dir=None):
+    path, _ = _open_container(filename, "mesh", compile_mesh, cache_dir)
+    return _load_block(path, "vertices"), _load_block(path, "triangles"), _load_block(path, "neighbours")
+
+'''
+Created on December 19, 2025
+Author: Maya Sharma
+params: body filename and cache folder
+Returns: markers and tip like read_body
+'''
+@telemetry.timed("io.load_body")
+def load_body(filename, cache_dir=None):
+    path, _ = _open_container(filename, "body", compile_body, cache_dir)
+    return _load_block(path, "markers"), _load_block(path, "tip")
+
+'''
+Created on December 19, 2025
+Author: Maya Sharma
+params: modes filename, number of modes wanted and cache folder
+Returns: mean_vertices, mode_vectors (max_modes x V x 3) like read_modes_fixed
+Summary: the modes block is mapped and sliced, so the modes after max_modes are never read from disk
+'''
+@telemetry.timed("io.load_modes")
+def load_modes(filename, max_modes, cache_dir=None):
+    path, header = _open_container(filename, "modes", compile_modes, cache_dir)
+    n_modes = min(max_modes, header["n_modes"])
+    return _load_block(path, "mean"), _load_block(path, "modes")[:n_modes]
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: sample readings filename and cache folder
+Returns: frames (Nsamps x Ns x 3) memory mapped from the compiled container, Ns, Nsamps, N_modes like
+         read_sample_readings. Only the pages of the frames that are used get read from disk.
+'''
+@telemetry.timed("io.load_samples")
+def load_samples(filename, cache_dir=None):
+    path, header = _open_container(filename, "samples", compile_samples, cache_dir)
+    return _load_block(path, "frames"), header["Ns"], header["Nsamps"], header["N_modes"]
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: sample readings filename, frames per block, binary=True to read the frames from a compiled container
+        (compiled on first use) instead of the text, cache folder
+Returns: iterator of frame blocks (at most chunk_frames x Ns x 3), Ns, Nsamps, N_modes
+Summary: either way only one block of frames is in memory at a time
+'''
+def sample_chunks(filename, chunk_frames=4096, binary=False, cache_dir=None):
+    if binary:
+        frames, Ns, Nsamps, N_modes = load_samples(filename, cache_dir)
+        chunks = (frames[start:start + chunk_frames] for start in range(0, Nsamps, chunk_frames))
+        return chunks, Ns, Nsamps, N_modes
+    Ns, Nsamps, N_modes = read_sample_header(filename)
+    return iter_sample_readings(filename, chunk_frames), Ns, Nsamps, N_modes
+
+'''
+Created on December 22, 2025
+Author: Maya Sharma
+params: mesh filename, cell size and margin of the grid (None for the defaults), cache folder and build workers
+Returns: the ClosestTriangleGrid of the mesh with its arrays memory mapped from the compiled container
+Summary: the grid is only built the first time, later runs on the same mesh contents just map it
+'''
+def load_grid(filename, cell_size=None, margin=None, cache_dir=None, workers=None):
+    from voxel_grid import ClosestTriangleGrid
+
+    compile_func = lambda f, d: compile_grid(f, d, cell_size=cell_size, margin=margin, workers=workers)
+    path, header = _open_container(filename, _grid_kind(cell_size, margin), compile_func, cache_dir)
+    vertices, triangles, _ = load_mesh(filename, cache_dir)
+    arrays = {name: _load_block(path, name) for name in header["blocks"]}
+    return ClosestTriangleGrid(vertices, triangles, grid_arrays=arrays)
+
+
+# compile the given files ahead of time: python model_cache.py <mesh.sur> <modes.txt> <body.txt> <samples.txt> ...
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python model_cache.py <file> [<file> ...]")
+        sys.exit(1)
+
+    for filename in sys.argv[1:]:
+        if filename.endswith(".sur"):
+            path = compile_mesh(filename)
+        elif "Modes" in os.path.basename(filename):
+            path = compile_modes(filename)
+        elif "SampleReadings" in os.path.basename(filename):
+            path = compile_samples(filename)
+        else:
+            path = compile_body(filename)
+        print(f"{filename} -> {path}")
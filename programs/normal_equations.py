@@ -0,0 +1,68 @@
+# normal_equations.py solves linear least squares problems without keeping the whole system in memory
+import numpy as np
+import telemetry
+
+'''
+Created on December 21, 2025
+Author: Maya Sharma
+Summary: streaming least squares for A x = b with few unknowns and many rows. Instead of the (rows x n) matrix
+only A^T A (n x n), A^T b and b^T b are kept, add() folds in one block of rows at a time, so the memory stays
+O(n^2) however many rows there are. solve() scales the normal equations to unit diagonal, adds the Tikhonov
+term regularization * I (in the scaled unknowns) and solves them with a Cholesky factorisation. If the
+system is singular and there is no regularization, it falls back to the minimum norm solution like lstsq.
+'''
+class NormalEquationAccumulator:
+
+    def __init__(self, n_unknowns, regularization=0.0):
+        self.n_unknowns = n_unknowns
+        self.regularization = regularization
+        self.reset()
+
+    '''
+    Summary: forgets every row added so far
+    '''
+    def reset(self):
+        self.AtA = np.zeros((self.n_unknowns, self.n_unknowns))
+        self.Atb = np.zeros(self.n_unknowns)
+        self.btb = 0.0
+        self.n_rows = 0
+
+    '''
+    Parameters: block of rows A (k x n), right hand side b (k,) and optional row weights (k,)
+    '''
+    def add(self, A, b, weights=None):
+        A = np.asarray(A, dtype=float).reshape(-1, self.n_unknowns)
+        b = np.asarray(b, dtype=float).reshape(-1)
+        if weights is None:
+            WA = A
+        else:
+            WA = A * np.asarray(weights, dtype=float).reshape(-1, 1)
+
+        self.AtA += WA.T @ A
+        self.Atb += WA.T @ b
+        self.btb += float(b @ b) if weights is None else float(b @ (np.asarray(weights).reshape(-1) * b))
+        self.n_rows += len(b)
+
+    '''
+    Returns: the least squares solution x
+    '''
+    @telemetry.timed("lstsq")
+    def solve(self):
+        scale = np.sqrt(np.diag(self.AtA))
+        scale = np.where(scale > 0, scale, 1.0)
+        H = self.AtA / np.outer(scale, scale) + self.regularization * np.eye(self.n_unknowns)
+        g = self.Atb / scale
+
+        try:
+            L = np.linalg.cholesky(H)
+            y = np.linalg.solve(L.T, np.linalg.solve(L, g))
+        except np.linalg.LinAlgError:
+            y = np.linalg.lstsq(H, g, rcond=None)[0]
+        return y / scale
+
+    '''
+    Parameters: a solution x
+    Returns: the sum of squared residuals |A x - b|^2 of every row added so far
+    '''
+    def residual(self, x):
+        return float(x @ self.AtA @ x - 2.0 * x @ self.Atb + self.btb)
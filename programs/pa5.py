@@ -1,17 +1,25 @@
 # main for pa5 assignment pa5.py
 import os
 import sys
+import telemetry
 from deform_registration import *
 
+# optional telemetry outputs: --trace <file.json> (Chrome trace) and --telemetry <file.jsonl> (JSON lines)
+telemetry_files = {}
+args = sys.argv[1:]
+while len(args) >= 2 and args[-2] in ("--trace", "--telemetry"):
+    telemetry_files[args[-2]] = args[-1]
+    args = args[:-2]
+
 # check command line arguments if they were entered ok/are valid
-if len(sys.argv) != 2:
-    print("Usage: python pa5.py <File_Letter>")
+if len(args) != 1:
+    print("Usage: python pa5.py <File_Letter> [--trace trace.json] [--telemetry telemetry.jsonl]")
     print("Please entere in the format: python pa5.py A")
     print("Please enter with this format: python pa5.py G")
     sys.exit(1)
 
 # make sure the file lettered entered is a valid argument
-file_letter = sys.argv[1].upper()
+file_letter = args[0].upper()
 if file_letter not in "ABCDEFGHJK":
     print(f"You have entered an Invalid file letter '{file_letter}'. Instead please use A-F for debug files or G, H, J, K for the unknown files!.")
     sys.exit(1)
@@ -50,6 +58,8 @@ if not os.path.exists(sample_file_path):
     sys.exit(1)
 
 # now call the main function to solve pa5
+if telemetry_files:
+    telemetry.enable()
 
 try:
     s_k, c_k, lambdas = solve_pa5(
@@ -63,4 +73,11 @@ except Exception as e:
     import traceback
     traceback.print_exc()
 
-
+# write out where the time went and how the iterations went
+if telemetry_files:
+    recorded = telemetry.disable()
+    recorded.print_summary()
+    if "--trace" in telemetry_files:
+        recorded.write_chrome_trace(telemetry_files["--trace"])
+    if "--telemetry" in telemetry_files:
+        recorded.write_jsonl(telemetry_files["--telemetry"])
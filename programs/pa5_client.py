@@ -0,0 +1,69 @@
+# pa5_client.py sends a PA5 registration job to a running pa5_server.py, it only uses the standard library so it
+# starts without importing numpy
+import os
+import sys
+import json
+import socket
+import argparse
+import tempfile
+
+# the server listens here unless --socket says otherwise, one socket per user
+default_socket = os.path.join(tempfile.gettempdir(), f"pa5-server-{os.getuid()}.sock")
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+params: request dict and the server's socket path
+Returns: the server's reply dict
+Summary: the protocol is one JSON object per line each way. A request has an "action" ("register", "status" or
+"shutdown"), a register request names the data set by "letter" (resolved in the server's data folder) or
+the "sample" file itself, plus the "output_dir" or "output" file and optional solve_pa5 "options". A reply has
+"status" "ok" or "error" and "message" when it failed.
+'''
+def send_request(request, socket_path=default_socket):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        stream = connection.makefile('rw')
+        stream.write(json.dumps(request) + "\n")
+        stream.flush()
+        reply = stream.readline()
+    if not reply:
+        raise ConnectionError("the server closed the connection without a reply")
+    return json.loads(reply)
+
+
+# same arguments as pa5.py: python pa5_client.py A [--socket path]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a PA5 registration on a running pa5_server.py.")
+    parser.add_argument("letter", nargs="?", help="data set letter, A-F for debug or G, H, J, K for unknown")
+    parser.add_argument("--socket", default=default_socket, help="Unix socket of the server")
+    parser.add_argument("--status", action="store_true", help="ask the server what it has loaded")
+    parser.add_argument("--shutdown", action="store_true", help="stop the server")
+    args = parser.parse_args()
+
+    if args.status or args.shutdown:
+        request = {"action": "status" if args.status else "shutdown"}
+    else:
+        if args.letter is None or len(args.letter) != 1 or args.letter.upper() not in "ABCDEFGHJK":
+            print(f"You have entered an Invalid file letter '{args.letter}'. Instead please use A-F for debug files "
+                  f"or G, H, J, K for the unknown files!.")
+            sys.exit(1)
+        # the output goes next to the programs like with pa5.py
+        request = {"action": "register", "letter": args.letter.upper(),
+                   "output_dir": os.path.dirname(os.path.abspath(__file__))}
+
+    try:
+        reply = send_request(request, args.socket)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f"no server is listening on {args.socket}, start one with: python pa5_server.py")
+        sys.exit(1)
+
+    if reply["status"] != "ok":
+        print(f"the server could not run the job: {reply['message']}")
+        sys.exit(1)
+    if request["action"] == "register":
+        print(f"{reply['output']}: {reply['samples']} samples, mean |s_k - c_k| = {reply['error']:.4f}, "
+              f"solved in {reply['seconds'] * 1e3:.1f} ms")
+        print("lambda " + "".join(f"{l:12.4f}" for l in reply["lambdas"]))
+    elif request["action"] == "status":
+        print(json.dumps(reply, indent=1))
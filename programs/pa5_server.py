@@ -0,0 +1,194 @@
+# pa5_server.py keeps the PA5 mesh, modes, bodies and BVH in memory and runs registration jobs sent over a Unix socket
+import os
+import sys
+import copy
+import json
+import stat
+import time
+import socket
+import argparse
+import threading
+import contextlib
+import socketserver
+import numpy as np
+from mesh_bvh import TriangleBVH
+from deform_registration import solve_pa5
+from batch_pa5 import problem_files, load_inputs, default_data_folder
+from pa5_client import default_socket
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+Summary: the resident state of the server. The inputs are loaded once like batch_pa5.load_inputs (every mode of the
+modes file, a job takes as many as its sample file asks for) and the TriangleBVH of the mean shape is built once.
+Each job gets a copy of that BVH, because the solve refits it to the deformed mesh, copying it costs well under
+a millisecond against about 20 ms for a build. Jobs run one at a time in the order they arrive.
+'''
+class RegistrationService:
+
+    def __init__(self, data_folder=default_data_folder, use_compiled=True, cache_dir=None):
+        start = time.perf_counter()
+        self.data_folder = data_folder
+        self.files = problem_files(5, data_folder)
+        self.inputs = load_inputs(*self.files, use_compiled=use_compiled, cache_dir=cache_dir)
+        # read-only from here on, a job can't change the resident model by accident
+        for array in self.inputs.values():
+            if isinstance(array, np.ndarray) and array.flags.owndata:
+                array.flags.writeable = False
+        self.index = TriangleBVH(self.inputs["mean_vertices"], self.inputs["triangles"],
+                                 neighbours=self.inputs["neighbours"])
+        self.load_seconds = time.perf_counter() - start
+        self.jobs = 0
+
+    '''
+    Parameters: data set letter
+    Returns: its sample readings file and the output file name, named like pa5.py does
+    '''
+    def letter_files(self, letter):
+        file_type = "Debug" if letter in "ABCDEF" else "Unknown"
+        return (os.path.join(self.data_folder, f"PA5-{letter}-{file_type}-SampleReadingsTest.txt"),
+                f"PA5-{letter}-{file_type}-Output.txt")
+
+    '''
+    Parameters: register request (see pa5_client.send_request)
+    Returns: reply with the output file, number of samples, lambdas, mean |s_k - c_k| and the solve time
+    '''
+    def register(self, request):
+        if "letter" in request:
+            sample_file, output_name = self.letter_files(str(request["letter"]).upper())
+        else:
+            sample_file = request["sample"]
+            output_name = os.path.basename(sample_file).replace("SampleReadingsTest", "Output")
+        output_file = request.get("output") or os.path.join(request.get("output_dir", os.getcwd()), output_name)
+        if not os.path.exists(sample_file):
+            raise FileNotFoundError(f"the sample file couldn't be found: {sample_file}")
+
+        start = time.perf_counter()
+        preloaded = dict(self.inputs, index=copy.deepcopy(self.index))
+        with contextlib.redirect_stdout(None):
+            s_k, c_k, lambdas = solve_pa5(*self.files, sample_file, output_file, preloaded=preloaded,
+                                          **request.get("options", {}))
+        seconds = time.perf_counter() - start
+        self.jobs += 1
+
+        return {"status": "ok", "output": output_file, "samples": len(s_k), "lambdas": [float(l) for l in lambdas],
+                "error": float(np.mean(np.linalg.norm(s_k - c_k, axis=1))), "seconds": seconds}
+
+    '''
+    Returns: reply with the data folder, model sizes, load time and number of jobs run
+    '''
+    def status(self):
+        return {"status": "ok", "data_folder": self.data_folder, "pid": os.getpid(),
+                "vertices": len(self.inputs["mean_vertices"]), "triangles": len(self.inputs["triangles"]),
+                "modes": len(self.inputs["mode_vectors"]), "load_seconds": self.load_seconds, "jobs": self.jobs}
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+Summary: answers every request line of a connection. A failing job only gets an error reply, the server keeps
+running.
+'''
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            reply = self.server.answer(line)
+            self.wfile.write((json.dumps(reply) + "\n").encode())
+            self.wfile.flush()
+
+'''
+Created on December 26, 2025
+Author: Maya Sharma
+params: path the server is going to bind
+Summary: removes a socket file left behind by a server that died, it would block the bind. Only a socket that
+refuses a test connection is removed: a file that is not a socket raises FileExistsError and a socket that a
+server still answers on raises OSError, so a second server can't take the path of a running one.
+'''
+def remove_stale_socket(socket_path):
+    try:
+        mode = os.stat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{socket_path} exists and is not a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(socket_path)
+        except ConnectionRefusedError:
+            os.remove(socket_path)
+            return
+    raise OSError(f"a server is already listening on {socket_path}")
+
+'''
+Created on December 24, 2025
+Updated on December 26, 2025
+Author: Maya Sharma
+Summary: Unix socket server around a RegistrationService, one connection at a time. The socket file is only
+readable and writable by its owner and is removed again by server_close(). A stale socket file is replaced,
+see remove_stale_socket.
+'''
+class RegistrationServer(socketserver.UnixStreamServer):
+
+    def __init__(self, service, socket_path=default_socket):
+        remove_stale_socket(socket_path)
+        self.service = service
+        self.socket_path = socket_path
+        super().__init__(socket_path, _RequestHandler)
+        os.chmod(socket_path, 0o600)
+
+    '''
+    Parameters: one request line
+    Returns: the reply dict
+    '''
+    def answer(self, line):
+        try:
+            request = json.loads(line)
+            action = request.get("action", "register")
+            if action == "register":
+                return self.service.register(request)
+            if action == "status":
+                return self.service.status()
+            if action == "shutdown":
+                # shutdown() waits for serve_forever to return, so it can't run on the thread serving this request
+                threading.Thread(target=self.shutdown).start()
+                return {"status": "ok"}
+            raise ValueError(f"unknown action '{action}'")
+        except Exception as e:
+            return {"status": "error", "message": f"{type(e).__name__}: {e}"}
+
+    '''
+    Summary: closes the socket and removes its file
+    '''
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+# start the server: python pa5_server.py [--socket path] [--data folder], then run jobs with pa5_client.py A
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Keep the PA5 model loaded and run registration jobs sent to it.")
+    parser.add_argument("--socket", default=default_socket, help="Unix socket to listen on")
+    parser.add_argument("--data", default=default_data_folder, help="folder with the body, mesh, modes and samples")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.data):
+        print(f"the data folder couldn't be found: {args.data}")
+        sys.exit(1)
+    service = RegistrationService(args.data)
+    try:
+        server = RegistrationServer(service, args.socket)
+    except OSError as e:
+        print(e)
+        sys.exit(1)
+    status = service.status()
+    print(f"loaded {status['triangles']} triangles and {status['modes']} modes in {status['load_seconds']:.2f} s, "
+          f"listening on {args.socket}", flush=True)
+
+    with server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
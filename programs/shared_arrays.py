@@ -0,0 +1,90 @@
+# shared_arrays.py puts named numpy arrays into shared memory so worker processes can use them without copies
+import numpy as np
+from multiprocessing import shared_memory
+
+# every array starts on a 64 byte boundary of the block
+_ALIGN = 64
+
+'''
+Created on December 22, 2025
+Author: Maya Sharma
+Summary: one multiprocessing.shared_memory block holding a set of named arrays. The process that creates it copies
+the arrays in once, spec is a small picklable description that a worker passes to SharedArrays.attach to get
+read-only numpy views of the same memory, so the data exists once however many workers there are. The creator
+must call unlink() when every worker is done, attached copies only close().
+'''
+class SharedArrays:
+
+    def __init__(self, arrays=None, spec=None):
+        if spec is not None:
+            name, self.layout = spec
+            self._shm = _attach_untracked(name)
+            self.owner = False
+        else:
+            self.layout = {}
+            offset = 0
+            for key, array in arrays.items():
+                array = np.asarray(array)
+                self.layout[key] = (offset, array.shape, array.dtype.str)
+                offset += -(-array.nbytes // _ALIGN) * _ALIGN
+            self._shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+            self.owner = True
+            for key, array in arrays.items():
+                self._view(key, writeable=True)[...] = array
+
+        self.arrays = {key: self._view(key) for key in self.layout}
+
+    '''
+    Parameters: spec of a block created in another process
+    Returns: SharedArrays with views of that block
+    '''
+    @classmethod
+    def attach(cls, spec):
+        return cls(spec=spec)
+
+    '''
+    Returns: (block name, layout), all a worker needs to attach
+    '''
+    @property
+    def spec(self):
+        return self._shm.name, self.layout
+
+    '''
+    Parameters: array name
+    Returns: numpy view of that array in the block
+    '''
+    def _view(self, key, writeable=False):
+        offset, shape, dtype = self.layout[key]
+        view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=self._shm.buf, offset=offset)
+        view.flags.writeable = writeable
+        return view
+
+    '''
+    Summary: drops the views and detaches from the block
+    '''
+    def close(self):
+        self.arrays = {}
+        self._shm.close()
+
+    '''
+    Summary: detaches and frees the block, only for the process that created it
+    '''
+    def unlink(self):
+        self.close()
+        if self.owner:
+            self._shm.unlink()
+
+'''
+Created on December 22, 2025
+Author: Maya Sharma
+params: name of an existing shared memory block
+Returns: the block, without registering it with the resource tracker where Python allows that (3.13 and later)
+Notes: before 3.13 attaching always registers the block. Processes started by multiprocessing share the resource
+       tracker of their parent, where the block is registered already, so that adds nothing and must not be
+       undone: unregistering it here would also drop the creator's registration.
+'''
+def _attach_untracked(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
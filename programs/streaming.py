@@ -0,0 +1,259 @@
+# streaming.py registers the deformable PA5 model online while tracker frames keep arriving
+import os
+import sys
+import time
+import socket
+import argparse
+from collections import deque
+import numpy as np
+from utility_functions import register_points, apply_transform, _parse_sample_header
+from ICP_algo import closest_points_on_mesh
+from ICP_iteration import pre_calculate_dks
+from mesh_bvh import TriangleBVH
+from model_cache import load_mesh, load_body, load_modes
+from normal_equations import NormalEquationAccumulator
+from deform_registration import deform_mesh, assemble_mode_system, write_pa5_output, _update_mesh_index
+
+# set up the default data folder the same way pa5.py does
+current_dir = os.path.dirname(os.path.abspath(__file__))
+default_data_folder = os.path.join(os.path.dirname(current_dir), "2025_PA345_Student_Data")
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: text stream positioned at the header line of a sample readings file
+Returns: Ns, Nsamps and N_modes of the header, like read_sample_readings
+'''
+def read_stream_header(stream):
+    return _parse_sample_header(stream.readline())
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: text stream (file, pipe, socket.makefile()) of sample readings rows and the number of markers per frame
+Returns: generator of frames (Ns x 3), each one as soon as its last row has arrived
+Summary: the rows are read one line at a time, so a frame is never held back waiting for the next one. Rows may
+be separated by commas or spaces like in the sample readings files, blank lines are skipped. A frame cut off at
+the end of the stream is dropped.
+'''
+def stream_frames(stream, Ns):
+    rows = []
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        rows.append([float(x) for x in line.replace(',', ' ').split()])
+        if len(rows) == Ns:
+            yield np.array(rows)
+            rows = []
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: latencies in seconds and the percentiles wanted
+Returns: dict of percentile -> latency in milliseconds
+'''
+def latency_percentiles(latencies, percentiles=(50, 90, 99, 100)):
+    if len(latencies) == 0:
+        return {p: float('nan') for p in percentiles}
+    values = np.percentile(np.asarray(latencies) * 1e3, percentiles)
+    return {p: float(v) for p, v in zip(percentiles, values)}
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+Summary: online version of the alternating lambda / F_reg registration of solve_pa5. add_frame() takes one
+tracker frame, computes its d_k with the same rigid registration as pre_calculate_dks and refines lambda and
+F_reg with iterations alternating steps over a sliding window of the last window samples. A lambda step finds
+the closest points of the window on the deformed mesh and solves the normal equations of the window together
+with those of the older samples. A sample that slides out of the window leaves its last rows in a history
+NormalEquationAccumulator that is scaled by forgetting for every new frame (1.0 keeps all of them, smaller
+values let the model follow a changing anatomy). An F_reg step registers the window d_k to their closest points
+on the new mesh. The work per frame depends on window and the number of modes only, never on how many
+frames came before, so the latency stays bounded. The result of a frame has its s_k = F_reg d_k and c_k with
+the F_reg and lambda after that frame, latencies holds the time from the frame to its result. Only with
+keep_history=True are the d_k of all frames kept, for current_points() and write_output() at the end of a run,
+otherwise the memory does not grow with the stream either.
+'''
+class StreamingRegistration:
+
+    def __init__(self, A_markers, A_tip, B_markers, B_tip, mean_vertices, mode_vectors, triangles, neighbours=None,
+                 window=64, iterations=2, forgetting=1.0, regularization=1e-3, use_bvh=True, keep_history=False):
+        if iterations < 1:
+            raise ValueError(f"a frame needs at least one alternating step, got iterations={iterations}")
+        self.A_markers, self.A_tip = np.asarray(A_markers, dtype=float), np.asarray(A_tip, dtype=float)
+        self.B_markers, self.B_tip = np.asarray(B_markers, dtype=float), np.asarray(B_tip, dtype=float)
+        self.mean_vertices = np.asarray(mean_vertices, dtype=float)
+        self.mode_vectors = np.asarray(mode_vectors, dtype=float)
+        self.triangles = np.asarray(triangles)
+        self.window = window
+        self.iterations = iterations
+        self.forgetting = forgetting
+
+        n_modes = len(self.mode_vectors)
+        self.R_reg = np.eye(3)
+        self.t_reg = np.zeros(3)
+        self.lambdas = np.zeros(n_modes)
+        self.deformed_vertices = deform_mesh(self.mean_vertices, self.mode_vectors, self.lambdas)
+        self.index = TriangleBVH(self.deformed_vertices, self.triangles, neighbours=neighbours) if use_bvh else None
+
+        self.history = NormalEquationAccumulator(n_modes, regularization)
+        self.normal_eq = NormalEquationAccumulator(n_modes, regularization)
+        # window of (d_k, closest triangle, barycentric coordinates), the triangle warm starts the next query
+        self.recent = deque()
+        self.n_frames = 0
+        self.d_k_points = [] if keep_history else None
+        self.latencies = []
+
+    '''
+    Parameters: one tracker frame (Ns x 3)
+    Returns: its d_k, pointer tip in the Body B frame
+    '''
+    def frame_dk(self, frame):
+        frame = np.asarray(frame, dtype=float)[None]
+        return pre_calculate_dks(self.A_markers, self.A_tip, self.B_markers, self.B_tip, frame, 1,
+                                 len(self.A_markers), len(self.B_markers))[0]
+
+    '''
+    Parameters: window d_k (W x 3) and the warm start triangles (W,) or None
+    Returns: closest points, distances, triangles and barycentric coordinates on the current mesh
+    '''
+    def _closest(self, d_k, init_tri):
+        return closest_points_on_mesh(d_k, self.deformed_vertices, self.triangles, index=self.index,
+                                      init_tri=init_tri)
+
+    '''
+    Parameters: d_k, triangle and barycentric coordinates of the samples
+    Summary: adds their lambda rows to accumulator
+    '''
+    def _add_rows(self, accumulator, d_k, tri, bary):
+        A, b = assemble_mode_system(d_k, self.triangles, tri, bary, self.mean_vertices, self.mode_vectors)
+        accumulator.add(A, b)
+
+    '''
+    Parameters: one tracker frame (Ns x 3)
+    Returns: dict with the frame number k, d_k, s_k, c_k, |s_k - c_k|, the lambdas after the frame and the latency
+    '''
+    def add_frame(self, frame):
+        start = time.perf_counter()
+        d_k = self.frame_dk(frame)
+        if self.d_k_points is not None:
+            self.d_k_points.append(d_k)
+
+        # the oldest sample leaves its last rows to the history
+        self.history.AtA *= self.forgetting
+        self.history.Atb *= self.forgetting
+        self.history.btb *= self.forgetting
+        if len(self.recent) == self.window:
+            old_d, old_tri, old_bary = self.recent.popleft()
+            self._add_rows(self.history, old_d[None], old_tri[None], old_bary[None])
+        # the new sample starts its search from the triangle of the one before, the next frame is usually close
+        _, _, tri, bary = self._closest(d_k[None], np.array([self.recent[-1][1]]) if self.recent else None)
+        self.recent.append((d_k, tri[0], bary[0]))
+
+        d_window = np.array([d for d, _, _ in self.recent])
+        init_tri = np.array([t for _, t, _ in self.recent])
+        for _ in range(self.iterations):
+            # lambda step, the window's rows on top of the history
+            _, _, tri, bary = self._closest(d_window, init_tri)
+            self.normal_eq.reset()
+            self._add_rows(self.normal_eq, d_window, tri, bary)
+            self.normal_eq.AtA += self.history.AtA
+            self.normal_eq.Atb += self.history.Atb
+            lambdas = self.normal_eq.solve()
+            self.deformed_vertices += np.tensordot(lambdas - self.lambdas, self.mode_vectors, axes=1)
+            self.lambdas = lambdas
+            _update_mesh_index(self.index, None, self.deformed_vertices, self.lambdas)
+
+            # F_reg step, a rotation needs three samples
+            m_k, distances, init_tri, bary = self._closest(d_window, tri)
+            if len(d_window) >= 3:
+                self.R_reg, self.t_reg = register_points(d_window, m_k)
+            else:
+                self.t_reg = np.mean(m_k - d_window @ self.R_reg.T, axis=0)
+
+        self.recent = deque(zip(d_window, init_tri, bary))
+        s_k = apply_transform(self.R_reg, self.t_reg, d_k[None])[0]
+        c_k = apply_transform(self.R_reg, self.t_reg, m_k[-1:])[0]
+        self.latencies.append(time.perf_counter() - start)
+        self.n_frames += 1
+
+        return {"k": self.n_frames - 1, "d_k": d_k, "s_k": s_k, "c_k": c_k,
+                "distance": float(np.linalg.norm(s_k - c_k)), "lambdas": self.lambdas.copy(),
+                "latency": self.latencies[-1]}
+
+    '''
+    Parameters: any iterable of frames, for example stream_frames of a pipe or socket, or a generator
+    Returns: generator of the add_frame result of every frame as it arrives
+    '''
+    def run(self, frames):
+        for frame in frames:
+            yield self.add_frame(frame)
+
+    '''
+    Returns: s_k and c_k of every sample seen so far with the current F_reg and lambda, needs keep_history=True
+    '''
+    def current_points(self):
+        if self.d_k_points is None:
+            raise ValueError("the d_k of earlier frames were not kept, create the registration with keep_history=True")
+        d_k_points = np.array(self.d_k_points).reshape(-1, 3)
+        m_k = self._closest(d_k_points, None)[0]
+        return apply_transform(self.R_reg, self.t_reg, d_k_points), apply_transform(self.R_reg, self.t_reg, m_k)
+
+    '''
+    Parameters: output file
+    Summary: writes every sample so far in the solve_pa5 output format with the current F_reg and lambda
+    '''
+    def write_output(self, output_file):
+        s_k_points, c_k_points = self.current_points()
+        write_pa5_output(output_file, os.path.basename(output_file), s_k_points, c_k_points, self.lambdas)
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: source, '-' for standard input, tcp:HOST:PORT to connect to a socket, anything else is a file or named pipe
+Returns: text stream of the source
+'''
+def open_source(source):
+    if source == "-":
+        return sys.stdin
+    if source.startswith("tcp:"):
+        host, port = source[4:].rsplit(":", 1)
+        return socket.create_connection((host, int(port))).makefile('r')
+    return open(source, 'r')
+
+
+# stream frames into the PA5 model: python streaming.py <source> [--window N] [--iterations N] [--output file]
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Register the PA5 model online from a stream of tracker frames.")
+    parser.add_argument("source", nargs="?", default="-",
+                        help="sample readings stream: '-' for stdin, tcp:HOST:PORT, or a file / named pipe")
+    parser.add_argument("--data", default=default_data_folder, help="folder with the body, mesh and modes files")
+    parser.add_argument("--window", type=int, default=64, help="samples in the sliding window")
+    parser.add_argument("--iterations", type=int, default=2, help="alternating steps per frame")
+    parser.add_argument("--forgetting", type=float, default=1.0, help="history weight kept per frame")
+    parser.add_argument("--output", default=None, help="write all samples in the PA5 output format at the end")
+    args = parser.parse_args()
+    if args.iterations < 1:
+        parser.error("--iterations must be at least 1")
+
+    stream = open_source(args.source)
+    Ns, _, N_modes = read_stream_header(stream)
+    vertices, triangles, neighbours = load_mesh(os.path.join(args.data, "Problem5MeshFile.sur"))
+    A_markers, A_tip = load_body(os.path.join(args.data, "Problem5-BodyA.txt"))
+    B_markers, B_tip = load_body(os.path.join(args.data, "Problem5-BodyB.txt"))
+    mean_vertices, mode_vectors = load_modes(os.path.join(args.data, "Problem5Modes.txt"), N_modes)
+
+    registration = StreamingRegistration(A_markers, A_tip, B_markers, B_tip, mean_vertices, mode_vectors, triangles,
+                                         neighbours=neighbours, window=args.window, iterations=args.iterations,
+                                         forgetting=args.forgetting, keep_history=args.output is not None)
+    for result in registration.run(stream_frames(stream, Ns)):
+        s_k, c_k = result["s_k"], result["c_k"]
+        print(f"{result['k']:6d}{s_k[0]:9.2f}{s_k[1]:9.2f}{s_k[2]:9.2f}   {c_k[0]:8.2f}{c_k[1]:9.2f}{c_k[2]:9.2f}  "
+              f"{result['distance']:8.3f}{result['latency'] * 1e3:9.2f} ms", flush=True)
+
+    if args.output is not None:
+        registration.write_output(args.output)
+    print("lambda " + "".join(f"{l:12.4f}" for l in registration.lambdas), file=sys.stderr)
+    percentiles = latency_percentiles(registration.latencies)
+    print("latency " + "  ".join(f"p{p}: {v:.2f} ms" for p, v in percentiles.items()), file=sys.stderr)
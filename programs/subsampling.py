@@ -0,0 +1,110 @@
+# subsampling.py picks which samples the early ICP iterations of PA4 and PA5 use
+import numpy as np
+from mesh_bvh import morton_order
+
+'''
+Created on December 22, 2025
+Author: Maya Sharma
+Summary: schedule of sample subsets for an ICP loop. The first iterations only use a subset of start_fraction of
+the samples (at least min_samples). Once the error on the subset stabilizes (it improved by less than grow_tol
+relative to the previous iteration, or the loop's controller would stop) the subset grows by the factor growth and
+a new subset is drawn, until it is the full set. The subset stays the same between growths, so the loop solves one
+fixed problem per size and its acceleration still works. The loop calls draw() for the rows of an iteration and
+after_iteration(error, stop, controller) after it. With stratified=True the samples are sorted along a Morton
+curve and one sample is drawn from each of size equal runs, so the subset covers the whole sampled region. Otherwise it
+is a uniform random subset. trim_mask drops the trim fraction of rows with the largest residuals from the
+estimate, in every iteration including the full ones. All random draws come from a generator seeded
+with seed at reset(), so a run is reproducible.
+'''
+class SampleSchedule:
+
+    def __init__(self, start_fraction=0.1, growth=4.0, grow_tol=0.05, trim=0.0, stratified=True, seed=0,
+                 min_samples=32):
+        self.start_fraction = start_fraction
+        self.growth = growth
+        self.grow_tol = grow_tol
+        self.trim = trim
+        self.stratified = stratified
+        self.seed = seed
+        self.min_samples = min_samples
+        self.n_samples = 0
+        self.size = 0
+
+    '''
+    Parameters: the sample points (N x 3) of the run
+    Summary: starts a new run with the smallest subset and a freshly seeded generator
+    '''
+    def reset(self, points):
+        points = np.asarray(points, dtype=float)
+        self.n_samples = len(points)
+        self.size = min(self.n_samples, max(self.min_samples, int(np.ceil(self.start_fraction * self.n_samples))))
+        self.order = morton_order(points) if self.stratified else None
+        self.rng = np.random.default_rng(self.seed)
+        self.previous = None
+        self.rows = None
+
+    '''
+    Returns: True once the subset is the full set of samples
+    '''
+    @property
+    def full(self):
+        return self.size >= self.n_samples
+
+    '''
+    Returns: sorted sample rows to use in this iteration
+    '''
+    def draw(self):
+        if self.full:
+            return np.arange(self.n_samples)
+        if self.rows is not None:
+            return self.rows
+        if not self.stratified:
+            self.rows = np.sort(self.rng.choice(self.n_samples, self.size, replace=False))
+            return self.rows
+
+        # one random sample out of each of size runs of the Morton order
+        bounds = np.linspace(0, self.n_samples, self.size + 1).astype(int)
+        picks = bounds[:-1] + (self.rng.random(self.size) * np.diff(bounds)).astype(int)
+        self.rows = np.sort(self.order[picks])
+        return self.rows
+
+    '''
+    Parameters: residual (distance) of every row used in the iteration
+    Returns: mask of the rows to keep for the estimate
+    '''
+    def trim_mask(self, residuals):
+        residuals = np.asarray(residuals)
+        n_drop = int(self.trim * len(residuals))
+        keep = np.ones(len(residuals), dtype=bool)
+        if n_drop > 0:
+            keep[np.argpartition(residuals, len(residuals) - n_drop)[len(residuals) - n_drop:]] = False
+        return keep
+
+    '''
+    Parameters: error of the iteration and whether the loop's controller would stop on it
+    Returns: True if the subset grew, the loop should then reset its controller, errors on different subsets
+             are not comparable
+    '''
+    def update(self, error, stop=False):
+        if self.full:
+            return False
+        stable = self.previous is not None and error >= (1.0 - self.grow_tol) * self.previous
+        self.previous = error
+        if not (stable or stop):
+            return False
+        self.size = min(self.n_samples, int(np.ceil(self.size * self.growth)))
+        self.previous = None
+        self.rows = None
+        return True
+
+    '''
+    Parameters: error of the iteration, whether the loop's controller would stop on it and that controller
+    Returns: whether the loop should stop. On a subset a stable error only means it is time for more samples, so
+             the loop goes on, and the controller is reset when the subset grew.
+    '''
+    def after_iteration(self, error, stop, controller):
+        if self.full:
+            return stop
+        if self.update(error, stop):
+            controller.reset()
+        return False
@@ -0,0 +1,240 @@
+# telemetry.py records where the PA4 / PA5 solvers spend their time and how their iterations progress
+import os
+import json
+import time
+import threading
+import functools
+import contextlib
+import numpy as np
+
+# the Telemetry that is recording, None while telemetry is off
+_active = None
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+Summary: collects what the instrumented functions report while it is enabled. Every timed call adds to a
+(calls, seconds) counter per name and, with keep_spans, is kept as a span (name, start, duration, thread) for
+the trace. Spans past max_spans are only counted, so a long run cannot fill the memory. Solver loops add one
+record per iteration with their error, parameter steps and how many samples changed closest triangle.
+The results can be written as JSON lines (one span, iteration or counter per line) or as a Chrome trace file
+that chrome://tracing and Perfetto open, with the errors drawn as counter tracks.
+'''
+class Telemetry:
+
+    def __init__(self, keep_spans=True, max_spans=1000000):
+        self.keep_spans = keep_spans
+        self.max_spans = max_spans
+        self.start = time.perf_counter()
+        self.wall_start = time.time()
+        self.counters = {}
+        self.spans = []
+        self.iterations = []
+        self.dropped_spans = 0
+        # the closest point queries of a thread pool report from several threads
+        self._lock = threading.Lock()
+
+    '''
+    Parameters: name, perf_counter time it started and its duration in seconds
+    '''
+    def add_span(self, name, start, seconds):
+        with self._lock:
+            counter = self.counters.get(name)
+            if counter is None:
+                self.counters[name] = [1, seconds]
+            else:
+                counter[0] += 1
+                counter[1] += seconds
+            if not self.keep_spans:
+                return
+            if len(self.spans) < self.max_spans:
+                self.spans.append((name, start, seconds, threading.get_ident()))
+            else:
+                self.dropped_spans += 1
+
+    '''
+    Parameters: solver name, iteration number and the values of that iteration (numbers or None)
+    '''
+    def add_iteration(self, solver, iteration, **fields):
+        record = {"solver": solver, "iteration": iteration, "time": time.perf_counter() - self.start}
+        record.update({key: _plain(value) for key, value in fields.items()})
+        with self._lock:
+            self.iterations.append(record)
+
+    '''
+    Returns: one dict per timed name with its calls, total seconds and mean milliseconds, the slowest first
+    '''
+    def summary(self):
+        rows = [{"name": name, "calls": calls, "seconds": seconds, "mean_ms": 1e3 * seconds / calls}
+                for name, (calls, seconds) in self.counters.items()]
+        return sorted(rows, key=lambda row: -row["seconds"])
+
+    '''
+    Parameters: optional stream to print to (stdout by default)
+    Summary: prints the summary table and the number of iterations of each solver
+    '''
+    def print_summary(self, file=None):
+        print(f"{'name':<32}{'calls':>9}{'total ms':>12}{'mean ms':>11}", file=file)
+        for row in self.summary():
+            print(f"{row['name']:<32}{row['calls']:>9}{row['seconds'] * 1e3:12.2f}{row['mean_ms']:11.4f}", file=file)
+        solvers = {}
+        for record in self.iterations:
+            solvers[record["solver"]] = solvers.get(record["solver"], 0) + 1
+        for solver, n in solvers.items():
+            print(f"{solver}: {n} iterations", file=file)
+        if self.dropped_spans:
+            print(f"{self.dropped_spans} spans only counted (max_spans = {self.max_spans})", file=file)
+
+    '''
+    Parameters: output file
+    Summary: writes one JSON object per line, every span ("type": "span", start and duration in seconds since
+    the telemetry started), every iteration ("type": "iteration") and the counters ("type": "counter")
+    '''
+    def write_jsonl(self, filename):
+        with open(filename, 'w') as f:
+            f.write(json.dumps({"type": "run", "pid": os.getpid(), "wall_start": self.wall_start}) + "\n")
+            for name, start, seconds, thread in self.spans:
+                f.write(json.dumps({"type": "span", "name": name, "start": start - self.start,
+                                    "seconds": seconds, "thread": thread}) + "\n")
+            for record in self.iterations:
+                f.write(json.dumps(dict(record, type="iteration")) + "\n")
+            for row in self.summary():
+                f.write(json.dumps(dict(row, type="counter")) + "\n")
+
+    '''
+    Parameters: output file
+    Summary: writes the Chrome trace event format, spans as complete events on their thread, iterations as
+    instant events carrying their values and the error of every solver as a counter track
+    '''
+    def write_chrome_trace(self, filename):
+        pid = os.getpid()
+        to_us = lambda t: (t - self.start) * 1e6
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": "pa5"}}]
+        for name, start, seconds, thread in self.spans:
+            events.append({"name": name, "cat": name.split(".")[0], "ph": "X", "ts": to_us(start),
+                           "dur": seconds * 1e6, "pid": pid, "tid": thread})
+        for record in self.iterations:
+            ts = record["time"] * 1e6
+            args = {key: value for key, value in record.items() if key not in ("solver", "time")}
+            events.append({"name": f"{record['solver']} iteration", "cat": "iteration", "ph": "i", "s": "p",
+                           "ts": ts, "pid": pid, "tid": 0, "args": args})
+            if record.get("error") is not None:
+                events.append({"name": f"{record['solver']} error", "ph": "C", "ts": ts, "pid": pid,
+                               "args": {"error": record["error"]}})
+        with open(filename, 'w') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+params: a value reported by a solver
+Returns: the value as a plain float / int / list for JSON
+'''
+def _plain(value):
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    value = np.asarray(value)
+    return value.item() if value.ndim == 0 else value.tolist()
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+params: an optional Telemetry (a new one by default)
+Returns: the Telemetry that records from now on
+'''
+def enable(telemetry=None):
+    global _active
+    _active = Telemetry() if telemetry is None else telemetry
+    return _active
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+Returns: the Telemetry that was recording (None if there was none), nothing is recorded after this
+'''
+def disable():
+    global _active
+    telemetry, _active = _active, None
+    return telemetry
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+Returns: the Telemetry that is recording or None
+'''
+def active():
+    return _active
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+params: keyword arguments of Telemetry
+Returns: context manager that records into a new Telemetry for the duration of the with block and then puts back
+         whatever was recording before
+'''
+@contextlib.contextmanager
+def recording(**kwargs):
+    global _active
+    previous = _active
+    telemetry = enable(Telemetry(**kwargs))
+    try:
+        yield telemetry
+    finally:
+        _active = previous
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+params: name the calls are counted under
+Returns: decorator that times every call of a function while telemetry is on
+Summary: while it is off a call costs one extra function call and a check of _active, nothing is timed or stored
+'''
+def timed(name):
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            telemetry = _active
+            if telemetry is None:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                telemetry.add_span(name, start, time.perf_counter() - start)
+        return wrapper
+    return decorate
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+params: name the block is counted under
+Returns: context manager that times the with block like timed times a call
+'''
+@contextlib.contextmanager
+def span(name):
+    telemetry = _active
+    if telemetry is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        telemetry.add_span(name, start, time.perf_counter() - start)
+
+'''
+Created on December 24, 2025
+Author: Maya Sharma
+params: solver name, iteration number, the closest triangles of the previous and this iteration (None when they
+        are not for the same samples) and the values of the iteration
+Summary: adds an iteration record while telemetry is on, with correspondence_changes, the number of samples whose
+closest triangle changed, when both triangle arrays are given
+'''
+def record_iteration(solver, iteration, previous_tri=None, tri=None, **fields):
+    telemetry = _active
+    if telemetry is None:
+        return
+    changes = None
+    if previous_tri is not None and tri is not None and len(previous_tri) == len(tri):
+        changes = int(np.count_nonzero(np.asarray(previous_tri) != np.asarray(tri)))
+    telemetry.add_iteration(solver, iteration, correspondence_changes=changes, **fields)
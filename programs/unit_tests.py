@@ -1,7 +1,32 @@
 # imports
+import io
+import json
+import socket
+import threading
+import pytest
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from utility_functions import *
 from ICP_algo import *
+from ICP_algo import _closest_point_results, _closest_points_pairs
+from mesh_bvh import *
+from correspondence_cache import *
+from model_cache import *
+from deform_registration import *
+from convergence import *
+from normal_equations import *
+from mesh_pyramid import *
+from voxel_grid import *
+from subsampling import *
+from shared_arrays import *
+from batch_pa5 import *
+from streaming import *
+from pa5_server import *
+from pa5_client import send_request
+from benchmarks import *
+import ICP_algo
+import telemetry
+import jit_kernels
 
 
 # TRIANGEL TESTS
@@ -101,4 +126,1040 @@ def test_closest_point_on_mesh_equal_dist():
     assert idx in [0, 1]
     
     
-    
\ No newline at end of file
+    
+
+# BATCHED MESH TESTS BELOW
+
+# test that the batched closest point function agrees with the one point at a time version
+def testClosestPointsOnMeshMatchesScalar():
+    rng = np.random.default_rng(0)
+    vertices = rng.normal(0, 10, (30, 3))
+    triangles = np.array([rng.choice(30, 3, replace=False) for _ in range(40)])
+    points = rng.normal(0, 15, (25, 3))
+
+    # use a tiny memory budget so both the points and the triangles get split into blocks
+    closest, distances, idx, bary = closest_points_on_mesh(points, vertices, triangles, max_block_bytes=4096)
+
+    for k, point in enumerate(points):
+        c_ref, d_ref, _ = closest_point_on_mesh(point, vertices, triangles)
+        assert np.allclose(closest[k], c_ref)
+        assert np.isclose(distances[k], d_ref)
+
+
+# test that the barycentric coordinates returned rebuild the closest point on the winning triangle
+def test_closest_points_on_mesh_barycentric():
+    vertices = np.array([
+        [0,0,0],
+        [1,0,0],
+        [0,1,0],
+        [1,1,0]
+    ])
+    triangles = np.array([
+        [0,1,2],
+        [1,3,2]
+    ])
+    points = np.array([[0.2, 0.2, 1.0], [0.9, 0.8, -2.0], [3.0, 3.0, 0.0]])
+    closest, distances, idx, bary = closest_points_on_mesh(points, vertices, triangles)
+
+    assert np.allclose(closest, [[0.2, 0.2, 0], [0.9, 0.8, 0], [1, 1, 0]])
+    assert np.allclose(distances, [1.0, 2.0, np.sqrt(8)])
+    assert list(idx) == [0, 1, 1]
+    assert np.allclose(bary.sum(axis=1), 1.0)
+    rebuilt = np.einsum('kj,kjd->kd', bary, vertices[triangles[idx]])
+    assert np.allclose(rebuilt, closest)
+
+
+# test that the triangle table flags degenerate triangles and gives plane barycentrics like compute_barycentric
+def testTriangleTableBarycentric():
+    vertices = np.array([[0.0, 0, 0], [2, 0, 0], [0, 2, 0], [4, 0, 0]])
+    triangles = np.array([[0, 1, 2], [0, 1, 3]])
+    table = TriangleTable(vertices, triangles)
+
+    assert list(table.degenerate) == [False, True]
+    bary = table.barycentric(np.array([[0.5, 1.0, 3.0], [1.0, 0.0, 0.0]]), np.array([0, 1]))
+    assert np.allclose(bary, [[0.25, 0.25, 0.5], [1/3, 1/3, 1/3]])
+
+
+# test that a table updated with deformed vertices answers like a freshly built one
+def test_triangle_table_update():
+    rng = np.random.default_rng(5)
+    vertices = rng.normal(0, 10, (20, 3))
+    triangles = np.array([rng.choice(20, 3, replace=False) for _ in range(25)])
+    points = rng.normal(0, 12, (15, 3))
+
+    table = TriangleTable(vertices, triangles)
+    moved = vertices + rng.normal(0, 1, vertices.shape)
+    table.update(moved)
+
+    result = closest_points_on_mesh(points, moved, triangles, table=table)
+    expected = closest_points_on_mesh(points, moved, triangles)
+    for r, e in zip(result, expected):
+        assert np.allclose(r, e)
+
+
+# BVH TESTS BELOW
+
+# test that the BVH finds the same closest points as the brute force search
+def testBVHMatchesBruteForce():
+    rng = np.random.default_rng(1)
+    # keep the mesh away from the origin so the centroid shift inside the tree is exercised
+    vertices = rng.normal(0, 10, (200, 3)) + [50, -20, 30]
+    triangles = np.array([rng.choice(200, 3, replace=False) for _ in range(300)])
+    points = rng.normal(0, 12, (150, 3)) + [50, -20, 30]
+
+    bvh = TriangleBVH(vertices, triangles, leaf_size=4)
+    closest, distances, idx, bary = bvh.query(points, chunk_size=64)
+    c_ref, d_ref, _, _ = closest_points_on_mesh(points, vertices, triangles)
+
+    assert np.allclose(distances, d_ref)
+    assert np.allclose(closest, c_ref)
+    rebuilt = np.einsum('kj,kjd->kd', bary, vertices[triangles[idx]])
+    assert np.allclose(rebuilt, closest)
+
+
+# test that passing the index to closest_points_on_mesh gives the same answer as querying it directly
+def test_closest_points_on_mesh_with_index():
+    vertices = np.array([
+        [0,0,0],
+        [1,0,0],
+        [0,1,0],
+        [1,1,0]
+    ])
+    triangles = np.array([
+        [0,1,2],
+        [1,3,2]
+    ])
+    bvh = TriangleBVH(vertices, triangles, leaf_size=1)
+    closest, distances, idx, _ = closest_points_on_mesh(np.array([[0.9, 0.8, -2.0]]), vertices, triangles, index=bvh)
+
+    assert np.allclose(closest, [[0.9, 0.8, 0]])
+    assert np.isclose(distances[0], 2.0)
+    assert idx[0] == 1
+
+
+# test that the morton order keeps points that are close in space next to each other
+def testMortonOrder():
+    points = np.array([[0,0,0], [10,10,10], [0.1,0,0], [10,10,9.9]])
+    order = morton_order(points)
+    assert set(order[:2]) == {0, 2}
+    assert set(order[2:]) == {1, 3}
+
+
+# test that a refit tree answers like a tree built from scratch on the moved vertices
+def testBVHRefitMatchesRebuild():
+    rng = np.random.default_rng(2)
+    vertices = rng.normal(0, 10, (120, 3))
+    triangles = np.array([rng.choice(120, 3, replace=False) for _ in range(200)])
+    points = rng.normal(0, 12, (80, 3))
+
+    bvh = TriangleBVH(vertices, triangles, leaf_size=4, rebuild_ratio=np.inf)
+    moved = vertices + rng.normal(0, 0.5, vertices.shape)
+    rebuilt = bvh.update(moved)
+
+    assert not rebuilt
+    assert bvh.n_refits == 1
+    _, d_refit, _, _ = bvh.query(points)
+    _, d_ref, _, _ = closest_points_on_mesh(points, moved, triangles)
+    assert np.allclose(d_refit, d_ref)
+
+
+# test that the tree gets rebuilt when the refit boxes become much worse than the built ones
+def test_bvh_update_rebuilds_when_quality_degrades():
+    rng = np.random.default_rng(3)
+    # flat 12 x 12 grid split into two triangles per cell
+    xs, ys = np.meshgrid(np.arange(12.0), np.arange(12.0))
+    vertices = np.column_stack([xs.ravel(), ys.ravel(), np.zeros(144)])
+    cells = np.array([i * 12 + j for i in range(11) for j in range(11)])
+    triangles = np.vstack([np.column_stack([cells, cells + 1, cells + 12]),
+                           np.column_stack([cells + 1, cells + 13, cells + 12])])
+
+    bvh = TriangleBVH(vertices, triangles, leaf_size=4)
+    # shuffling the vertices keeps the connectivity but scatters every leaf over the whole mesh
+    rebuilt = bvh.update(vertices[rng.permutation(144)])
+
+    assert rebuilt
+    assert bvh.n_rebuilds == 1
+    assert np.isclose(bvh.quality(), bvh.built_quality)
+
+
+# test that one mode space tree gives exact answers for any lambda inside its box
+def testModeSpaceBVHInsideBox():
+    rng = np.random.default_rng(4)
+    mean = rng.normal(0, 10, (100, 3))
+    modes = rng.normal(0, 0.2, (3, 100, 3))
+    triangles = np.array([rng.choice(100, 3, replace=False) for _ in range(150)])
+    points = rng.normal(0, 12, (60, 3))
+
+    bvh = ModeSpaceBVH(mean, modes, triangles, -5.0, 5.0, leaf_size=4)
+    for _ in range(3):
+        lambdas = rng.uniform(-5, 5, 3)
+        assert not bvh.set_lambdas(lambdas)
+
+        deformed = mean + np.tensordot(lambdas, modes, axes=1)
+        _, d_idx, _, _ = bvh.query(points)
+        _, d_ref, _, _ = closest_points_on_mesh(points, deformed, triangles)
+        assert np.allclose(d_idx, d_ref)
+
+    assert bvh.n_rebuilds == 0
+
+
+# test that leaving the lambda box rebuilds the tree around the new weights
+def test_mode_space_bvh_leaves_box():
+    rng = np.random.default_rng(5)
+    mean = rng.normal(0, 10, (50, 3))
+    modes = rng.normal(0, 0.2, (2, 50, 3))
+    triangles = np.array([rng.choice(50, 3, replace=False) for _ in range(60)])
+
+    bvh = ModeSpaceBVH(mean, modes, triangles, -1.0, 1.0)
+    assert bvh.set_lambdas(np.array([3.0, 0.0]))
+    assert bvh.n_rebuilds == 1
+    assert bvh.contains(np.array([3.0, 0.0]))
+
+    points = rng.normal(0, 12, (20, 3))
+    _, d_idx, _, _ = bvh.query(points)
+    _, d_ref, _, _ = closest_points_on_mesh(points, mean + 3.0 * modes[0], triangles)
+    assert np.allclose(d_idx, d_ref)
+
+
+# WARM START TESTS BELOW
+
+# test that the neighbours are found from the shared edges when the mesh file has none
+def testTriangleAdjacencyFromEdges():
+    triangles = np.array([
+        [0,1,2],
+        [1,3,2]
+    ])
+    neighbours = np.full((2, 3), -1)
+    adjacency = triangle_adjacency(triangles, neighbours)
+
+    # edge 1-2 is opposite vertex 0 in the first triangle and opposite vertex 3 in the second
+    assert np.array_equal(adjacency, [[1, -1, -1], [-1, 0, -1]])
+
+
+# test that a warm start gives the exact answer even when the starting triangles are far off
+def test_bvh_warm_start_matches_cold_start():
+    rng = np.random.default_rng(6)
+    # bumpy 15 x 15 grid so the adjacency walk has local optima to get stuck in
+    xs, ys = np.meshgrid(np.arange(15.0), np.arange(15.0))
+    vertices = np.column_stack([xs.ravel(), ys.ravel(), rng.normal(0, 1.0, 225)])
+    cells = np.array([i * 15 + j for i in range(14) for j in range(14)])
+    triangles = np.vstack([np.column_stack([cells, cells + 1, cells + 15]),
+                           np.column_stack([cells + 1, cells + 16, cells + 15])])
+    points = np.column_stack([rng.uniform(0, 14, (100, 2)), rng.normal(0, 3, 100)])
+
+    bvh = TriangleBVH(vertices, triangles, leaf_size=4)
+    _, d_cold, _, _ = bvh.query(points)
+    _, d_warm, _, _ = bvh.query(points, init_tri=rng.integers(0, len(triangles), 100))
+    _, d_ref, _, _ = closest_points_on_mesh(points, vertices, triangles)
+
+    assert np.allclose(d_cold, d_ref)
+    assert np.allclose(d_warm, d_ref)
+
+
+# CORRESPONDENCE CACHE TESTS BELOW
+
+# test that cached answers stay exact while the points and the mesh move a little
+def testCorrespondenceCacheStaysExact():
+    rng = np.random.default_rng(7)
+    vertices = rng.normal(0, 10, (150, 3))
+    triangles = np.array([rng.choice(150, 3, replace=False) for _ in range(250)])
+    points = rng.normal(0, 12, (60, 3))
+
+    cache = CorrespondenceCache(margin=0.3)
+    for step in range(5):
+        moved_points = points + rng.normal(0, 0.05, points.shape)
+        moved_vertices = vertices + rng.normal(0, 0.02, vertices.shape)
+        closest, distances, _, _ = closest_points_on_mesh(moved_points, moved_vertices, triangles, cache=cache)
+        c_ref, d_ref, _, _ = closest_points_on_mesh(moved_points, moved_vertices, triangles)
+
+        assert np.allclose(distances, d_ref)
+        assert np.allclose(closest, c_ref)
+
+    assert cache.misses >= 60
+    assert cache.hits > 0
+
+
+# test that samples that moved more than the margin always get a full query
+def test_correspondence_cache_miss_on_large_motion():
+    vertices = np.array([
+        [0,0,0],
+        [1,0,0],
+        [0,1,0],
+        [1,1,0]
+    ])
+    triangles = np.array([
+        [0,1,2],
+        [1,3,2]
+    ])
+    cache = CorrespondenceCache(margin=0.1)
+    cache.query(np.array([[0.2, 0.2, 1.0]]), vertices, triangles)
+    cache.query(np.array([[0.25, 0.2, 1.0]]), vertices, triangles)
+    _, distances, idx, _ = cache.query(np.array([[0.9, 0.8, 1.0]]), vertices, triangles)
+
+    assert cache.hits == 1
+    assert cache.misses == 2
+    assert idx[0] == 1
+    assert np.isclose(distances[0], 1.0)
+
+
+# test that the radius search finds the same pairs with and without the tree
+def testTrianglesWithinMatchesBVH():
+    rng = np.random.default_rng(8)
+    vertices = rng.normal(0, 10, (100, 3)) + [20, 0, -10]
+    triangles = np.array([rng.choice(100, 3, replace=False) for _ in range(150)])
+    points = rng.normal(0, 10, (30, 3)) + [20, 0, -10]
+    radii = rng.uniform(1, 6, 30)
+
+    q_ref, t_ref, _ = triangles_within(points, radii, vertices, triangles, max_block_bytes=8192)
+    q_idx, t_idx, _ = triangles_within(points, radii, vertices, triangles, index=TriangleBVH(vertices, triangles))
+    assert set(zip(q_ref.tolist(), t_ref.tolist())) == set(zip(q_idx.tolist(), t_idx.tolist()))
+
+
+# REGISTRATION TESTS BELOW
+
+# test that the batched registration gives the same transforms as registering each frame by itself
+def testRegisterPointsBatchMatchesSingle():
+    rng = np.random.default_rng(9)
+    A = rng.normal(0, 10, (6, 3))
+    frames = []
+    for _ in range(10):
+        Q, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+        frames.append(A @ Q.T + rng.normal(0, 5, 3) + rng.normal(0, 0.05, (6, 3)))
+    frames = np.array(frames)
+
+    R, t = register_points_batch(A, frames)
+    R_q, t_q = register_points_batch(A, frames, method='quaternion')
+    for f in range(10):
+        R_ref, t_ref = register_points(A, frames[f])
+        assert np.allclose(R[f], R_ref)
+        assert np.allclose(t[f], t_ref)
+    assert np.allclose(R_q, R)
+    assert np.allclose(t_q, t)
+    assert np.allclose(np.linalg.det(R), 1.0)
+
+
+# test that the inverse transform undoes the transform
+def test_apply_inverse_transform_round_trip():
+    R, _ = np.linalg.qr(np.array([[1.0, 2, 0], [0, 1, 3], [2, 0, 1]]))
+    t = np.array([5.0, -2.0, 7.0])
+    points = np.array([[1.0, 2, 3], [-4, 0, 2]])
+
+    R_inv, t_inv = apply_inverse_transform(R, t)
+    assert np.allclose(apply_transform(R_inv, t_inv, apply_transform(R, t, points)), points)
+
+
+# PARSER TESTS BELOW
+
+# test that comma separated and space separated body files give the same arrays
+def testReadBodyCommaAndSpace(tmp_path):
+    spaced = tmp_path / "spaced.txt"
+    comma = tmp_path / "comma.txt"
+    spaced.write_text("2 body.txt\n 1.5  -2.0   3.25\n 4.0 5.0 6.0\n 0.1 0.2 0.3\n")
+    comma.write_text("2, body.txt\n 1.5, -2.0,  3.25\n4.0,5.0,6.0\n0.1, 0.2, 0.3\n")
+
+    markers_s, tip_s = read_body(str(spaced))
+    markers_c, tip_c = read_body(str(comma))
+
+    assert np.array_equal(markers_s, [[1.5, -2.0, 3.25], [4.0, 5.0, 6.0]])
+    assert np.array_equal(tip_s, [0.1, 0.2, 0.3])
+    assert np.array_equal(markers_s, markers_c)
+    assert np.array_equal(tip_s, tip_c)
+
+
+# test that the sample readings come back as one (Nsamps x Ns x 3) array
+def test_read_sample_readings_tensor(tmp_path):
+    readings = tmp_path / "readings.txt"
+    readings.write_text("2, 3, readings.txt 4\n1,2,3\n4,5,6\n7,8,9\n10,11,12\n13,14,15\n16,17,18\n")
+
+    frames, Ns, Nsamps, N_modes = read_sample_readings(str(readings))
+
+    assert (Ns, Nsamps, N_modes) == (2, 3, 4)
+    assert frames.shape == (3, 2, 3)
+    assert np.array_equal(frames[1], [[7, 8, 9], [10, 11, 12]])
+
+
+# test that the chunked reader and the compiled binary copy give the same frames and d_k as the whole file parse
+def testChunkedSampleReadingsMatchWholeFile(tmp_path):
+    rng = np.random.default_rng(21)
+    A_markers, B_markers = rng.normal(size=(3, 3)), rng.normal(size=(3, 3))
+    rows = rng.normal(size=(7 * 6, 3)) * 10.0
+    readings = tmp_path / "PA5-X-SampleReadingsTest.txt"
+    readings.write_text("6, 7, readings.txt 2\n" + "\n".join(f"{x:.2f}, {y:.2f}, {z:.2f}" for x, y, z in rows) + "\n")
+    frames, Ns, Nsamps, _ = read_sample_readings(str(readings))
+    expected = pre_calculate_dks(A_markers, np.ones(3), B_markers, np.zeros(3), frames, Nsamps, 3, 3)
+
+    assert read_sample_header(str(readings)) == (6, 7, 2)
+    chunks = list(iter_sample_readings(str(readings), chunk_frames=3))
+    assert [len(chunk) for chunk in chunks] == [3, 3, 1]
+    assert np.array_equal(np.concatenate(chunks), frames)
+
+    for binary in (False, True):
+        frame_chunks, Ns, Nsamps, N_modes = sample_chunks(str(readings), 2, binary, str(tmp_path / "cache"))
+        d_k = pre_calculate_dks_chunked(A_markers, np.ones(3), B_markers, np.zeros(3), frame_chunks, 3, 3)
+        assert (Ns, Nsamps, N_modes) == (6, 7, 2)
+        assert np.array_equal(d_k, expected)
+
+    mapped, _, _, _ = load_samples(str(readings), str(tmp_path / "cache"))
+    assert isinstance(mapped, np.memmap) and np.array_equal(mapped, frames)
+
+
+# MODEL CACHE TESTS BELOW
+
+# test that the compiled containers give the same arrays as the text parsers and only map the modes asked for
+def testModelCacheMatchesTextParse(tmp_path):
+    mesh = tmp_path / "mesh.sur"
+    mesh.write_text("3\n0 0 0\n1 0 0\n0 1 0\n1\n0 1 2 -1 -1 -1\n")
+    modes = tmp_path / "Modes.txt"
+    modes.write_text("Modes.txt Nvertices=2 Nmodes=3\nMode 0 :Average\n1, 2, 3\n4, 5, 6\n"
+                     "Mode 1\n0.1, 0, 0\n0, 0.1, 0\nMode 2\n0, 0.2, 0\n0, 0, 0.2\nMode 3\n0.3, 0, 0\n0, 0, 0.3\n")
+    cache_dir = tmp_path / "cache"
+
+    for expected, loaded in zip(read_mesh(str(mesh)), load_mesh(str(mesh), str(cache_dir))):
+        assert isinstance(loaded, np.memmap)
+        assert np.array_equal(expected, loaded)
+
+    mean, mode_vectors = load_modes(str(modes), 2, str(cache_dir))
+    assert np.array_equal(mean, [[1, 2, 3], [4, 5, 6]])
+    assert mode_vectors.shape == (2, 2, 3)
+    assert np.allclose(mode_vectors[1], [[0, 0.2, 0], [0, 0, 0.2]])
+
+
+# test that editing a source file gives a new container instead of the old arrays
+def test_model_cache_recompiles_changed_file(tmp_path):
+    body = tmp_path / "body.txt"
+    cache_dir = str(tmp_path / "cache")
+    body.write_text("1 body.txt\n1 2 3\n0 0 0\n")
+    markers, _ = load_body(str(body), cache_dir)
+    assert np.array_equal(markers, [[1, 2, 3]])
+
+    body.write_text("1 body.txt\n7 8 9\n0 0 0\n")
+    markers, _ = load_body(str(body), cache_dir)
+    assert np.array_equal(markers, [[7, 8, 9]])
+
+
+# DEFORMABLE REGISTRATION TESTS BELOW
+
+# test that the vectorized A and b match building them sample by sample and mode by mode
+def testAssembleModeSystemMatchesLoop():
+    rng = np.random.default_rng(3)
+    mean_vertices = rng.normal(size=(10, 3))
+    mode_vectors = rng.normal(size=(4, 10, 3))
+    triangles = np.array([rng.choice(10, 3, replace=False) for _ in range(6)])
+    points = rng.normal(size=(5, 3))
+    triangle_indices = rng.integers(0, 6, size=5)
+    bary_coords = rng.dirichlet(np.ones(3), size=5)
+
+    A, b = assemble_mode_system(points, triangles, triangle_indices, bary_coords, mean_vertices, mode_vectors)
+
+    for k in range(5):
+        corners = triangles[triangle_indices[k]]
+        assert np.allclose(b[3*k:3*k+3], points[k] - bary_coords[k] @ mean_vertices[corners])
+        for m in range(4):
+            assert np.allclose(A[3*k:3*k+3, m], bary_coords[k] @ mode_vectors[m][corners])
+
+
+# test that deforming the mean shape adds every mode times its weight
+def test_deform_mesh():
+    mean_vertices = np.zeros((2, 3))
+    mode_vectors = np.array([np.eye(3)[:2], 2 * np.eye(3)[1:]])
+    deformed = deform_mesh(mean_vertices, mode_vectors, np.array([1.0, -0.5]))
+    assert np.allclose(deformed, [[1, 0, 0], [0, 1, 0]] - 0.5 * np.array([[0, 2, 0], [0, 0, 2]]))
+
+
+# CONVERGENCE TESTS BELOW
+
+# test that both accelerations reach the fixed point of a slow linear map in fewer iterations than plain steps
+def testConvergenceAccelerationFewerIterations():
+    M = np.array([[0.9, 0.05], [0.0, 0.8]])
+    x_star = np.array([1.0, -2.0])
+
+    def iterations(**kwargs):
+        controller = ConvergenceController(500, param_tol={'step': 1e-8}, **kwargs)
+        x = np.zeros(2)
+        for _ in range(controller.max_iterations):
+            x_new = controller.accelerate(x, x_star + M @ (x - x_star))
+            step = np.linalg.norm(x_new - x)
+            x = x_new
+            if controller.check(np.linalg.norm(x - x_star), step=step):
+                break
+        assert np.allclose(x, x_star, atol=1e-6)
+        return controller.iterations
+
+    plain = iterations()
+    assert iterations(acceleration='relaxation', relaxation=1.8) < 0.6 * plain
+    assert iterations(acceleration='anderson', depth=3) < plain / 4
+
+
+# test that the accelerated default controllers reach the final error of plain iterations on debug set A in fewer steps
+def test_default_controllers_match_plain_iterations_on_debug_a():
+    folder = default_data_folder
+    pa5_files = [os.path.join(folder, name) for name in
+                 ("Problem5-BodyA.txt", "Problem5-BodyB.txt", "Problem5MeshFile.sur", "Problem5Modes.txt")]
+    pa4_files = [os.path.join(folder, name) for name in
+                 ("Problem4-BodyA.txt", "Problem4-BodyB.txt", "Problem4MeshFile.sur")]
+    mean_error = lambda s_k, c_k: np.mean(np.linalg.norm(s_k - c_k, axis=1))
+
+    for solve, files, letter, default_controller in [(solve_pa5, pa5_files, "PA5-A", default_pa5_controller),
+                                                     (solve_pa4, pa4_files, "PA4-A", default_pa4_controller)]:
+        errors, iterations = [], []
+        for acceleration in ['default', None]:
+            controller = default_controller()
+            if acceleration is None:
+                controller.acceleration = None
+            results = solve(*files, os.path.join(folder, f"{letter}-Debug-SampleReadingsTest.txt"), os.devnull,
+                            controller=controller)
+            errors.append(mean_error(results[0], results[1]))
+            iterations.append(controller.iterations)
+        assert abs(errors[0] - errors[1]) < 1e-4
+        assert iterations[0] < iterations[1]
+
+
+# test that each stopping rule reports its own reason
+def test_convergence_stopping_reasons():
+    controller = ConvergenceController(error_tol=0.1)
+    assert not controller.check(1.0)
+    assert controller.check(0.05) and controller.reason == 'error'
+
+    controller = ConvergenceController(rel_tol=1e-3)
+    assert not controller.check(1.0)
+    assert controller.check(0.9995) and controller.reason == 'relative'
+
+    controller = ConvergenceController(param_tol={'rotation': 1e-6, 'translation': 1e-4})
+    assert not controller.check(1.0, rotation=1e-7, translation=1e-3)
+    assert controller.check(1.0, rotation=1e-7, translation=1e-5) and controller.reason == 'parameters'
+
+    controller = ConvergenceController(stagnation_window=3)
+    for error in [1.0, 0.5, 0.6, 0.7]:
+        assert not controller.check(error)
+    assert controller.check(0.5) and controller.reason == 'stagnation'
+
+    # an error that grew restarts anderson, the step after it is the plain update
+    controller = ConvergenceController(acceleration='anderson')
+    controller.accelerate(np.zeros(2), np.ones(2))
+    assert not np.allclose(controller.accelerate(np.ones(2), np.array([1.5, 2.0])), [1.5, 2.0])
+    assert not controller.check(1.0) and not controller.check(2.0)
+    assert controller.n_restarts == 1
+    assert np.allclose(controller.accelerate(np.array([1.5, 2.0]), np.array([1.7, 2.2])), [1.7, 2.2])
+
+
+# test that frames survive the conversion to and from the 6 number parameter vector
+def test_transform_parameters_round_trip():
+    R = rotation_from_vector(np.array([0.4, -1.1, 2.0]))
+    t = np.array([3.0, -1.0, 0.5])
+    R2, t2 = transform_from_parameters(transform_parameters(R, t))
+    assert np.allclose(R, R2) and np.allclose(t, t2)
+    assert np.allclose(R @ R.T, np.eye(3))
+    assert np.isclose(rotation_angle(R), np.linalg.norm([0.4, -1.1, 2.0]))
+
+
+# uv sphere mesh of the given radius, used by the tests that need a closed surface
+def make_uv_sphere(n_theta=12, n_phi=24, radius=10.0):
+    theta = np.linspace(0, np.pi, n_theta + 1)[1:-1]
+    phi = np.linspace(0, 2 * np.pi, n_phi, endpoint=False)
+    tt, pp = np.meshgrid(theta, phi, indexing='ij')
+    vertices = np.column_stack([np.sin(tt).ravel() * np.cos(pp).ravel(),
+                                np.sin(tt).ravel() * np.sin(pp).ravel(), np.cos(tt).ravel()])
+    vertices = np.vstack([vertices, [0, 0, 1], [0, 0, -1]]) * radius
+    top, bottom = len(vertices) - 2, len(vertices) - 1
+    ring = lambda i, j: i * n_phi + j % n_phi
+    triangles = []
+    for i in range(n_theta - 2):
+        for j in range(n_phi):
+            triangles += [[ring(i, j), ring(i + 1, j), ring(i + 1, j + 1)], [ring(i, j), ring(i + 1, j + 1), ring(i, j + 1)]]
+    for j in range(n_phi):
+        triangles += [[top, ring(0, j), ring(0, j + 1)], [bottom, ring(n_theta - 2, j + 1), ring(n_theta - 2, j)]]
+    triangles = np.array(triangles)
+    return vertices, triangles
+
+
+# test that the joint Gauss-Newton solve recovers a known pose and mode weights on a deformed sphere
+def testRegisterPoseAndModesRecoversTruth():
+    vertices, triangles = make_uv_sphere()
+
+    # modes stretch the sphere along x and along z
+    mode_vectors = np.array([vertices * [0.1, 0, 0], vertices * [0, 0, 0.1]])
+    lambdas_true = np.array([1.5, -2.0])
+    deformed = deform_mesh(vertices, mode_vectors, lambdas_true)
+
+    # samples on the deformed surface, seen through a small unknown pose
+    rng = np.random.default_rng(11)
+    tri = rng.integers(0, len(triangles), 200)
+    bary = rng.dirichlet(np.ones(3), 200)
+    surface = np.einsum('nj,njd->nd', bary, deformed[triangles[tri]])
+    R_true = rotation_from_vector(np.array([0.03, -0.02, 0.04]))
+    t_true = np.array([0.3, -0.2, 0.1])
+    d_k_points = apply_transform(*apply_inverse_transform(R_true, t_true), surface)
+
+    controller = ConvergenceController(30, param_tol={'lambda': 1e-6, 'rotation': 1e-8, 'translation': 1e-6})
+    R_reg, t_reg, lambdas, _, _ = register_pose_and_modes(d_k_points, triangles, vertices, mode_vectors, controller)
+
+    assert controller.converged and controller.iterations < 15
+    assert np.allclose(lambdas, lambdas_true, atol=1e-3)
+    assert np.allclose(R_reg, R_true, atol=1e-4)
+    assert np.allclose(t_reg, t_true, atol=1e-3)
+
+
+# NORMAL EQUATION TESTS BELOW
+
+# test that adding the rows in blocks gives the same answer and residual as lstsq on the whole system
+def testNormalEquationsMatchLstsq():
+    rng = np.random.default_rng(8)
+    A = rng.normal(size=(300, 6)) * [1, 10, 100, 0.1, 1, 5]
+    b = rng.normal(size=300)
+
+    normal_eq = NormalEquationAccumulator(6)
+    for start in range(0, 300, 64):
+        normal_eq.add(A[start:start + 64], b[start:start + 64])
+
+    x, residual, _, _ = np.linalg.lstsq(A, b, rcond=None)
+    assert normal_eq.n_rows == 300
+    assert np.allclose(normal_eq.solve(), x)
+    assert np.isclose(normal_eq.residual(x), residual[0])
+
+
+# test the row weights, the Tikhonov term and the fallback for a singular system
+def test_normal_equations_weights_and_regularization():
+    A = np.array([[1.0, 0], [0, 1], [1, 1]])
+    b = np.array([1.0, 2, 4])
+    w = np.array([1.0, 2.0, 0.5])
+
+    normal_eq = NormalEquationAccumulator(2)
+    normal_eq.add(A, b, weights=w)
+    expected = np.linalg.lstsq(A * np.sqrt(w)[:, None], b * np.sqrt(w), rcond=None)[0]
+    assert np.allclose(normal_eq.solve(), expected)
+
+    normal_eq.regularization = 1e6
+    assert np.linalg.norm(normal_eq.solve()) < 1e-3
+
+    singular = NormalEquationAccumulator(2)
+    singular.add(np.array([[1.0, 1.0], [2.0, 2.0]]), np.array([2.0, 4.0]))
+    assert np.allclose(singular.solve(), [1.0, 1.0])
+
+
+# MESH PYRAMID TESTS BELOW
+
+# test that every level of a sphere is still a closed manifold sphere with fewer triangles
+def testMeshPyramidLevelsStayClosed():
+    vertices, triangles = make_uv_sphere()
+    pyramid = MeshPyramid(vertices, triangles, n_levels=3, ratio=0.5)
+    assert len(pyramid) == 3
+
+    counts = [len(pyramid.level_triangles[level]) for level in range(3)]
+    assert counts[0] == len(triangles) and counts[0] > counts[1] > counts[2]
+    assert counts[2] <= len(triangles) * 0.25 + 2
+
+    for level in range(3):
+        level_vertices, level_triangles = pyramid.mesh(level)
+        edges = np.sort(level_triangles[:, [0, 1, 1, 2, 2, 0]].reshape(-1, 2), axis=1)
+        unique_edges, uses = np.unique(edges, axis=0, return_counts=True)
+        # every edge has two triangles and V - E + F = 2
+        assert np.all(uses == 2)
+        assert len(level_vertices) - len(unique_edges) + len(level_triangles) == 2
+        assert len(pyramid.labels[level]) == len(vertices)
+
+
+# test that coarsening a deformed mesh is the same as deforming the coarsened mean with the coarsened modes
+def test_mesh_pyramid_coarsen_modes():
+    vertices, triangles = make_uv_sphere()
+    mode_vectors = np.array([vertices * [0.1, 0, 0], np.roll(vertices, 1, axis=1) * 0.05])
+    lambdas = np.array([1.5, -2.0])
+    pyramid = MeshPyramid(vertices, triangles, n_levels=2)
+
+    coarse_mean, _ = pyramid.mesh(1)
+    coarse_modes = pyramid.coarsen(mode_vectors, 1)
+    assert coarse_modes.shape == (2, len(coarse_mean), 3)
+    assert np.allclose(pyramid.coarsen(deform_mesh(vertices, mode_vectors, lambdas), 1),
+                       deform_mesh(coarse_mean, coarse_modes, lambdas))
+    # averages of points on the sphere stay inside it
+    assert np.all(np.linalg.norm(coarse_mean, axis=1) <= 10.0 + 1e-9)
+
+
+# VOXEL GRID TESTS BELOW
+
+# test that the candidate lists of the grid give the same closest points as the brute force scan, inside and
+# outside the stored cells
+def testClosestTriangleGridMatchesBruteForce():
+    vertices, triangles = make_uv_sphere()
+    grid = ClosestTriangleGrid(vertices, triangles, workers=1)
+
+    rng = np.random.default_rng(12)
+    points = rng.uniform(-14, 14, size=(400, 3))
+    rows = grid.cell_of(points)
+    assert np.any(rows >= 0) and np.any(rows < 0)
+    assert grid.candidate_counts().max() < len(triangles) / 4
+
+    expected = closest_points_on_mesh(points, vertices, triangles)
+    found = grid.query(points)
+    assert np.allclose(found[0], expected[0])
+    assert np.allclose(found[1], expected[1])
+
+
+# test that the grid is stored next to the compiled mesh, mapped on the next load and the same with build workers
+def test_closest_triangle_grid_disk_cache(tmp_path):
+    vertices, triangles = make_uv_sphere(6, 12)
+    mesh = tmp_path / "sphere.sur"
+    lines = [str(len(vertices))] + [" ".join(map(str, v)) for v in vertices] + [str(len(triangles))]
+    mesh.write_text("\n".join(lines + [" ".join(map(str, t)) + " -1 -1 -1" for t in triangles]) + "\n")
+    cache_dir = str(tmp_path / "cache")
+
+    built = load_grid(str(mesh), cache_dir=cache_dir, workers=2)
+    loaded = load_grid(str(mesh), cache_dir=cache_dir)
+    assert isinstance(loaded.candidates, np.memmap)
+    serial = ClosestTriangleGrid(*read_mesh(str(mesh))[:2], workers=1)
+    for name, array in serial.arrays().items():
+        assert np.array_equal(array, loaded.arrays()[name])
+        assert np.array_equal(array, built.arrays()[name])
+
+
+# SUBSAMPLING TESTS BELOW
+
+# test that the subsets are reproducible, cover every Morton run, grow to the full set and trim the worst rows
+def testSampleScheduleDrawsAndGrows():
+    points = np.random.default_rng(13).uniform(-10, 10, size=(1000, 3))
+    sampling = SampleSchedule(start_fraction=0.05, growth=4.0, seed=3)
+    sampling.reset(points)
+    first = sampling.draw()
+    assert len(first) == 50 and np.array_equal(first, sampling.draw())
+
+    # one sample from each run of the Morton order
+    position = np.empty(1000, dtype=int)
+    position[sampling.order] = np.arange(1000)
+    assert np.array_equal(np.sort(position[first]) // 20, np.arange(50))
+
+    sampling.reset(points)
+    assert np.array_equal(sampling.draw(), first)
+
+    # no growth while the error still drops, then 50 -> 200 -> 800 -> 1000
+    assert not sampling.update(1.0) and not sampling.update(0.5)
+    assert sampling.update(0.49) and len(sampling.draw()) == 200
+    assert sampling.update(0.3, stop=True) and sampling.update(0.2, stop=True)
+    assert sampling.full and np.array_equal(sampling.draw(), np.arange(1000))
+
+    sampling.trim = 0.1
+    residuals = np.arange(100.0)[::-1]
+    keep = sampling.trim_mask(residuals)
+    assert keep.sum() == 90 and not keep[:10].any()
+
+
+# test that an iteration on a subset never stops the loop and resets the controller when the subset grows
+def test_sample_schedule_after_iteration():
+    sampling = SampleSchedule(start_fraction=0.25, growth=4.0)
+    sampling.reset(np.random.default_rng(15).uniform(-10, 10, size=(100, 3)))
+    controller = ConvergenceController(abs_tol=1e-3)
+    controller.check(1.0)
+    assert not sampling.after_iteration(1.0, True, controller)
+    assert sampling.full and controller.iterations == 0
+    assert sampling.after_iteration(0.5, True, controller)
+    assert not sampling.after_iteration(0.5, False, controller)
+
+
+# test that a run on a subset with trimmed residuals still finds the pose when 5% of the samples are outliers
+def test_run_icp_with_sampling_and_outliers():
+    vertices, triangles = make_uv_sphere(16, 32)
+    vertices = vertices * [1.0, 0.6, 0.35]
+    rng = np.random.default_rng(14)
+    tri = rng.integers(0, len(triangles), 1000)
+    surface = np.einsum('nj,njd->nd', rng.dirichlet(np.ones(3), 1000), vertices[triangles[tri]])
+    outliers = rng.random(1000) < 0.05
+    surface[outliers] += rng.normal(size=(outliers.sum(), 3)) * 3.0
+    R_true = rotation_from_vector(np.array([0.02, -0.03, 0.04]))
+    t_true = np.array([0.5, -0.3, 0.2])
+    d_k_points = apply_transform(*apply_inverse_transform(R_true, t_true), surface)
+
+    results = []
+    for _ in range(2):
+        sampling = SampleSchedule(start_fraction=0.1, trim=0.1, seed=5)
+        sampling.reset(d_k_points)
+        results.append(run_icp(d_k_points, vertices, triangles, default_pa4_controller(100, 1e-8), np.eye(3),
+                               np.zeros(3), index=TriangleBVH(vertices, triangles), sampling=sampling))
+
+    R_reg, t_reg, s_k, c_k = results[0]
+    assert sampling.full and len(s_k) == len(c_k) == 1000
+    assert rotation_angle(R_reg, R_true) < 1e-3
+    assert np.linalg.norm(t_reg - t_true) < 1e-2
+    # the same seed gives the same run
+    assert np.array_equal(results[0][0], results[1][0]) and np.array_equal(results[0][2], results[1][2])
+
+
+# SHARED MEMORY BATCH TESTS BELOW
+
+# test that attached views see the creator's arrays without copying and cannot be written to
+def testSharedArraysAttachSeesSameData():
+    arrays = {"vertices": np.arange(12.0).reshape(4, 3), "triangles": np.array([[0, 1, 2], [1, 2, 3]], dtype=np.int32),
+              "tip": np.array([1.5, -2.0, 0.25]), "empty": np.zeros((0, 3))}
+    shared = SharedArrays(arrays)
+    try:
+        attached = SharedArrays.attach(shared.spec)
+        for key, array in arrays.items():
+            assert attached.arrays[key].dtype == array.dtype
+            assert np.array_equal(attached.arrays[key], array)
+            assert not attached.arrays[key].flags.writeable
+        assert attached.arrays["triangles"].ctypes.data % 64 == 0
+        attached.close()
+    finally:
+        shared.unlink()
+
+
+# test that a PA4 batch on two worker processes writes the same outputs as separate solve_pa4 runs
+def test_run_batch_matches_single_runs(tmp_path):
+    sample_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sample")
+    for source, name in (("Sample-BodyA.txt", "Problem4-BodyA.txt"), ("Sample-BodyB.txt", "Problem4-BodyB.txt"),
+                         ("SampleMeshFile.sur", "Problem4MeshFile.sur")):
+        (tmp_path / name).write_text(open(os.path.join(sample_folder, source)).read())
+    readings = open(os.path.join(sample_folder, "PA-4-SampleReadings.txt")).read()
+    for letter in "XY":
+        (tmp_path / f"PA4-{letter}-Debug-SampleReadingsTest.txt").write_text(readings)
+
+    sample_files = find_samples(["PA4-*-SampleReadingsTest.txt"], 4, str(tmp_path))
+    rows = run_batch(4, sample_files, str(tmp_path / "out"), jobs=2, data_folder=str(tmp_path),
+                     cache_dir=str(tmp_path / "cache"))
+    assert [r["status"] for r in rows] == ["ok", "ok"]
+    assert [r["samples"] for r in rows] == [75, 75]
+
+    for sample_file in sample_files:
+        expected = str(tmp_path / "single.txt")
+        solve_pa4(*problem_files(4, str(tmp_path))[:3], sample_file, expected, cache_dir=str(tmp_path / "cache"))
+        batch = open(output_path(sample_file, str(tmp_path / "out"))).read().splitlines()
+        assert batch[1:] == open(expected).read().splitlines()[1:]
+
+
+# THREADED QUERY TESTS BELOW
+
+# test that BVH and grid queries split over threads give exactly the single thread answers for any thread count
+def testThreadedQueriesMatchSingleThread():
+    vertices, triangles = make_uv_sphere(16, 32)
+    rng = np.random.default_rng(19)
+    points = rng.uniform(-12.0, 12.0, (3000, 3))
+    init_tri = rng.integers(0, len(triangles), len(points))
+
+    for index in (TriangleBVH(vertices, triangles), ClosestTriangleGrid(vertices, triangles, workers=1)):
+        expected = index.query(points)
+        warm = index.query(points, init_tri=init_tri)
+        for threads in (1, 3):
+            with ThreadPoolExecutor(threads) as pool:
+                index.pool = pool
+                for a, b in zip(expected, index.query(points)):
+                    assert np.array_equal(a, b)
+                for a, b in zip(warm, index.query(points, init_tri=init_tri)):
+                    assert np.array_equal(a, b)
+            index.pool = None
+
+
+# test that the brute force search splits over threads without changing an answer, also in a whole PA4 solve
+def test_threaded_brute_force_matches_single_thread(tmp_path, monkeypatch):
+    vertices, triangles = make_uv_sphere(16, 32)
+    points = np.random.default_rng(21).uniform(-12.0, 12.0, (3000, 3))
+    table = TriangleTable(vertices, triangles)
+    expected = closest_points_on_mesh(points, vertices, triangles, table=table)
+    with ThreadPoolExecutor(3) as pool:
+        table.pool = pool
+        for a, b in zip(expected, closest_points_on_mesh(points, vertices, triangles, table=table)):
+            assert np.array_equal(a, b)
+
+    files = [os.path.join(default_data_folder, name) for name in
+             ("Problem4-BodyA.txt", "Problem4-BodyB.txt", "Problem4MeshFile.sur", "PA4-A-Debug-SampleReadingsTest.txt")]
+    # the 75 samples of set A only make several chunks with smaller ones
+    monkeypatch.setattr(ICP_algo, "_THREAD_CHUNK_SIZE", 16)
+    outputs = [str(tmp_path / "single.txt"), str(tmp_path / "threads.txt")]
+    for output, threads in zip(outputs, (None, 3)):
+        solve_pa4(*files, output, use_bvh=False, threads=threads)
+    # the header line has the output file name
+    assert open(outputs[0]).readlines()[1:] == open(outputs[1]).readlines()[1:]
+
+
+# STREAMING TESTS BELOW
+
+# test that frames streamed from a text stream find the mode weight the batch solver finds, with a latency per frame
+def testStreamingRegistrationMatchesBatchSolve():
+    mean_vertices, triangles = make_uv_sphere(16, 32)
+    mean_vertices = mean_vertices * [1.0, 0.6, 0.35]
+    modes = (mean_vertices / 10.0)[None]
+    rng = np.random.default_rng(20)
+    deformed = deform_mesh(mean_vertices, modes, [2.0])
+    tri = rng.integers(0, len(triangles), 300)
+    d_k_true = np.einsum('nj,njd->nd', rng.dirichlet(np.ones(3), 300), deformed[triangles[tri]])
+    d_k_true += rng.normal(scale=0.01, size=d_k_true.shape)
+
+    # body B stays where it is defined and the tip of body A sits at its origin, so d_k is the shift of body A
+    A_markers = np.array([[1.0, 0, 0], [0, 1.0, 0], [0, 0, 1.0], [1.0, 1.0, 1.0]])
+    B_markers = np.array([[5.0, 0, 0], [0, 5.0, 0], [0, 0, 5.0], [-5.0, 0, 0]])
+    lines = ["8, 300, stream.txt 1"]
+    for d_k in d_k_true:
+        lines += [f"{x:.6f}, {y:.6f}, {z:.6f}" for x, y, z in np.vstack([A_markers + d_k, B_markers])]
+    stream = io.StringIO("\n".join(lines) + "\n")
+
+    Ns, Nsamps, N_modes = read_stream_header(stream)
+    assert (Ns, Nsamps, N_modes) == (8, 300, 1)
+    registration = StreamingRegistration(A_markers, np.zeros(3), B_markers, np.zeros(3), mean_vertices, modes,
+                                         triangles, window=32)
+    results = list(registration.run(stream_frames(stream, Ns)))
+
+    assert len(results) == 300 and len(registration.latencies) == 300
+    assert np.allclose(results[-1]["d_k"], d_k_true[-1], atol=1e-4)
+    _, _, lambdas, _, _ = register_modes_alternating(d_k_true, triangles, mean_vertices, modes,
+                                                     default_pa5_controller(50))
+    assert abs(registration.lambdas[0] - 2.0) < 0.02
+    assert abs(registration.lambdas[0] - lambdas[0]) < 0.01
+    assert np.mean([r["distance"] for r in results[-50:]]) < 0.05
+    assert set(latency_percentiles(registration.latencies)) == {50, 90, 99, 100}
+    assert results[-1]["k"] == 299 and registration.d_k_points is None
+    with pytest.raises(ValueError):
+        registration.current_points()
+    with pytest.raises(ValueError):
+        StreamingRegistration(A_markers, np.zeros(3), B_markers, np.zeros(3), mean_vertices, modes, triangles,
+                              iterations=0)
+
+# BENCHMARK TESTS BELOW
+
+# a small generated model has the BVH agree with the brute force closest point and recovers the generated lambdas
+def testSyntheticBenchmarkMatchesBruteForce():
+    results = measure_synthetic([(500, 200, 4)], brute_force_samples=16)
+    assert results[0]["brute_force_mismatches"] == 0
+    assert results[0]["lambda_error"] < 0.05
+    assert results[0]["triangles"] >= 400 and results[0]["modes"] == 4
+
+# comparing against a baseline flags slower stages, worse errors and brute force mismatches only
+def test_compare_results_flags_regressions():
+    baseline = {"stages": [dict({name: 0.010 for name in stage_names + ["solve_pa5"]}, data="A")],
+                "synthetic": [{"case": "T1", "index": 0.1, "correspondence": 0.1, "solve": 0.5,
+                               "lambda_error": 0.01, "brute_force_mismatches": 0}]}
+    assert compare_results(baseline, baseline) == []
+
+    results = {"stages": [dict(baseline["stages"][0], d_k=0.030, parse=0.011, output=0.016)],
+               "synthetic": [dict(baseline["synthetic"][0], lambda_error=0.5, brute_force_mismatches=2)]}
+    messages = compare_results(results, baseline)
+    assert len(messages) == 4
+    assert any("d_k" in m for m in messages) and any("output" in m for m in messages)
+    assert any("lambda_error" in m for m in messages) and any("brute force" in m for m in messages)
+
+# a data set fails against its answer file once one difference is above its tolerance, a rounding step is not one
+def test_answer_failures_uses_absolute_tolerances():
+    row = {"data": "A", "lambda_error": 0.03, "s_error": 0.01 + 1e-12, "c_error": 0.01}
+    assert answer_failures([row]) == []
+    messages = answer_failures([row, dict(row, data="B", lambda_error=28.5, c_error=4.1)])
+    assert len(messages) == 2 and all(m.startswith("answers B") for m in messages)
+    assert any("lambda_error" in m for m in messages) and any("c_error" in m for m in messages)
+    # a known miss of the solver does not fail the run, it only counts for compare_results once it gets worse
+    assert answer_failures([dict(row, data="B", lambda_error=28.5, known_failure=True)]) == []
+    baseline = {"solver": "alternating", "answers": [dict(row, data="B", lambda_error=28.5)]}
+    worse = {"solver": "alternating", "answers": [dict(row, data="B", lambda_error=40.0)]}
+    assert len(compare_results(worse, baseline)) == 1
+    assert compare_results(dict(worse, solver="joint"), baseline) == []
+
+# SERVER TESTS BELOW
+
+# a job sent to the resident server writes the same output as solve_pa5, a bad job only gets an error reply
+def testServerJobMatchesSolvePa5(tmp_path):
+    service = RegistrationService(default_data_folder, cache_dir=str(tmp_path / "cache"))
+    server = RegistrationServer(service, str(tmp_path / "pa5.sock"))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        reply = send_request({"action": "register", "letter": "a", "output_dir": str(tmp_path)}, server.socket_path)
+        assert reply["status"] == "ok" and reply["samples"] == 150
+        missing = send_request({"action": "register", "sample": str(tmp_path / "none.txt")}, server.socket_path)
+        assert missing["status"] == "error" and "FileNotFoundError" in missing["message"]
+        # the second job starts from a fresh copy of the BVH, not the one the first job deformed
+        again = send_request({"action": "register", "letter": "A", "output_dir": str(tmp_path)}, server.socket_path)
+        assert again["lambdas"] == reply["lambdas"]
+        assert send_request({"action": "status"}, server.socket_path)["jobs"] == 2
+        assert send_request({"action": "shutdown"}, server.socket_path)["status"] == "ok"
+        thread.join(10)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert not thread.is_alive() and not os.path.exists(server.socket_path)
+
+    sample_file, output_name = service.letter_files("A")
+    expected = str(tmp_path / "expected.txt")
+    solve_pa5(*service.files, sample_file, expected, cache_dir=str(tmp_path / "cache"))
+    assert open(reply["output"]).read() == open(expected).read()
+    assert os.path.basename(reply["output"]) == output_name
+
+# a socket file nobody listens on is replaced, a running server and a file that is not a socket are left alone
+def test_server_only_replaces_stale_sockets(tmp_path):
+    socket_path = str(tmp_path / "pa5.sock")
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+    server = RegistrationServer(None, socket_path)
+    try:
+        with pytest.raises(OSError, match="already listening"):
+            RegistrationServer(None, socket_path)
+        assert os.path.exists(socket_path)
+    finally:
+        server.server_close()
+
+    other_file = tmp_path / "notes.txt"
+    other_file.write_text("keep")
+    with pytest.raises(FileExistsError):
+        RegistrationServer(None, str(other_file))
+    assert other_file.read_text() == "keep"
+
+# TELEMETRY TESTS BELOW
+
+# a recorded solve counts the hot calls, keeps one record per iteration and writes both export formats
+def testTelemetryRecordsSolverIterations(tmp_path):
+    mean_vertices, triangles = make_uv_sphere()
+    modes = (mean_vertices / 10.0)[None]
+    d_k_points = deform_mesh(mean_vertices, modes, [1.5])[::3] + 0.01
+
+    with telemetry.recording() as recorded:
+        _, _, lambdas, _, _ = register_modes_alternating(d_k_points, triangles, mean_vertices, modes,
+                                                         default_pa5_controller(20))
+    n_iterations = len(recorded.iterations)
+    assert n_iterations >= 2 and abs(lambdas[0] - 1.5) < 0.05
+    assert recorded.counters["pa5.alternating"][0] == 1
+    assert recorded.counters["closest_points_on_mesh"][0] == 2 * n_iterations
+    assert recorded.counters["register_points"][0] == n_iterations
+    assert recorded.counters["lstsq"][0] == n_iterations
+    assert recorded.iterations[0]["correspondence_changes"] is None
+    assert recorded.iterations[-1]["correspondence_changes"] is not None
+    assert recorded.iterations[-1]["delta_lambda"] < recorded.iterations[0]["delta_lambda"]
+
+    recorded.write_jsonl(tmp_path / "run.jsonl")
+    records = [json.loads(line) for line in open(tmp_path / "run.jsonl")]
+    assert sum(r["type"] == "iteration" for r in records) == n_iterations
+    recorded.write_chrome_trace(tmp_path / "trace.json")
+    events = json.load(open(tmp_path / "trace.json"))["traceEvents"]
+    assert sum(e["ph"] == "X" for e in events) == sum(calls for calls, _ in recorded.counters.values())
+
+# nothing is recorded once telemetry is off again
+def test_telemetry_off_records_nothing():
+    with telemetry.recording() as recorded:
+        register_points(np.eye(3), np.eye(3) + 1.0)
+    register_points(np.eye(3), np.eye(3) + 1.0)
+    assert telemetry.active() is None
+    assert recorded.counters["register_points"][0] == 1
+
+# JIT KERNEL TESTS BELOW
+
+# the fused kernels (compiled with numba, plain python without it) give the same answers as the numpy backend
+def testJitKernelsMatchNumpyBackend(monkeypatch):
+    vertices, triangles = make_uv_sphere(8, 12)
+    vertices = vertices * [1.0, 0.7, 0.4]
+    # plus a degenerate triangle, both backends must treat it the same
+    vertices = np.vstack([vertices, [[0, 0, 0], [1, 1, 1], [2, 2, 2]]])
+    triangles = np.vstack([triangles, [[len(vertices) - 3, len(vertices) - 2, len(vertices) - 1]]])
+    points = np.random.default_rng(25).uniform(-12, 12, (200, 3))
+    table = TriangleTable(vertices, triangles)
+    P = points - table.origin
+
+    monkeypatch.setattr(jit_kernels, "enabled", False)
+    expected = closest_points_on_mesh(points, vertices, triangles)
+    closest, distances, tri, bary = _closest_point_results(points, table, *jit_kernels.closest_points_all(P, table))
+    assert np.allclose(closest, expected[0], atol=1e-10) and np.allclose(distances, expected[1], atol=1e-10)
+    # a different triangle can only win where both are equally close, like at a shared vertex
+    assert np.allclose(closest[tri != expected[2]], expected[0][tri != expected[2]], atol=1e-10)
+    assert np.allclose(table.points_at(tri, bary[:, 1], bary[:, 2]), closest)
+
+    pairs = table[np.arange(len(points)) % len(triangles)]
+    expected_v, expected_w, expected_sq = _closest_points_pairs(P, pairs)
+    v, w, sq = jit_kernels.closest_points_pairs(P, pairs)
+    assert np.allclose(v, expected_v, atol=1e-12) and np.allclose(w, expected_w, atol=1e-12)
+    assert np.allclose(sq, expected_sq, rtol=1e-10)
+
+    # switched on, closest_points_on_mesh and the BVH use the kernels and still agree
+    monkeypatch.setattr(jit_kernels, "enabled", True)
+    assert np.allclose(closest_points_on_mesh(points, vertices, triangles)[1], expected[1], atol=1e-10)
+    assert np.allclose(TriangleBVH(vertices, triangles).query(points)[1], expected[1], atol=1e-10)
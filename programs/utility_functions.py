@@ -1,4 +1,6 @@
+import itertools
 import numpy as np
+import telemetry
 
 '''
 Created on October 4, 2025
@@ -10,6 +12,7 @@ summary: centers both point clouds, computes covariance matrix, performs SVD on
 makes sure that R is a rotation matrix, not reflection. Lastly, computes translation.
 '''
 
+@telemetry.timed("register_points")
 def register_points(A, B):
     
     assert A.shape == B.shape 
@@ -40,6 +43,91 @@ def register_points(A, B):
     
     return R, t
 
+'''
+Created on December 17, 2025
+Author: Maya Sharma
+params: model points A (N x 3), stack of measured point clouds B_stack (F x N x 3), method 'svd' or 'quaternion'
+returns: R (F x 3 x 3) and t (F x 3): one transform per frame that maps A onto that frame's points
+summary: register_points for many frames at once. Centers every frame, builds all the 3x3 covariance matrices
+with one einsum and solves them together, either with one stacked SVD (Arun's method, reflections are fixed
+per frame the same way as in register_points) or with Horn's closed form unit quaternion.
+'''
+@telemetry.timed("register_points_batch")
+def register_points_batch(A, B_stack, method='svd'):
+
+    A = np.asarray(A, dtype=float)
+    B_stack = np.asarray(B_stack, dtype=float)
+    assert B_stack.shape[1:] == A.shape
+
+    centroid_A = np.mean(A, axis=0)
+    centroid_B = np.mean(B_stack, axis=1)
+
+    AA = A - centroid_A
+    BB = B_stack - centroid_B[:, None, :]
+
+    # H[f] = AA.T @ BB[f] for every frame
+    H = np.einsum('ni,fnj->fij', AA, BB)
+
+    if method == 'svd':
+        U, S, Vt = np.linalg.svd(H)
+        R = np.einsum('fji,fkj->fik', Vt, U)
+
+        # frames where R came out as a reflection get the last row of Vt flipped
+        flip = np.linalg.det(R) < 0
+        if flip.any():
+            Vt[flip, 2, :] *= -1
+            R[flip] = np.einsum('fji,fkj->fik', Vt[flip], U[flip])
+    elif method == 'quaternion':
+        R = _quaternion_rotations(H)
+    else:
+        raise ValueError(f"unknown registration method '{method}'")
+
+    t = centroid_B - np.einsum('fij,j->fi', R, centroid_A)
+
+    return R, t
+
+'''
+Created on December 17, 2025
+Author: Maya Sharma
+params: stack of covariance matrices H (F x 3 x 3)
+returns: rotation matrices (F x 3 x 3)
+summary: Horn's method, the rotation is the unit quaternion that is the eigenvector of the largest eigenvalue
+of the symmetric 4x4 matrix built from H
+'''
+def _quaternion_rotations(H):
+    Sxx, Sxy, Sxz = H[:, 0, 0], H[:, 0, 1], H[:, 0, 2]
+    Syx, Syy, Syz = H[:, 1, 0], H[:, 1, 1], H[:, 1, 2]
+    Szx, Szy, Szz = H[:, 2, 0], H[:, 2, 1], H[:, 2, 2]
+
+    N = np.empty((len(H), 4, 4))
+    N[:, 0, 0] = Sxx + Syy + Szz
+    N[:, 0, 1] = N[:, 1, 0] = Syz - Szy
+    N[:, 0, 2] = N[:, 2, 0] = Szx - Sxz
+    N[:, 0, 3] = N[:, 3, 0] = Sxy - Syx
+    N[:, 1, 1] = Sxx - Syy - Szz
+    N[:, 1, 2] = N[:, 2, 1] = Sxy + Syx
+    N[:, 1, 3] = N[:, 3, 1] = Szx + Sxz
+    N[:, 2, 2] = -Sxx + Syy - Szz
+    N[:, 2, 3] = N[:, 3, 2] = Syz + Szy
+    N[:, 3, 3] = -Sxx - Syy + Szz
+
+    # eigh sorts the eigenvalues in ascending order
+    _, vecs = np.linalg.eigh(N)
+    q0, qx, qy, qz = np.moveaxis(vecs[:, :, -1], 1, 0)
+
+    R = np.empty((len(H), 3, 3))
+    R[:, 0, 0] = q0 * q0 + qx * qx - qy * qy - qz * qz
+    R[:, 0, 1] = 2 * (qx * qy - q0 * qz)
+    R[:, 0, 2] = 2 * (qx * qz + q0 * qy)
+    R[:, 1, 0] = 2 * (qy * qx + q0 * qz)
+    R[:, 1, 1] = q0 * q0 - qx * qx + qy * qy - qz * qz
+    R[:, 1, 2] = 2 * (qy * qz - q0 * qx)
+    R[:, 2, 0] = 2 * (qz * qx - q0 * qy)
+    R[:, 2, 1] = 2 * (qz * qy + q0 * qx)
+    R[:, 2, 2] = q0 * q0 - qx * qx - qy * qy + qz * qz
+
+    return R
+
 '''
 Created on October 2, 2025
 Author: Maya Sharma
@@ -60,121 +148,233 @@ Summary: compute inverse of transformation F = (R,t)
 '''
 def apply_inverse_transform(R, t):
     R_inv = R.T 
-    t_inv = -t @ R_inv 
+    # F^-1 = (R^T, -R^T t)
+    t_inv = -R_inv @ t
     
     
     return R_inv, t_inv
 
+'''
+Created on December 20, 2025
+Author: Maya Sharma
+params: rotation matrix R (3 x 3)
+Returns: rotation vector (3,), the rotation axis scaled by the angle in radians
+Summary: matrix logarithm of R, used to treat rotations as plain vectors when ICP updates are combined
+'''
+def rotation_vector(R):
+    angle = rotation_angle(R)
+    axis = np.array([R[2, 1] - R[1, 2], R[0, 2] - R[2, 0], R[1, 0] - R[0, 1]])
+    if angle < 1e-8:
+        return 0.5 * axis
+    if np.pi - angle < 1e-6:
+        # near 180 degrees the skew part vanishes, the axis is the largest column of R + I
+        M = R + np.eye(3)
+        col = M[:, np.argmax(np.diag(M))]
+        return angle * col / np.linalg.norm(col)
+    return angle / (2.0 * np.sin(angle)) * axis
+
+'''
+Created on December 20, 2025
+Author: Maya Sharma
+params: rotation vector w (3,)
+Returns: rotation matrix (3 x 3)
+Summary: Rodrigues' formula, the inverse of rotation_vector
+'''
+def rotation_from_vector(w):
+    angle = np.linalg.norm(w)
+    K = np.array([[0.0, -w[2], w[1]], [w[2], 0.0, -w[0]], [-w[1], w[0], 0.0]])
+    if angle < 1e-8:
+        return np.eye(3) + K
+    K /= angle
+    return np.eye(3) + np.sin(angle) * K + (1.0 - np.cos(angle)) * (K @ K)
+
+'''
+Created on December 20, 2025
+Author: Maya Sharma
+params: rotation matrix R, optionally a second rotation R_ref
+Returns: angle in radians of R, or of the rotation that takes R_ref to R
+'''
+def rotation_angle(R, R_ref=None):
+    if R_ref is not None:
+        R = R_ref.T @ R
+    return np.arccos(np.clip((np.trace(R) - 1.0) / 2.0, -1.0, 1.0))
+
+'''
+Created on December 18, 2025
+Author: Maya Sharma
+params: list of lines, index of the first line of the block, number of lines, dtype
+Returns: the block as an (n_rows x n_cols) array
+Summary: parses a whole block of numeric lines in one call. Commas are turned into spaces first so both
+comma and space separated files work, and a block that does not split into equal rows raises ValueError.
+'''
+def _parse_numeric_block(lines, start, n_rows, dtype=float):
+    if n_rows == 0:
+        return np.zeros((0, 3), dtype=dtype)
+
+    block = ' '.join(lines[start:start + n_rows]).replace(',', ' ')
+    values = np.fromstring(block, dtype=dtype, sep=' ')
+
+    if len(lines) < start + n_rows or values.size == 0 or values.size % n_rows:
+        raise ValueError(f"could not parse {n_rows} rows starting at line {start + 1}")
+
+    return values.reshape(n_rows, -1)
+
+'''
+Created on December 18, 2025
+Author: Maya Sharma
+params: header line
+Returns: the fields of the header, split on commas if there are any and on whitespace otherwise
+'''
+def _split_header(line):
+    line = line.strip()
+    if ',' in line:
+        return [x.strip() for x in line.split(',')]
+    return [x for x in line.split() if x]
+
 '''
 Created on November 9, 2025
+Updated on December 18, 2025
 Author: Maya Sharma
 params: file name 
 Returns: markers (nx3) and the tip (1x3)
 Summary: reads body definition file - handles both space and comma separated formats
 '''
+@telemetry.timed("io.read_body")
 def read_body(filename):
     
     with open(filename, 'r') as f:
-        lines = f.readlines()
+        lines = f.read().splitlines()
 
-    header_line = lines[0].strip()
-    
-    if ',' in header_line:
-        header = [x.strip() for x in header_line.split(',')]
-    else:
-        header = [x for x in header_line.split() if x]
-    
-    Nmarkers = int(header[0])
-    
-    markers = []
-    for i in range(1, Nmarkers + 1):
-        line = lines[i].strip()
-        if ',' in line:
-            coords = [x.strip() for x in line.split(',')]
-        else:
-            coords = [x for x in line.split() if x]
-        marker_coords = [float(x) for x in coords]
-        markers.append(marker_coords)
-    markers = np.array(markers)
-    
-    tip_line = lines[Nmarkers + 1].strip()
-    if ',' in tip_line:
-        tip_coords = [x.strip() for x in tip_line.split(',')]
-    else:
-        tip_coords = [x for x in tip_line.split() if x]
-    tip_coords = [float(x) for x in tip_coords]
-    tip = np.array(tip_coords)
+    Nmarkers = int(_split_header(lines[0])[0])
+
+    # the markers and the tip are one block of Nmarkers + 1 rows
+    block = _parse_numeric_block(lines, 1, Nmarkers + 1)
+    markers = block[:Nmarkers]
+    tip = block[Nmarkers]
     
     return markers, tip
 
 '''
 Created on November 6, 2025
+Updated on December 18, 2025
 Author: Maya Sharma
 params: filename
 Returns: vertices, triangles, neighbours
 Summary: reads mesh file
 '''
+@telemetry.timed("io.read_mesh")
 def read_mesh(filename):
     
     with open(filename, 'r') as f:
-        lines = f.readlines()
+        lines = f.read().splitlines()
     
     n_vertices = int(lines[0].strip())
-    
-    vertices = []
-    for i in range(1, n_vertices + 1):
-        coords = [x for x in lines[i].strip().split() if x]
-        v_coords = [float(x) for x in coords]
-        vertices.append(v_coords)
-    vertices = np.array(vertices)
+    vertices = _parse_numeric_block(lines, 1, n_vertices)
     
     n_triangles = int(lines[n_vertices + 1].strip())
-    
-    triangles = []
-    neighbours = []
-    for i in range(n_vertices + 2, n_vertices + 2 + n_triangles):
-        indices = [x for x in lines[i].strip().split() if x]
-        indices = [int(x) for x in indices]
-        triangles.append(indices[:3])
-        neighbours.append(indices[3:])
-    triangles = np.array(triangles)
-    neighbours = np.array(neighbours)
+    records = _parse_numeric_block(lines, n_vertices + 2, n_triangles, dtype=int)
+    triangles = records[:, :3].copy()
+    neighbours = records[:, 3:].copy()
     
     return vertices, triangles, neighbours
 
 '''
-Updated on December 7, 2025
+Created on December 15, 2025
+Author: Maya Sharma
+params: triangles (T x 3) and optionally the neighbours array from read_mesh
+Returns: neighbours (T x 3), entry j is the triangle across the edge opposite vertex j or -1 if there is none
+Summary: uses the neighbours from the mesh file when it has any, otherwise finds them from the shared edges
+'''
+def triangle_adjacency(triangles, neighbours=None):
+
+    triangles = np.asarray(triangles)
+    n_triangles = len(triangles)
+
+    if neighbours is not None:
+        neighbours = np.asarray(neighbours)
+        if neighbours.shape == (n_triangles, 3) and (neighbours >= 0).any():
+            return neighbours.astype(int)
+
+    # edge j of every triangle joins the two vertices other than vertex j
+    edges = np.stack([triangles[:, [1, 2]], triangles[:, [2, 0]], triangles[:, [0, 1]]], axis=1).reshape(-1, 2)
+    edges = np.sort(edges, axis=1)
+    n_vertices = edges.max() + 1 if len(edges) else 0
+    keys = edges[:, 0] * n_vertices + edges[:, 1]
+
+    # after sorting, the two triangles sharing an edge are next to each other
+    order = np.argsort(keys, kind='stable')
+    same = keys[order[1:]] == keys[order[:-1]]
+    first, second = order[:-1][same], order[1:][same]
+
+    adjacency = np.full(3 * n_triangles, -1)
+    adjacency[first] = second // 3
+    adjacency[second] = first // 3
+
+    return adjacency.reshape(n_triangles, 3)
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: header line of a sample readings file
+Returns: Ns, Nsamps and N_modes
+'''
+def _parse_sample_header(line):
+    header_parts = [x.strip() for x in line.strip().split(',')]
+    
+    Ns = int(header_parts[0])
+    Nsamps = int(header_parts[1])
+    
+    # Extract N_modes from last part: "filename N_modes"
+    N_modes = int(header_parts[2].split()[-1])
+    return Ns, Nsamps, N_modes
+
+'''
+Updated on December 23, 2025
 Author: Maya Sharma
 params: filename
-Returns: frames (which is a list of nx3 arrays), Ns, Nsamps
+Returns: frames (Nsamps x Ns x 3 array, frames[k] is the nx3 array of frame k), Ns, Nsamps, N_modes
 Summary: reads sample readings file
 '''
+@telemetry.timed("io.read_sample_readings")
 def read_sample_readings(filename):
     """Read sample readings file - returns 4 values."""
     with open(filename, 'r') as f:
-        lines = f.readlines()
+        lines = f.read().splitlines()
     
     # Parse header
-    header_line = lines[0].strip()
-    header_parts = [x.strip() for x in header_line.split(',')]
+    Ns, Nsamps, N_modes = _parse_sample_header(lines[0])
     
-    Ns = int(header_parts[0])
-    Nsamps = int(header_parts[1])
-    
-    # Extract N_modes from last part: "filename N_modes"
-    filename_and_modes = header_parts[2]
-    N_modes = int(filename_and_modes.split()[-1])
-    
-    frames = []
-    idx = 1
-    for frame in range(Nsamps):
-        records = []
-        for i in range(Ns):
-            line = lines[idx].strip()
-            coords = [float(x.strip()) for x in line.split(',') if x.strip()]
-            records.append(coords)
-            idx += 1
-        frames.append(np.array(records))
+    # all the frames are one block of Nsamps * Ns rows
+    frames = _parse_numeric_block(lines, 1, Nsamps * Ns).reshape(Nsamps, Ns, -1)
     
     # RETURN 4 VALUES, not 3
     return frames, Ns, Nsamps, N_modes
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: filename
+Returns: Ns, Nsamps and N_modes from the header line only
+'''
+def read_sample_header(filename):
+    with open(filename, 'r') as f:
+        return _parse_sample_header(f.readline())
+
+'''
+Created on December 23, 2025
+Author: Maya Sharma
+params: filename and the number of frames per block
+Returns: generator of frame blocks (chunk_frames x Ns x 3, the last one may be shorter) in file order
+Summary: reads the file chunk_frames * Ns lines at a time, so only one block of text and frames is in memory
+however long the capture is. A file that ends before its Nsamps frames raises ValueError like
+read_sample_readings.
+'''
+def iter_sample_readings(filename, chunk_frames=4096):
+    with open(filename, 'r') as f:
+        Ns, Nsamps, _ = _parse_sample_header(f.readline())
+        for start in range(0, Nsamps, chunk_frames):
+            n_frames = min(chunk_frames, Nsamps - start)
+            with telemetry.span("io.read_sample_block"):
+                lines = list(itertools.islice(f, n_frames * Ns))
+                block = _parse_numeric_block(lines, 0, n_frames * Ns).reshape(n_frames, Ns, -1)
+            yield block
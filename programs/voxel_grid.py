@@ -0,0 +1,257 @@
+# voxel_grid.py answers closest point queries on a static mesh from precomputed candidate triangles per cell
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import jit_kernels
+from ICP_algo import TriangleTable, _closest_points_pairs, _closest_point_results
+from mesh_bvh import TriangleBVH, map_chunks
+
+# the BVH each build worker queries, set up once per process by _init_worker
+_worker_bvh = None
+
+'''
+Created on December 22, 2025
+Author: Maya Sharma
+params: vertices and triangles of the mesh
+Summary: builds the BVH a build worker process uses for all of its chunks
+'''
+def _init_worker(vertices, triangles):
+    global _worker_bvh
+    _worker_bvh = TriangleBVH(vertices, triangles)
+
+'''
+Created on December 22, 2025
+Author: Maya Sharma
+params: points of one chunk
+Returns: their distance to the mesh
+'''
+def _mesh_distances(points, bvh=None):
+    return (bvh or _worker_bvh).query(points)[1]
+
+'''
+Created on December 22, 2025
+Author: Maya Sharma
+params: cell centers of one chunk, their distance to the mesh and the half diagonal of a cell
+Returns: cell (within the chunk) and triangle index of every candidate pair
+Summary: a point p of the cell with center c is at most h from c, so its closest distance is at most d(c) + h and
+its closest triangle T has |c - T| <= |p - T| + h <= d(c) + 2h. Every triangle within d(c) + 2h of the center
+is kept, which always contains the closest triangle of any point in the cell.
+'''
+def _cell_candidates(centers, distances, half_diagonal, bvh=None):
+    cell, tri, _ = (bvh or _worker_bvh).query_radius(centers, distances + 2.0 * half_diagonal)
+    return cell, tri
+
+'''
+Created on December 22, 2025
+Author: Maya Sharma
+Summary: sparse grid of cubic cells over the bounding box of a static mesh grown by margin on every side. Only the
+cells that hold points within margin of the surface are stored, each with the short list of triangles that can
+be closest to some point inside it (see _cell_candidates). The stored cells are found coarse to fine: cells
+of 8 times the size or more are halved as long as their center is within margin + half diagonal of the mesh.
+cells are the sorted flat indices of the stored cells and the candidates of cells[i] are
+candidates[offsets[i]:offsets[i + 1]]. A query only tests the candidates of its cell, so the cost no longer
+depends on the size of the mesh. Points in cells that are not stored are answered by a TriangleBVH built the
+first time one is needed. query and query_radius have the same interface as TriangleBVH, so the grid can be
+passed as index to closest_points_on_mesh. The cell size defaults to half the mean edge length and the margin to
+the mean edge length. The distance and candidate searches run in chunks of chunk_size cells on workers processes
+(os.cpu_count() by default). A grid loaded from disk is created from its stored arrays with grid_arrays.
+Like TriangleBVH, queries run in chunks of thread_chunk_size points on the threads of pool once it is set.
+'''
+class ClosestTriangleGrid:
+
+    # queries per chunk when the chunks run on a thread pool
+    thread_chunk_size = 512
+
+    def __init__(self, vertices, triangles, cell_size=None, margin=None, workers=None, chunk_size=4096,
+                 grid_arrays=None):
+        self.vertices = np.asarray(vertices, dtype=float)
+        self.triangles = np.asarray(triangles)
+        self._table = TriangleTable(self.vertices, self.triangles)
+        self._fallback = None
+        self.pool = None
+
+        if grid_arrays is not None:
+            self.lo = np.asarray(grid_arrays["lo"], dtype=float)
+            self.cell_size = float(grid_arrays["cell_size"][0])
+            self.margin = float(grid_arrays["margin"][0])
+            self.shape = tuple(int(n) for n in grid_arrays["shape"])
+            self.cells = grid_arrays["cells"]
+            self.offsets = grid_arrays["offsets"]
+            self.candidates = grid_arrays["candidates"]
+            return
+
+        corners = self.vertices[self.triangles]
+        mean_edge = np.mean(np.linalg.norm(corners[:, 1] - corners[:, 0], axis=1))
+        self.cell_size = float(0.5 * mean_edge if cell_size is None else cell_size)
+        self.margin = float(mean_edge if margin is None else margin)
+
+        lo, hi = self.vertices.min(axis=0), self.vertices.max(axis=0)
+        self.lo = lo - self.margin
+        self.shape = tuple(int(n) for n in np.maximum(np.ceil((hi + self.margin - self.lo) / self.cell_size), 1))
+        self._build(workers or os.cpu_count() or 1, chunk_size)
+
+    '''
+    Parameters: function of a chunk and the arguments of every chunk
+    Returns: the results of every chunk in order, from the worker processes if there are any
+    '''
+    def _map(self, func, chunks):
+        if self._pool is not None and chunks:
+            return list(self._pool.map(func, *zip(*chunks)))
+        return [func(*chunk, bvh=self._bvh) for chunk in chunks]
+
+    '''
+    Summary: refines the cells near the surface down to cell_size and packs their candidates
+    '''
+    def _build(self, workers, chunk_size):
+        self._bvh = None
+        self._pool = None
+        if workers > 1:
+            self._pool = ProcessPoolExecutor(workers, mp_context=jit_kernels.process_context(), initializer=_init_worker,
+                                             initargs=(self.vertices, self.triangles))
+        else:
+            self._bvh = TriangleBVH(self.vertices, self.triangles)
+
+        try:
+            # start with cells 2^levels times the final size, at least 8 cells across the longest side
+            levels = max(0, int(np.floor(np.log2(max(self.shape) / 8))))
+            size = self.cell_size * 2 ** levels
+            ijk = np.indices(np.ceil(np.array(self.shape) / 2 ** levels).astype(int)).reshape(3, -1).T
+            children = np.indices((2, 2, 2)).reshape(3, -1).T
+
+            while True:
+                centers = self.lo + (ijk + 0.5) * size
+                half_diagonal = 0.5 * np.sqrt(3.0) * size
+                chunks = [(centers[s:s + chunk_size],) for s in range(0, len(centers), chunk_size)]
+                distances = np.concatenate(self._map(_mesh_distances, chunks) or [np.zeros(0)])
+                near = distances <= self.margin + half_diagonal
+                ijk, centers, distances = ijk[near], centers[near], distances[near]
+                if levels == 0:
+                    break
+                ijk = (2 * ijk[:, None, :] + children).reshape(-1, 3)
+                ijk = ijk[np.all(ijk < self.shape, axis=1)]
+                size *= 0.5
+                levels -= 1
+
+            starts = range(0, len(centers), chunk_size)
+            chunks = [(centers[s:s + chunk_size], distances[s:s + chunk_size], half_diagonal) for s in starts]
+            found = self._map(_cell_candidates, chunks)
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown()
+            self._pool = None
+            self._bvh = None
+
+        cell = np.concatenate([np.zeros(0, dtype=int)] + [s + c for s, (c, _) in zip(starts, found)])
+        tri = np.concatenate([np.zeros(0, dtype=int)] + [t for _, t in found])
+
+        # store the cells sorted by flat index so a lookup is a binary search
+        flat = np.ravel_multi_index(tuple(ijk.T), self.shape)
+        rank = np.empty(len(flat), dtype=np.int64)
+        rank[np.argsort(flat)] = np.arange(len(flat))
+        order = np.lexsort((tri, rank[cell]))
+        self.cells = np.sort(flat)
+        self.candidates = tri[order].astype(np.int32)
+        self.offsets = np.zeros(len(flat) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rank[cell], minlength=len(flat)), out=self.offsets[1:])
+
+    '''
+    Returns: the arrays that describe the grid, to store it and pass it back as grid_arrays
+    '''
+    def arrays(self):
+        return {"lo": self.lo, "cell_size": np.array([self.cell_size]), "margin": np.array([self.margin]),
+                "shape": np.array(self.shape),
+                "cells": self.cells, "offsets": self.offsets, "candidates": self.candidates}
+
+    '''
+    Returns: number of candidates of every stored cell
+    '''
+    def candidate_counts(self):
+        return np.diff(self.offsets)
+
+    '''
+    Parameters: query points (Q x 3)
+    Returns: row of the stored cell every point falls in, -1 for points outside the stored cells
+    '''
+    def cell_of(self, points):
+        ijk = np.floor((points - self.lo) / self.cell_size).astype(np.int64)
+        inside = np.all((ijk >= 0) & (ijk < self.shape), axis=1)
+        rows = np.full(len(points), -1, dtype=np.int64)
+        flat = np.ravel_multi_index(tuple(ijk[inside].T), self.shape)
+        found = np.minimum(np.searchsorted(self.cells, flat), max(len(self.cells) - 1, 0))
+        hit = self.cells[found] == flat if len(self.cells) else np.zeros(len(flat), dtype=bool)
+        rows[np.nonzero(inside)[0][hit]] = found[hit]
+        return rows
+
+    '''
+    Parameters: query points (Q x 3), init_tri is accepted for the TriangleBVH interface and not needed
+    Returns: closest points, distances, triangle indices and barycentric coordinates like closest_points_on_mesh
+    '''
+    def query(self, points, init_tri=None):
+        points = np.atleast_2d(np.asarray(points, dtype=float))
+        chunk_size = self.thread_chunk_size if self.pool is not None else max(len(points), 1)
+        chunks = [points[s:s + chunk_size] for s in range(0, len(points), chunk_size)]
+        found = map_chunks(self.pool, self._query_chunk, chunks) or [self._query_chunk(points)]
+        best_idx, best_v, best_w = (np.concatenate(parts) for parts in zip(*found))
+        return _closest_point_results(points, self._table, best_idx, best_v, best_w)
+
+    '''
+    Parameters: query points of one chunk
+    Returns: triangle index and barycentric v, w of the closest point of every point
+    Summary: tests every (point, candidate) pair of the points inside the stored cells at once and keeps the
+    closest candidate per point, ties going to the lowest triangle index like the brute force scan
+    '''
+    def _query_chunk(self, points):
+        n = len(points)
+        best_idx = np.zeros(n, dtype=int)
+        best_v = np.zeros(n)
+        best_w = np.zeros(n)
+
+        rows = self.cell_of(points)
+        inside = np.nonzero(rows >= 0)[0]
+        if len(inside):
+            # one row of candidate slots per point, padded to the longest candidate list
+            starts = self.offsets[rows[inside]]
+            counts = self.offsets[rows[inside] + 1] - starts
+            slots = np.arange(counts.max())
+            valid = slots < counts[:, None]
+            tri = np.zeros(valid.shape, dtype=int)
+            tri[valid] = self.candidates[(starts[:, None] + slots)[valid]]
+            q = np.broadcast_to(inside[:, None], valid.shape)[valid]
+
+            v = np.zeros(valid.shape)
+            w = np.zeros(valid.shape)
+            sq_dist = np.full(valid.shape, np.inf)
+            v[valid], w[valid], sq_dist[valid] = _closest_points_pairs(points[q] - self._table.origin,
+                                                                       self._table[tri[valid]])
+
+            # the candidates are sorted, so ties go to the first slot and the lowest triangle index
+            slot = np.argmin(sq_dist, axis=1)
+            picked = np.arange(len(inside))
+            best_idx[inside] = tri[picked, slot]
+            best_v[inside] = v[picked, slot]
+            best_w[inside] = w[picked, slot]
+
+        outside = np.nonzero(rows < 0)[0]
+        if len(outside):
+            _, _, idx, bary = self._fallback_bvh().query(points[outside])
+            best_idx[outside] = idx
+            best_v[outside] = bary[:, 1]
+            best_w[outside] = bary[:, 2]
+
+        return best_idx, best_v, best_w
+
+    '''
+    Parameters: query points (Q x 3) and a search radius per query
+    Returns: query index, triangle index and squared distance of every pair within the radius, like triangles_within
+    Summary: a radius can reach past the candidates of a cell, so this goes to the fallback BVH
+    '''
+    def query_radius(self, points, radii):
+        return self._fallback_bvh().query_radius(points, radii)
+
+    '''
+    Returns: the TriangleBVH for the queries the cells cannot answer, built on first use
+    '''
+    def _fallback_bvh(self):
+        if self._fallback is None:
+            self._fallback = TriangleBVH(self.vertices, self.triangles)
+        return self._fallback